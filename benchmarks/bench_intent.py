@@ -0,0 +1,90 @@
+"""
+Compare the bot.learn intent engines on a synthetic corpus
+
+Each intent is a (verb, object) pair taught with a few phrasings and verb synonyms; accuracy is
+measured on held-out phrasings, plus off-topic messages that should classify as nothing.
+
+    python -m benchmarks.bench_intent --intents 200
+"""
+import argparse
+import random
+import statistics
+import time
+
+from betabot import intent
+
+VERBS = {
+    'restart': ['reboot', 'bounce'], 'deploy': ['ship', 'release'], 'show': ['display', 'get'],
+    'delete': ['remove', 'drop'], 'create': ['make', 'add'], 'check': ['inspect', 'verify'],
+    'pause': ['suspend', 'halt'], 'scale': ['resize', 'grow'], 'backup': ['snapshot', 'save'],
+    'rollback': ['revert', 'undo'],
+}
+OBJECTS = ['web server', 'database', 'build queue', 'cache', 'search index', 'payments service', 'cron jobs',
+           'staging cluster', 'load balancer', 'dns records', 'ssl certificates', 'feature flags', 'user table',
+           'message queue', 'log pipeline', 'metrics dashboard', 'billing report', 'api gateway', 'cdn config',
+           'worker pool', 'mobile build', 'release notes', 'on-call schedule', 'error budget', 'test suite']
+TRAIN = ['{verb} the {obj}', 'can you {syn} the {obj}', 'please {verb} {obj}', 'I need you to {syn2} our {obj}']
+TEST = ['could you {syn} the {obj} for me', '{syn2} {obj} now please', 'hey bot {verb} the {obj} asap']
+OFF_TOPIC = ['what a lovely day', 'who wants lunch', 'lol that meeting', 'see you tomorrow', 'good morning all']
+
+
+def make_corpus(n_intents, seed=0):
+    rng = random.Random(seed)
+    pairs = [(verb, obj) for verb in VERBS for obj in OBJECTS]
+    rng.shuffle(pairs)
+
+    train, test = [], []
+    for verb, obj in pairs[:n_intents]:
+        label = f'{verb}_{obj.replace(" ", "_")}'
+        syn, syn2 = VERBS[verb]
+        train.extend((template.format(verb=verb, syn=syn, syn2=syn2, obj=obj), label) for template in TRAIN)
+        test.extend((template.format(verb=verb, syn=syn, syn2=syn2, obj=obj), label) for template in TEST)
+    test.extend((text, None) for text in OFF_TOPIC)
+    return train, test
+
+
+def bench(engine_name, train, test):
+    started = time.perf_counter()
+    engine = intent.load_or_train(engine_name, train, cache_dir=None)
+    train_seconds = time.perf_counter() - started
+    threshold = intent.LEARN_THRESHOLD if intent.LEARN_THRESHOLD is not None else engine.threshold
+
+    latencies, correct = [], 0
+    for text, expected in test:
+        started = time.perf_counter()
+        label, confidence = engine.classify(text)
+        latencies.append(time.perf_counter() - started)
+        correct += (label if confidence >= threshold else None) == expected
+
+    started = time.perf_counter()
+    engine.classify_batch([text for text, _ in test])
+    batch_seconds = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'engine': engine_name,
+        'train_s': train_seconds,
+        'accuracy': correct / len(test),
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'batch_per_msg_ms': batch_seconds / len(test) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--intents', type=int, default=50, help=f'number of intents (max {len(VERBS) * len(OBJECTS)})')
+    parser.add_argument('--engines', nargs='+', default=list(intent.ENGINES), choices=list(intent.ENGINES))
+    args = parser.parse_args()
+
+    train, test = make_corpus(args.intents)
+    print(f'{args.intents} intents, {len(train)} training sentences, {len(test)} test messages')
+    print(f'{"engine":<12} {"train s":>8} {"accuracy":>9} {"p50 ms":>8} {"mean ms":>8} {"batch ms/msg":>13}')
+    for engine_name in args.engines:
+        r = bench(engine_name, train, test)
+        print(f'{r["engine"]:<12} {r["train_s"]:8.2f} {r["accuracy"]:9.1%} {r["p50_ms"]:8.3f} '
+              f'{r["mean_ms"]:8.3f} {r["batch_per_msg_ms"]:13.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Round trips saved by Memory.get_many / save_many / delete_many
+
+Covers dict, durable dict and sqlite (in a temporary directory) and redis: REDIS_URL if set, otherwise a
+fakeredis server on a local TCP port. Compares N single-key calls with one batch call of N keys.
+
+    python -m benchmarks.bench_memory --keys 50 --repeat 20
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_memory
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from betabot import memory
+
+
+def start_fake_server(port):
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    server.daemon_threads = True  # or its connection threads keep the process alive
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'redis://127.0.0.1:{port}/0'
+
+
+async def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+async def bench(mem, n_keys, repeat):
+    keys = [f'bench:{i}' for i in range(n_keys)]
+    values = {key: {'n': i, 'seen': ['C1', 'C2']} for i, key in enumerate(keys)}
+
+    async def save_each():
+        for key, value in values.items():
+            await mem.save(key, value)
+
+    async def get_each():
+        for key in keys:
+            await mem.get(key)
+
+    async def delete_each():
+        for key in keys:
+            await mem.delete(key)
+
+    rows = [
+        ('save', await timed(save_each, repeat), await timed(lambda: mem.save_many(values), repeat)),
+        ('get', await timed(get_each, repeat), await timed(lambda: mem.get_many(keys), repeat)),
+    ]
+    # delete needs the keys back before every run
+    single = batch = 0.0
+    for _ in range(repeat):
+        await mem.save_many(values)
+        single += await timed(delete_each, 1)
+        await mem.save_many(values)
+        batch += await timed(lambda: mem.delete_many(keys), 1)
+    rows.append(('delete', single / repeat, batch / repeat))
+    return rows
+
+
+async def main(args):
+    url = os.getenv('REDIS_URL') or start_fake_server(args.port)
+    os.environ['REDIS_URL'] = url
+
+    directory = tempfile.TemporaryDirectory()
+    backends = [
+        ('dict', memory.MemoryDict()),
+        ('dict+log', memory.MemoryDict(path=os.path.join(directory.name, 'dict'))),
+        ('sqlite', memory.MemorySqlite(path=os.path.join(directory.name, 'bench.db'))),
+        ('redis', memory.MemoryRedis()),
+    ]
+    print(f'{args.keys} keys, median of {args.repeat} runs (redis: {url})')
+    print(f'{"backend":<8} {"op":<7} {"per-key ms":>11} {"batch ms":>9} {"speedup":>8}')
+    for name, mem in backends:
+        await mem.setup()
+        for op, single, batch in await bench(mem, args.keys, args.repeat):
+            print(f'{name:<8} {op:<7} {single:11.3f} {batch:9.3f} {single / batch if batch else 0:7.1f}x')
+        await mem.close()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--port', type=int, default=6391, help='port for the fakeredis server')
+    asyncio.run(main(parser.parse_args()))
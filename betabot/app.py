@@ -23,7 +23,12 @@ parser.add_argument('-S', '--scripts', dest='scripts', metavar='dir',
 parser.add_argument('-e', '--engine', dest='engine', action='store',
                     default='cli', help='What chat engine to use. Slack or cli')
 parser.add_argument('-m', '--memory', dest='memory', action='store',
-                    default='dict', help='What persistent storage to use.')
+                    default='dict', help='What persistent storage to use (dict, redis, sqlite); '
+                         'prefix with cached+ for an in-process read cache and/or buffered+ for write-behind, '
+                         'e.g. cached+buffered+redis.')
+parser.add_argument('--intent', dest='intent', action='store', default=None,
+                    help='Which engine classifies messages for bot.learn (naive_bayes, vector). '
+                         'Defaults to INTENT_ENGINE, or naive_bayes.')
 
 # n.b., if --no-web-app is present, start_web_app is False
 parser.add_argument('--no-web-app', dest='start_web_app', action='store_false',
@@ -42,7 +47,7 @@ async def start_betabot():
 
     full_path_scripts = [os.path.abspath(s) for s in args.scripts]
     LOG.debug('full path scripts: %s' % full_path_scripts)
-    await bot.setup(memory_type=memory, script_paths=full_path_scripts)
+    await bot.setup(memory_type=memory, script_paths=full_path_scripts, intent_engine=args.intent)
     await bot.start()
 
 
@@ -70,10 +75,18 @@ def start_ioloop():
 def _terminate():
     print()
     LOG.info('ctrl-c caught, shutting down')
+    asyncio.ensure_future(_shutdown())
+
+
+async def _shutdown():
+    bot = betabot.bots.bot.Bot.instance
+    if bot:
+        await bot.shutdown()
 
     for task in asyncio.all_tasks():
-        task.cancel()
-    asyncio.ensure_future(exit())
+        if task is not asyncio.current_task():
+            task.cancel()
+    asyncio.get_running_loop().call_soon(exit)
 
 
 if __name__ == '__main__':
@@ -1,3 +1,5 @@
+import asyncio
+import atexit
 import importlib
 from io import StringIO
 import logging
@@ -7,28 +9,35 @@ from pathlib import Path
 import pkgutil
 import re
 import sys
+import time
 import traceback
 from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from dotenv import load_dotenv
 from slack_bolt.async_app import AsyncApp
-from slack_bolt.context.ack.async_ack import AsyncAck
 from slack_bolt.context.async_context import AsyncBoltContext
-from slack_bolt.context.respond.async_respond import AsyncRespond
-from slack_bolt.context.say.async_say import AsyncSay
 from slack_bolt.error import BoltUnhandledRequestError, BoltError
 from slack_bolt.request.async_request import AsyncBoltRequest
+from slack_bolt.request.payload_utils import is_event
 from slack_bolt.response import BoltResponse
 from slack_sdk.web.async_client import AsyncWebClient
-from textblob.classifiers import NaiveBayesClassifier
 from tornado import web
 
+from betabot import dispatch
 from betabot import help
+from betabot import intent
+from betabot import listeners
 from betabot import memory
+from betabot import recording
 from betabot import utility
+from betabot.user import User
 from betabot.classes import Channel
-from betabot.classes.event import Event, EventActions, EventContext, EventData
+from betabot.classes.event import Event, RE_FLAGS
+from betabot.coalesce import SayCoalescer
+from betabot.directory import ChannelDirectory, UserDirectory
+from betabot.executor import EXECUTION_MODES, ExecutionPools, HandlerExecutor, in_worker
+from betabot.startup import StartupGraph, StepTiming
 
 # TODO: allow these logs with a -vv verbose arg
 logging.getLogger('slack_sdk.web.async_slack_response').setLevel(logging.INFO)
@@ -42,6 +51,23 @@ WEB_PORT = int(os.getenv('WEB_PORT', 8000))
 WEB_NO_SSL = os.getenv('WEB_NO_SSL', '') != ''
 WEB_PORT_SSL = int(os.getenv('WEB_PORT_SSL', 8443))
 
+# seconds a conversation waits for a reply before giving up (0 waits forever)
+LISTEN_TIMEOUT = float(os.getenv('LISTEN_TIMEOUT', 300))
+
+# handlers running at once, handlers allowed to wait per channel, and what to do with that channel's next one
+# (drop, reject, wait)
+HANDLER_CONCURRENCY = int(os.getenv('HANDLER_CONCURRENCY', 16))
+HANDLER_QUEUE_SIZE = int(os.getenv('HANDLER_QUEUE_SIZE', 100))
+HANDLER_OVERFLOW = os.getenv('HANDLER_OVERFLOW', 'wait')
+HANDLER_REJECT_MESSAGE = os.getenv('HANDLER_REJECT_MESSAGE', "I'm a little busy right now, try again in a minute.")
+
+# seconds shutdown waits for running handlers to finish before closing memory
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', 10))
+
+# workers for handlers registered with executor='thread' / executor='process' (default: python's choice)
+THREAD_POOL_SIZE = int(os.getenv('THREAD_POOL_SIZE', 0)) or None
+PROCESS_POOL_SIZE = int(os.getenv('PROCESS_POOL_SIZE', 0)) or None
+
 LOG = logging.getLogger(__name__)
 
 scheduler = AsyncIOScheduler()
@@ -102,11 +128,40 @@ class Bot(object):
         # TODO: self._bot_id?
         self._user_id = ''
         self._user = ''
+        self._mention_regex: Optional[re.Pattern] = None
+        self.users = UserDirectory()
+        self.channels = ChannelDirectory()
 
         self.help = help.Help()
 
-        self._learn_map: List[Tuple[List[str], 'function']] = []  # saves all sentences to learn for a function
-        self._classifier: NaiveBayesClassifier = None
+        # every add_command regex lives in one index, served by a single bolt message listener
+        self._command_index = dispatch.CommandIndex()
+
+        # conversations waiting for a reply, keyed by (channel, user, thread_ts)
+        self._listeners = listeners.ListenerRegistry()
+
+        # every command / event handler runs through here, fairly across channels
+        self.executor = HandlerExecutor(
+            concurrency=HANDLER_CONCURRENCY, queue_size=HANDLER_QUEUE_SIZE, overflow=HANDLER_OVERFLOW)
+        self._pools = ExecutionPools(thread_workers=THREAD_POOL_SIZE, process_workers=PROCESS_POOL_SIZE)
+
+        # merges bursts of `say` calls to one channel/thread, when SAY_COALESCE_WINDOW is set
+        self.say_coalescer = SayCoalescer()
+
+        # called with (handler, seconds) after every command / event handler finishes
+        self._handler_observers: List[Callable[[Callable, float], None]] = []
+        self._recorder: Optional[recording.EventRecorder] = None
+
+        self._learn_map: List[Tuple[List[str], Callable, bool]] = []  # sentences to learn for a function, and direct
+        self._learned: Dict[str, Tuple[Callable, bool]] = {}  # classifier label -> (function, direct)
+        self._classifier: Optional[intent.IntentEngine] = None  # set once background training finishes
+        self._intent_engine = intent.INTENT_ENGINE
+        self._training: Optional[asyncio.Future] = None
+        self._dispatching = False
+
+        # how long each setup step took, and when (see _startup_graph)
+        self.startup_timings: Dict[str, StepTiming] = {}
+        self._setup_began: Optional[float] = None
 
         # this is a shortcut around implementing event listening across engines
         # should eventually cut this dependency on slack-bolt
@@ -131,11 +186,27 @@ class Bot(object):
             (r'/health', HealthCheck)
         ])
 
-    async def setup(self, memory_type, script_paths):
-        await self._setup_env(script_paths)
-        await self._setup()  # engine-specific setup
-        await self._setup_memory(memory_type=memory_type)
-        await self._setup_scripts(script_paths)
+    async def setup(self, memory_type, script_paths, intent_engine=None):
+        if intent_engine:
+            self._intent_engine = intent_engine
+        if self._intent_engine not in intent.ENGINES:
+            raise InvalidOptions(f'intent engine `{self._intent_engine}` is not available')
+
+        self._setup_began = time.perf_counter()
+        self.startup_timings = await self._startup_graph(memory_type, script_paths).run()
+
+    def _startup_graph(self, memory_type, script_paths) -> StartupGraph:
+        """The setup steps and what each must wait for; engines add their own."""
+        graph = StartupGraph()
+        graph.add('env', lambda: self._setup_env(script_paths))
+        graph.add('engine', self._setup, after=['env'])  # engine-specific setup
+        graph.add('memory', lambda: self._create_memory(memory_type), after=['env'])
+        graph.add('memory_connect', self._setup_memory, after=['memory'])
+        # scripts register handlers with the engine and may hold on to bot.memory, but don't use it until started
+        graph.add('scripts', lambda: self._setup_scripts(script_paths), after=['engine', 'memory'])
+        graph.add('commands', self._build_commands, after=['scripts'])
+        graph.add('classifier', self._start_training, after=['scripts'])
+        return graph
 
     async def _setup_env(self, script_paths):
         for script_path in script_paths:
@@ -154,22 +225,22 @@ class Bot(object):
     async def _setup(self):
         pass
 
-    async def _setup_memory(self, memory_type='dict'):
+    async def _create_memory(self, memory_type='dict'):
+        try:
+            self.memory = memory.get_memory(memory_type)
+        except ValueError as e:
+            raise InvalidOptions(str(e))
 
-        # TODO: memory module should provide this mapping.
-        memory_map = {
-            'dict': memory.MemoryDict,
-            'redis': memory.MemoryRedis,
-        }
+    async def _setup_memory(self):
+        await self.memory.setup()
 
-        # get associated memory class or default to Dict memory type.
-        memoryclass = memory_map.get(memory_type)
-        if not memoryclass:
-            raise InvalidOptions(
-                'memory type "%s" is not available.' % memory_type)
+    async def _build_commands(self):
+        self._command_index.build()
 
-        self.memory = memoryclass()
-        await self.memory.setup()
+    async def _start_training(self):
+        if self._learn_map:
+            # messages are dispatched to commands while the classifier trains
+            self._training = asyncio.ensure_future(self._train_classifier())
 
     async def _setup_scripts(self, script_paths=None):
         # TODO: add a flag to control these
@@ -218,6 +289,20 @@ class Bot(object):
             logger.debug(f'{payload}')
             await next()  # pass control to the next middleware
 
+        record_dir = utility.get_env_var('RECORD_DIR', '')
+        if record_dir:
+            self._recorder = recording.EventRecorder(
+                record_dir, bot_identity={'user': self._user, 'user_id': self._user_id},
+                max_bytes=int(utility.get_env_var('RECORD_MAX_BYTES', str(recording.RECORD_MAX_BYTES))),
+                max_files=int(utility.get_env_var('RECORD_MAX_FILES', '0')))
+            atexit.register(self._recorder.close)
+
+            @self._bolt_app.use
+            async def record_incoming(body: Dict[str, Any], next: Callable[[], Awaitable[None]]):
+                # before convert_app_mention rewrites the payload in place
+                self._recorder.write(body)
+                await next()
+
         @self._bolt_app.use
         async def convert_app_mention(event: Optional[Dict[str, Any]], next: Callable[[], Awaitable[None]]):
             # to @bot messages
@@ -226,6 +311,26 @@ class Bot(object):
                 event['subtype'] = 'app_mention'
             await next()
 
+        self._compile_mention_regex()
+
+        @self._bolt_app.use
+        async def build_event(request: AsyncBoltRequest, response: BoltResponse, context: AsyncBoltContext,
+                              next: Callable[[], Awaitable[None]]) -> Optional[BoltResponse]:
+            # one Event per request, shared by every listener (see Event.for_listener)
+            if is_event(request.body):
+                if utility.event_is_too_old(request.body.get('event_time', utility.get_timestamp()),
+                                            request.body.get('event_id')):
+                    return BoltResponse(status=200, body='')
+
+                event = Event(bot=self, request=request, response=response)
+
+                # a reply some conversation is waiting on is consumed here, not dispatched to commands
+                if event.type == 'message' and self._listeners.resolve(event):
+                    return BoltResponse(status=200, body='')
+
+                context['betabot_event'] = event
+            await next()
+
         @self._bolt_app.error
         async def on_error(logger: Logger, error: BoltError) -> BoltResponse:
             if isinstance(error, BoltUnhandledRequestError):
@@ -235,7 +340,44 @@ class Bot(object):
                 # other error patterns
                 return BoltResponse(status=500, body='something is wrong')
 
-        LOG.info('bot started! listening to events.')
+        if self._setup_began is not None:
+            LOG.info(f'bot started! listening to events, {time.perf_counter() - self._setup_began:.2f}s after setup began.')
+        else:
+            LOG.info('bot started! listening to events.')
+
+    async def shutdown(self):
+        """Let running handlers finish (up to SHUTDOWN_TIMEOUT), send what they said, then flush and close memory.
+
+        Handlers waiting for a reply (`wait_for_message`) won't get one, so their wait is cancelled.
+        """
+        self._listeners.cancel_all()
+        try:
+            await asyncio.wait_for(self.executor.join(), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            LOG.warning(f'shutting down with {self.executor.stats()["in_flight"]} handlers still running')
+        await self.say_coalescer.flush()
+
+        if self.memory:
+            await self.memory.close()
+        self._pools.shutdown()
+
+    def _compile_mention_regex(self):
+        # compiled once the engine knows who the bot is; used by every Event
+        self._mention_regex = re.compile(f'[\\s@<]*(?:{self._user}|{self._user_id})[>:,\\s]*', RE_FLAGS)
+
+    async def _submit_handler(self, func: Callable, event: Event, max_concurrency=0, mode: Optional[str] = None):
+        await self.executor.submit(
+            lambda: self._run_handler(func, event, mode), key=event.channel, command=func, limit=max_concurrency,
+            on_reject=lambda: event.actions.say(HANDLER_REJECT_MESSAGE))
+
+    async def _run_handler(self, func: Callable, event: Optional[Event], mode: Optional[str] = None):
+        started = time.perf_counter()
+        try:
+            await self._pools.run(func, event, mode)
+        finally:
+            elapsed = time.perf_counter() - started
+            for observer in self._handler_observers:
+                observer(func, elapsed)
 
     def _start_web_app(self):
         """Creates a web server on WEB_PORT and WEB_PORT_SSL"""
@@ -255,104 +397,144 @@ class Bot(object):
                             WEB_PORT_SSL)
 
     def on_start(self, cmd):
-        self._on_start.append(cmd)
+        if not in_worker():
+            self._on_start.append(cmd)
         return cmd
 
-    def on(self, event_type):
-        """This decorator will invoke your function with the raw event."""
+    def on(self, event_type, executor: Optional[str] = None):
+        """This decorator will invoke your function with the raw event.
+
+        `executor` runs the function in a thread or process pool ('thread', 'process') instead of on the loop.
+        """
 
         if event_type == 'app_mention':
             raise ValueError('listening for raw event type `app_mention` is disallowed. Use bot.add_command(..., direct=True) instead.')
+        _check_execution_mode(executor)
 
         def decorator(cmd):
+            if in_worker():
+                return cmd  # a handler worker importing the script: the bot already listens
             self.help.update(cmd, event_type)
 
             @self._bolt_app.event(event_type)
-            async def on_ack(
-                logger: Logger, client: AsyncWebClient, request: AsyncBoltRequest, response: BoltResponse,
-                context: AsyncBoltContext, body: Dict[str, Any], payload: Dict[str, Any],
-                options: Optional[Dict[str, Any]], shortcut: Optional[Dict[str, Any]], action: Optional[Dict[str, Any]],
-                view: Optional[Dict[str, Any]], command: Optional[Dict[str, Any]], event: Optional[Dict[str, Any]],
-                message: Optional[Dict[str, Any]], ack: AsyncAck, say: AsyncSay, respond: AsyncRespond,
-                next: Callable[[], Awaitable[None]]
-            ):
-                '''
-                function signature derived from bolt's AsyncArgs:
-                https://github.com/slackapi/bolt-python/blob/8babac6c69e2ec2f5c7a24d9785438b80b4962c7/slack_bolt/kwargs_injection/async_args.py
-                '''
-                if utility.event_is_too_old(request.body.get('event_time', utility.get_timestamp()), request.body.get('event_id')):
-                    return
-
-                # TODO: create a script interface based on Chat/Message/Event
-                event_actions = EventActions(ack=ack, say=say, respond=respond, next=next)
-                event_context = EventContext(client=client, request=request, response=response, context=context, bot=self)
-                event_data = EventData(body=body, payload=payload, options=options, shortcut=shortcut, action=action,
-                    view=view, command=command, event=event, message=message)
-
-                event = Event(actions=event_actions, context=event_context, data=event_data)
-
-                await cmd(event)
-
-            return on_ack
+            async def on_ack(context: AsyncBoltContext, next: Callable[[], Awaitable[None]]):
+                await self._submit_handler(cmd, context['betabot_event'].for_listener(next), mode=executor)
+
+            return cmd
 
         return decorator
 
-    def add_command(self, regex: Union[re.Pattern, str], direct=False):
-        """This decorator will invoke your function with a message that matches the pattern."""
+    def add_command(self, regex: Union[re.Pattern, str], direct=False, max_concurrency=0,
+                    executor: Optional[str] = None):
+        """This decorator will invoke your function with a message that matches the pattern.
+
+        `max_concurrency` caps how many runs of this command may be in flight at once (0 is unlimited).
+        `executor` runs the function in a thread or process pool ('thread', 'process') instead of on the loop.
+        """
 
         # TODO: check if script uses `regex` library instead of `re` (not supported by bolt at the moment)
         if isinstance(regex, str):
             regex = re.compile(regex)
+        _check_execution_mode(executor)
 
         def decorator(cmd):
+            if in_worker():
+                return cmd
             # register some basic help using the regex
             self.help.update(cmd, regex)
 
-            @self._bolt_app.message(regex)
-            async def command_ack(
-                client: AsyncWebClient, request: AsyncBoltRequest, response: BoltResponse,
-                context: AsyncBoltContext, body: Dict[str, Any], payload: Dict[str, Any],
-                options: Optional[Dict[str, Any]], shortcut: Optional[Dict[str, Any]], action: Optional[Dict[str, Any]],
-                view: Optional[Dict[str, Any]], command: Optional[Dict[str, Any]], event: Optional[Dict[str, Any]],
-                message: Optional[Dict[str, Any]], ack: AsyncAck, say: AsyncSay, respond: AsyncRespond,
-                next: Callable[[], Awaitable[None]]
-            ):
-                '''
-                function signature derived from bolt's AsyncArgs:
-                https://github.com/slackapi/bolt-python/blob/8babac6c69e2ec2f5c7a24d9785438b80b4962c7/slack_bolt/kwargs_injection/async_args.py
-                '''
-                if utility.event_is_too_old(request.body.get('event_time', utility.get_timestamp()), request.body.get('event_id')):
-                    return
-
-                # TODO: create a script interface based on Chat/Message/Event
-                event_actions = EventActions(ack=ack, say=say, respond=respond, next=next)
-                event_context = EventContext(client=client, request=request, response=response, context=context, bot=self)
-                event_data = EventData(body=body, payload=payload, options=options, shortcut=shortcut, action=action,
-                    view=view, command=command, event=event, message=message)
-
-                event = Event(actions=event_actions, context=event_context, data=event_data)
-                found_match = event.match_regex(regex)
-
-                if found_match and (not direct or event.is_direct):
-                    await cmd(event)
-
-            return command_ack
+            self._register_dispatcher()
+            self._command_index.add(regex, cmd, direct=direct, max_concurrency=max_concurrency, executor=executor)
+            return cmd
 
         return decorator
 
+    def _register_dispatcher(self):
+        if not self._dispatching:
+            # registered with the first command (or learned function), so `on` listeners keep their relative order
+            self._bolt_app.message(matchers=[self._match_commands])(self._dispatch_command)
+            self._dispatching = True
+
+    async def _match_commands(self, body: Dict[str, Any], context: AsyncBoltContext) -> bool:
+        """bolt listener matcher: find every command whose regex is found in the raw message text.
+
+        If none is, fall back to the function the classifier is confident the message is asking for.
+        """
+        text = body.get('event', {}).get('text')
+        if not text:
+            return False
+
+        context['betabot_commands'] = self._command_index.matches(text)
+        if context['betabot_commands']:
+            return True
+
+        context['betabot_learned'] = await self._classify(context.get('betabot_event'))
+        return context['betabot_learned'] is not None
+
+    async def _classify(self, event: Optional[Event]) -> Optional[Callable]:
+        if self._classifier is None or event is None or not event.text:
+            return None
+
+        # classifying is CPU work that grows with the corpus; keep it off the loop
+        label, confidence = await asyncio.get_running_loop().run_in_executor(
+            None, self._classifier.classify, event.text)
+        threshold = intent.LEARN_THRESHOLD if intent.LEARN_THRESHOLD is not None else self._classifier.threshold
+        if label is None or confidence < threshold:
+            return None
+
+        func, direct = self._learned[label]
+        if direct and not event.is_direct:
+            return None
+
+        LOG.debug(f'classified `{event.text}` as {func.__name__} ({confidence:.2f})')
+        return func
+
+    async def _dispatch_command(self, context: AsyncBoltContext, next: Callable[[], Awaitable[None]]):
+        event = context['betabot_event'].for_listener(next)
+
+        if context.get('betabot_learned'):
+            await self._submit_handler(context['betabot_learned'], event)
+            return
+
+        # first command (in registration order) that also matches once the mention is stripped
+        for cmd in context['betabot_commands']:
+            if event.match_regex(cmd.regex) and (not cmd.direct or event.is_direct):
+                await self._submit_handler(cmd.func, event, max_concurrency=cmd.max_concurrency, mode=cmd.executor)
+                return
+
     def learn(self, sentences: List[str], direct=False):
         """Learn sentences for a command.
-        :param sentences: list of strings -
-        :param direct:
+
+        Messages that match no command regex are classified against every learned sentence;
+        the function is invoked when the classifier is at least LEARN_THRESHOLD confident.
+        :param sentences: list of strings - examples of what asking for this command looks like
+        :param direct: only invoke for messages addressed to the bot
         :return:
         """
 
         def decorator(cmd):
-            self._learn_map.append((sentences, cmd))
+            if in_worker():
+                return cmd
+            self._learn_map.append((sentences, cmd, direct))
+            self._register_dispatcher()
             return cmd
 
         return decorator
 
+    async def _train_classifier(self):
+        samples = []
+        for sentences, cmd, direct in self._learn_map:
+            label = f'{cmd.__module__}.{cmd.__qualname__}'
+            self._learned[label] = (cmd, direct)
+            samples.extend((sentence, label) for sentence in sentences)
+
+        try:
+            # training (or loading the cached model) happens in a worker; the loop keeps serving events
+            self._classifier = await asyncio.get_running_loop().run_in_executor(
+                None, intent.load_or_train, self._intent_engine, samples, intent.LEARN_CACHE_DIR)
+        except Exception as e:
+            LOG.error(f'could not train the intent classifier: {e}', exc_info=1)
+
     def add_help(self, desc=None, usage=None, tags=None):
         def decorator(cmd):
             self.help.update(cmd, usage=usage, desc=desc, tags=tags)
@@ -360,9 +542,11 @@ class Bot(object):
 
         return decorator
 
-    def on_schedule(self, **schedule_keywords):
+    def on_schedule(self, executor: Optional[str] = None, **schedule_keywords):
         """Invoke bot command on a schedule.
 
+        `executor` runs the function in a thread or process pool ('thread', 'process') instead of on the loop.
+
         Leverages APScheduler for asyncio.
         http://apscheduler.readthedocs.io/en/latest/modules/triggers/cron.html#api
 
@@ -380,21 +564,43 @@ class Bot(object):
         (defaults to scheduler timezone)
         """
 
+        _check_execution_mode(executor)
         if 'second' not in schedule_keywords:
             # default is every second. We don't want that.
             schedule_keywords['second'] = '0'
 
         def decorator(cmd):
+            if in_worker():
+                return cmd  # or every worker would run the job too
             LOG.info('new schedule: cron[%s] => %s()' % (schedule_keywords,
                                                          cmd.__name__))
 
-            scheduler.add_job(cmd, trigger='cron', **schedule_keywords)
+            if executor:
+                scheduler.add_job(self._run_handler, args=[cmd, None, executor], name=cmd.__name__,
+                                  trigger='cron', **schedule_keywords)
+            else:
+                scheduler.add_job(cmd, trigger='cron', **schedule_keywords)
             return cmd
 
         return decorator
 
     # functions that scripts can tell bot to execute.
 
+    async def wait_for_message(self, channel: str, user: str, thread_ts: Optional[str] = None,
+                               regex: Union[re.Pattern, str, None] = None,
+                               timeout: Optional[float] = LISTEN_TIMEOUT) -> Event:
+        """Wait for `user` to post a message matching `regex` in `channel` (and thread, if given).
+
+        `regex` must match at the start of the message, like `re.match`.
+
+        Raises `asyncio.TimeoutError` if nothing arrives within `timeout` seconds.
+        Cancelling the waiting task unregisters the listener.
+        """
+        if isinstance(regex, str):
+            regex = re.compile(regex)
+
+        return await self._listeners.wait(channel, user, thread_ts, regex=regex, timeout=timeout or None)
+
     async def event_to_chat(self, event) -> 'Chat':
         raise CoreException('Chat engine "%s" is missing event_to_chat(...)' % (
             self.__class__.__name__))
@@ -411,13 +617,28 @@ class Bot(object):
         raise CoreException('Chat engine "%s" is missing _update_channels(...)' % (
             self.__class__.__name__))
 
-    def get_channel(self, name) -> 'Channel':
-        raise CoreException('Chat engine "%s" is missing get_channel(...)' % (
-            self.__class__.__name__))
+    def get_user(self, id=None, name=None, email=None) -> Optional[User]:
+        """The workspace member with this id, name or email, or None. Lookups don't call the API."""
+        return self.users.get(id=id, name=name, email=email)
 
-    def find_channels(self, pattern):
-        raise CoreException('Chat engine "%s" is missing find_channels(...)' % (
-            self.__class__.__name__))
+    def get_channel(self, id=None, name=None, **fields) -> Optional[Channel]:
+        """The channel with this id or name (`#` optional) whose other `fields` match, or None.
+
+        Lookups by id or name don't call the API; by other fields alone, every channel is checked.
+        """
+        if id:
+            channel = self.channels.get(id=id)
+            candidates = [channel] if channel else []
+        elif name:
+            candidates = self.channels.named(name)
+        else:
+            candidates = list(self.channels)
+        match = [c for c in candidates if all(getattr(c, k, None) == v for k, v in fields.items())]
+        return match[0] if match else None
+
+    def find_channels(self, pattern=None, prefix='', include_archived=False) -> List[Channel]:
+        """Channels whose name matches the regex `pattern` (case-insensitive) and starts with `prefix`."""
+        return self.channels.find(pattern, prefix=prefix, include_archived=include_archived)
 
 
 class betabotException(Exception):
@@ -436,6 +657,11 @@ class WebApplicationNotAvailable(betabotException):
     """Failed to register web handler because no web app registered."""
 
 
+def _check_execution_mode(mode: Optional[str]):
+    if mode not in EXECUTION_MODES:
+        raise InvalidOptions(f'executor must be one of {EXECUTION_MODES}, not `{mode}`')
+
+
 def handle_exceptions(future, chat):
     """Attach to Futures that are not yielded."""
 
@@ -1,7 +1,9 @@
 from datetime import datetime
 import logging
 from unittest import mock
+import os
 import re
+import stat
 import sys
 from typing import Optional, Union
 
@@ -14,16 +16,23 @@ from slack_sdk.web.async_client import AsyncBaseClient, AsyncWebClient
 from betabot.bots.bot import Bot
 
 from betabot.classes import Channel
+from betabot.directory import ChannelDirectory, UserDirectory
+from betabot.user import User
 
 LOG = logging.getLogger(__name__)
 
 BOT_CHANNEL = 'CLI'
 BOT_USER = 'U123'
 
+# lines read ahead of dispatch; a full inbox pauses the stdin reader instead of dropping input
+INBOX_SIZE = 1000
+# put in the inbox once stdin is closed (or can't be read), so `start` can return
+EOF = None
+
 
 class BotCLI(Bot):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, read_stdin=True, **kwargs):
         super().__init__(*args, **kwargs)
 
         # TODO: User object?
@@ -31,18 +40,21 @@ class BotCLI(Bot):
         self._user_id = BOT_USER
         # TODO: self._channel = Channel(self, {'id': 'CLI'}) ?
         self._channel = BOT_CHANNEL
-        self._stdin = None
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=INBOX_SIZE)  # lines, then EOF
+        self._read_stdin = read_stdin
+        self._stdin_reader: Optional[asyncio.Task] = None  # the loop only keeps weak references to tasks
+        self._interactive = read_stdin and sys.stdin.isatty()
 
-    async def setup(self, memory_type, script_paths):
-        await super().setup(memory_type, script_paths)
+    async def setup(self, memory_type, script_paths, intent_engine=None):
+        await super().setup(memory_type, script_paths, intent_engine=intent_engine)
 
-        self.channels = {
-            self._channel: Channel(self, {'id': self._channel})
-        }
-        self.users = [self._user_id]
+        self.channels = ChannelDirectory([Channel(id=self._channel)])
+        self.users = UserDirectory([User(self._user_id, name=self._user)])
 
-        asyncio.ensure_future(self._connect_stdin())
-        asyncio.ensure_future(self._print_prompt())
+        if self._read_stdin:
+            self._stdin_reader = asyncio.ensure_future(self._connect_stdin())
+        if self._interactive:
+            asyncio.ensure_future(self._print_prompt())
 
     async def _setup(self):
         mock_client = mock.Mock(spec=AsyncWebClient)
@@ -70,18 +82,31 @@ class BotCLI(Bot):
 
     async def _connect_stdin(self):
         loop = asyncio.get_running_loop()
-        reader = asyncio.StreamReader(loop=loop)
-        reader_protocol = asyncio.StreamReaderProtocol(reader)
-
-        await loop.connect_read_pipe(lambda: reader_protocol, sys.stdin)
-
-        while True:
-            line = (await reader.readline()).rstrip().decode('utf-8')
-            self._stdin = line
-            if self._stdin is None or self._stdin == '':
-                self._stdin = None
-            await asyncio.sleep(0.1)
-            asyncio.ensure_future(self._print_prompt())
+        try:
+            if stat.S_ISREG(os.fstat(sys.stdin.fileno()).st_mode):
+                # a redirected file (`betabot < commands.txt`) can't be watched like a pipe or tty
+                readline = lambda: loop.run_in_executor(None, sys.stdin.buffer.readline)  # noqa: E731
+            else:
+                reader = asyncio.StreamReader(loop=loop)
+                reader_protocol = asyncio.StreamReaderProtocol(reader)
+                await loop.connect_read_pipe(lambda: reader_protocol, sys.stdin)
+                readline = reader.readline
+
+            while True:
+                raw = await readline()
+                if not raw:
+                    LOG.debug('stdin closed')
+                    return
+
+                line = raw.rstrip().decode('utf-8')
+                if line:
+                    await self._inbox.put(line)
+                if self._interactive:
+                    asyncio.ensure_future(self._print_prompt())
+        except Exception as e:
+            LOG.error(f'could not read stdin: {e}', exc_info=1)
+        finally:
+            await self._inbox.put(EOF)
 
     async def _print_prompt(self):
         print(f'\033[4m{self._user}\033[0m> ', end='')
@@ -92,12 +117,17 @@ class BotCLI(Bot):
 
         while True:
             event = await self._get_next_event()
+            if event is None:
+                LOG.info('no more input, shutting down')
+                await self.shutdown()
+                return
 
             async def say(text: Union[str, dict], channel: Optional[str] = None, thread_ts: Optional[str] = None,):
                 add_whitespace = '\n' if '\n' in text else ' '
                 print(f'\033[93m! {self._user}:{add_whitespace}\033[92m{text}\033[0m')
                 sys.stdout.flush()
-                await asyncio.sleep(0.01)  # avoid BlockingIOError due to sync print above
+                if self._interactive:
+                    await asyncio.sleep(0.01)  # avoid BlockingIOError due to sync print above (stdout shares the tty)
 
                 # TODO: AsyncSlackResponse
                 return {
@@ -118,12 +148,11 @@ class BotCLI(Bot):
             )
             await self._bolt_app.async_dispatch(req)
 
-    async def _get_next_event(self):
-        while not self._stdin:
-            await asyncio.sleep(0.001)  # sleep(0) here eats all cpu
-
-        user_input = self._stdin
-        self._stdin = None
+    async def _get_next_event(self) -> Optional[dict]:
+        """The next line of input as a message event, or None once there is no more."""
+        user_input = await self._inbox.get()
+        if user_input is EOF:
+            return None
 
         ts = str(datetime.now().timestamp())
         # https://api.slack.com/events/message
@@ -141,39 +170,3 @@ class BotCLI(Bot):
         sys.stdout.flush()
         await asyncio.sleep(0.01)  # avoid BlockingIOError due to sync print above.
         return await self.event_to_chat({'text': text})
-
-    def get_channel(self, name):
-        # https://api.slack.com/types/channel
-        sample_info = {
-            "id": "C024BE91L",
-            "name": "fun",
-            "is_channel": True,
-            "created": 1360782804,
-            "creator": "U024BE7LH",
-            "is_archived": False,
-            "is_general": False,
-
-            "members": [
-                "U024BE7LH",
-            ],
-
-            "topic": {
-                "value": "Fun times",
-                "creator": "U024BE7LV",
-                "last_set": 1369677212
-            },
-            "purpose": {
-                "value": "This channel is for fun",
-                "creator": "U024BE7LH",
-                "last_set": 1360782804
-            },
-
-            "is_member": True,
-
-            "last_read": "1401383885.000061",
-            "unread_count": 0,
-            "unread_count_display": 0}
-        return Channel(bot=self, info=sample_info)
-
-    def find_channels(self, pattern):
-        return []
@@ -1,34 +1,65 @@
 import logging
+import os
+from pathlib import Path
 import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import asyncio
 import dacite
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
 from slack_bolt.async_app import AsyncApp
+from slack_bolt.context.async_context import AsyncBoltContext
 from slack_sdk.errors import SlackApiError
 from slack_sdk.web.async_client import AsyncWebClient
 
-from betabot.bots.bot import Bot, InvalidOptions, dict_subset
+from betabot.bots.bot import Bot, InvalidOptions
 from betabot.chat import Chat
 from betabot.classes import Channel
+from betabot import directory
+from betabot.directory import ChannelDirectory, UserDirectory
+from betabot.outbound import OutboundScheduler, ScheduledWebClient
+from betabot.startup import StartupGraph
 from betabot import utility
+from betabot.webcache import EVENT_INVALIDATES, CachedWebClient, WebCache
 
 # TODO: allow these logs with a -vv verbose arg
 logging.getLogger('slack_bolt.AsyncApp').setLevel(logging.INFO)
 
 LOG = logging.getLogger(__name__)
 
+# where the user / channel directory is saved between runs, so startup needn't wait to list the
+# whole workspace; set DIRECTORY_CACHE_DIR= to always list it before starting
+DIRECTORY_CACHE_DIR = os.getenv('DIRECTORY_CACHE_DIR', str(Path.home() / '.cache' / 'betabot'))
+
+
+class SlackWebClient(CachedWebClient, ScheduledWebClient):
+    """Answers repeated reads from `cache`; whatever does go out to Slack waits its turn with `scheduler`."""
+
 
 class BotSlack(Bot):
     engine = 'slack'
-    _too_fast_warning = False
 
     def __init__(self, start_web_app=False) -> None:
         super().__init__(start_web_app)
 
-    async def setup(self, memory_type, script_paths):
-        await super().setup(memory_type, script_paths)
+        # every Web API call goes through here, within Slack's rate limits
+        self.outbound = OutboundScheduler()
+        # answers to repeated reads (conversations.info, users.info, ...), see betabot.webcache
+        self.web_cache = WebCache()
+
+        self._directory_path: Optional[Path] = None
+        self._directory_refresh: Optional[asyncio.Task] = None
+        self._directory_events: Optional[List[Dict[str, Any]]] = None  # seen during a refresh, to re-apply after it
+        self._directory_changed = False  # since the snapshot was saved
 
+    def _startup_graph(self, memory_type, script_paths) -> StartupGraph:
+        graph = super()._startup_graph(memory_type, script_paths)
+        graph.add('auth', self._authenticate, after=['engine'])
+        graph.add('directory', self._setup_directory, after=['auth'])
+        return graph
+
+    async def _authenticate(self):
         app_token = utility.get_app_token()
         if not app_token:
             raise InvalidOptions('SLACK_APP_TOKEN required for slack engine.')
@@ -41,60 +72,126 @@ class BotSlack(Bot):
         self._bot_id = identity.data.get('bot_id')
         self._user_id = identity.data.get('user_id')
         self._user = identity.data.get('user')
+        if DIRECTORY_CACHE_DIR:
+            self._directory_path = Path(DIRECTORY_CACHE_DIR) / f'directory-{identity.data.get("team_id")}.pickle'
 
-        await self._update_channels()
-        await self._update_users()
-
-        self._too_fast_warning = False
+    async def _setup_directory(self):
+        if await self._load_directory():
+            self._directory_refresh = asyncio.ensure_future(self._refresh_directory())
+        else:
+            await self._refresh_directory()
 
     async def start(self):
+        @self._bolt_app.use
+        async def schedule_client(context: AsyncBoltContext, next: Callable[[], Awaitable[None]]):
+            # bolt gives every request its own client; ours sends `say` (and everything else) through the scheduler
+            context['client'] = self.client
+            await next()
+
         await super().start()
 
+        @self._bolt_app.use
+        async def update_directory(event: Optional[Dict[str, Any]], next: Callable[[], Awaitable[None]]):
+            # a middleware, so scripts can still listen for these events themselves
+            if event and directory.apply_event(self.users, self.channels, event):
+                self._directory_changed = True
+                if self._directory_events is not None:
+                    self._directory_events.append(event)
+            if event:
+                self.web_cache.invalidate(*EVENT_INVALIDATES.get(event.get('type'), ()))
+            await next()
+
         self._handler = AsyncSocketModeHandler(self._bolt_app, utility.get_app_token())
         return await self._handler.start_async()
 
     async def _setup(self):
         self._bolt_app: AsyncApp = AsyncApp(
-            token=utility.get_bot_token(),
+            client=SlackWebClient(token=utility.get_bot_token(), scheduler=self.outbound, cache=self.web_cache),
             raise_error_for_unhandled_request=True
         )
         self.client: AsyncWebClient = self._bolt_app.client
 
-    def _get_user(self, uid) -> 'User':
-        match = [u for u in self.users if u['id'] == uid]
-        if match:
-            return User(match[0])
+    async def shutdown(self):
+        if self._directory_refresh:
+            self._directory_refresh.cancel()
+            await asyncio.gather(self._directory_refresh, return_exceptions=True)
+        if self._directory_changed:
+            await self._save_directory()
+        await super().shutdown()
+        await self.outbound.close()
+
+    async def _load_directory(self) -> bool:
+        loaded = None
+        if self._directory_path:
+            loaded = await asyncio.get_event_loop().run_in_executor(None, directory.load_snapshot, self._directory_path)
+        if not loaded:
+            return False
+        self.users, self.channels, saved = loaded
+        LOG.info(f'bot loaded {len(self.users)} users and {len(self.channels)} channels from '
+                 f'{self._directory_path} ({(time.time() - saved) / 60:.0f} minutes old), refreshing in the background')
+        return True
+
+    async def _save_directory(self):
+        if not self._directory_path:
+            return
+        try:
+            await asyncio.get_event_loop().run_in_executor(
+                None, directory.save_snapshot, self._directory_path, self.users, self.channels)
+            self._directory_changed = False
+        except Exception as e:
+            LOG.warning(f'could not save the directory to {self._directory_path}: {e}')
+
+    async def _refresh_directory(self):
+        """List every channel and user, keeping any changes events make meanwhile, and save the snapshot."""
+        self._directory_events = []
+        try:
+            await self._update_channels()
+            await self._update_users()
+            for event in self._directory_events:
+                directory.apply_event(self.users, self.channels, event)
+        finally:
+            self._directory_events = None
+        await self._save_directory()
 
     async def _update_users(self):
         # TODO: need `users:read`
+        users = UserDirectory()
         try:
-            self.users = []
             next_cursor = True
             while next_cursor:
                 if next_cursor is True:
                     next_cursor = ''
 
                 response = (await self._bolt_app.client.users_list(limit=1000, cursor=next_cursor)).data
-                self.users.extend(response.get('members'))
+                users.update(response.get('members'))
                 next_cursor = response.get('response_metadata', {}).get('next_cursor')
         except SlackApiError as e:
             LOG.warning(f'users_list: {e}')
+            if len(self.users):
+                return  # keep what we have (e.g. from the snapshot) over a partial list
+
+        self.users = users  # swapped in whole, so lookups never see a partial directory
 
         LOG.info(f'bot loaded {len(self.users)} users')
 
     async def _update_channels(self):
+        channels = ChannelDirectory()
         try:
-            self.channels = {}
             next_cursor = True
             while next_cursor:
                 if next_cursor is True:
                     next_cursor = ''
 
                 response = (await self._bolt_app.client.conversations_list(limit=1000, cursor=next_cursor)).data
-                self.channels = {**self.channels, **{c['id']: dacite.from_dict(Channel, c) for c in response.get('channels')}}
+                for c in response.get('channels'):
+                    channels.add(dacite.from_dict(Channel, c))
                 next_cursor = response.get('response_metadata', {}).get('next_cursor')
         except SlackApiError as e:
             LOG.warning(f'conversations_list: {e}')
+            if len(self.channels):
+                return
+
+        self.channels = channels
 
         # n.b., this also includes archived channels
         LOG.info(f"bot loaded {len(self.channels)} channels")
@@ -117,9 +214,6 @@ class BotSlack(Bot):
         id = random.randint(1000, 10000)
         payload = {"id": id, "type": "message", "channel": to, "text": text}
         payload.update(extra)
-        if self._too_fast_warning:
-            await asyncio.sleep(2)
-            self._too_fast_warning = False
         # TODO: await self.connection.write_message(json.dumps(payload))
 
         confirmation_event = await self.wait_for_event(reply_to=id)
@@ -129,19 +223,11 @@ class BotSlack(Bot):
         })
         return await self.event_to_chat(confirmation_event)
 
-    def get_channel(self, **kwargs) -> Channel:
-        match = [c for c in self.channels if dict_subset(c, kwargs)]
-        if len(match) == 1:
-            channel = Channel(bot=self, info=match[0])
-            return channel
-
-        # Super Hack!
-        if kwargs.get('id') and kwargs['id'][0] == 'D':
-            # direct message
-            channel = Channel(bot=self, info=kwargs)
-            return channel
-
-        LOG.warning('Channel match for %s length %s' % (kwargs, len(match)))
-
-        channel = Channel(bot=self, info=kwargs)
+    def get_channel(self, id=None, name=None, **fields) -> Optional[Channel]:
+        channel = super().get_channel(id=id, name=name, **fields)
+        if channel is None and id:
+            # DMs aren't listed, and a message can arrive before its channel is known
+            if not id.startswith('D'):
+                LOG.warning(f'unknown channel {id}')
+            channel = Channel(id=id, is_im=id.startswith('D'))
         return channel
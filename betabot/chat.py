@@ -1,9 +1,8 @@
 import logging
 import re
+from typing import Optional
 
-import asyncio
-
-from betabot.bots.bot import Bot
+from betabot.bots.bot import Bot, LISTEN_TIMEOUT
 from betabot.classes import Channel
 
 LOG = logging.getLogger(__name__)
@@ -24,9 +23,6 @@ class Chat(object):
 
         self.is_direct = False
 
-        self.listening = None
-        self.heard_message = None
-
         self.regex_groups = None
         self.regex_group_dict = {}
 
@@ -72,28 +68,11 @@ class Chat(object):
     async def button_prompt(self, text, buttons):
         return await self.channel.button_prompt(text, buttons)
 
-    # TODO: Add a timeout here. Don't want to hang forever.
-    async def listen_for(self, regex: str):
-        self.listening = regex
-
-        # Hang until self.hear() sets this to False
-        self.bot.add_listener(self)
-        while self.listening:
-            await asyncio.sleep(0.01)
-        self.bot._remove_listener(self)
-
-        return self.heard_message
+    async def listen_for(self, regex: str, timeout: Optional[float] = LISTEN_TIMEOUT):
+        """Wait for the next message from this user, in this channel and thread, matching `regex`.
 
-    async def hear(self, new_message):
-        """Invoked by the Bot class to note that `message` was heard."""
-
-        # TODO: some flag should control this filter
-        if new_message.user != self.user:
-            LOG.debug('Heard this from a wrong user.')
-            return
-
-        match = re.match(self.listening, new_message.text)
-        if match:
-            self.listening = None
-            self.heard_message = new_message
-            return
+        Raises `asyncio.TimeoutError` if nothing arrives within `timeout` seconds.
+        """
+        return await self.bot.wait_for_message(
+            channel=self.raw.get('channel'), user=self.user, thread_ts=self.raw.get('thread_ts'),
+            regex=regex, timeout=timeout)
@@ -1,10 +1,11 @@
 from betabot.classes.channel import Channel
-from betabot.classes.event import Event, EventActions, EventContext, EventData
+from betabot.classes.event import Event, EventActions, EventContext, EventData, EventSnapshot
 
 __all__ = [
     'Channel',
     'Event',
     'EventActions',
     'EventContext',
-    'EventData'
+    'EventData',
+    'EventSnapshot',
 ]
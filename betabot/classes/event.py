@@ -1,13 +1,16 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import logging
 import re
-from typing import Any, Awaitable, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from slack_bolt.context.ack.async_ack import AsyncAck
 from slack_bolt.context.async_context import AsyncBoltContext
 from slack_bolt.context.respond.async_respond import AsyncRespond
 from slack_bolt.context.say.async_say import AsyncSay
 from slack_bolt.request.async_request import AsyncBoltRequest
+from slack_bolt.request.payload_utils import (
+    to_action, to_command, to_event, to_message, to_options, to_shortcut, to_view
+)
 from slack_bolt.response import BoltResponse
 
 from slack_sdk.web.async_client import AsyncWebClient
@@ -46,25 +49,84 @@ class EventData(object):
     message: Optional[Dict[str, Any]]
 
 
+class _Deferred(object):
+    """Result of a recorded call. Awaiting it is optional, so sync handlers don't leak coroutines."""
+
+    def __await__(self):
+        return {'ok': True, 'deferred': True}
+        yield
+
+
+class RecordedActions(object):
+    """Stand-in for EventActions in another process: `say`/`respond` calls are recorded
+    and replayed by the bot, in order, once the handler returns.
+
+    Works whether the handler awaits the call or not.
+    """
+
+    def __init__(self):
+        self.calls: List[Tuple[str, tuple, dict]] = []
+
+    def _record(self, name: str, args: tuple, kwargs: dict) -> '_Deferred':
+        self.calls.append((name, args, kwargs))
+        return _Deferred()
+
+    def say(self, *args, **kwargs):
+        return self._record('say', args, kwargs)
+
+    def respond(self, *args, **kwargs):
+        return self._record('respond', args, kwargs)
+
+
+@dataclass
+class EventSnapshot(object):
+    """Picklable projection of an Event, for handlers that run in a process pool."""
+    type: Optional[str]
+    channel: Optional[str]
+    user: Optional[str]
+    text: Optional[str]
+    ts: Optional[str]
+    thread_ts: Optional[str]
+    is_direct: bool
+    regex_groups: Optional[tuple]
+    regex_group_dict: Dict[str, Any]
+    body: Dict[str, Any]
+    actions: RecordedActions = field(default_factory=RecordedActions)
+
+
 class Event(object):
     """Wrapper for Event and helpful functions.
 
     This gets passed to the receiving script's function.
-    """
-
-    def __init__(self, *, actions: EventActions, context: EventContext, data: EventData, **kwargs):
-        self.actions = actions
-        self.context = context
-        self.data = data
-        self.kwargs = kwargs
 
-        self.type = data.event.get('type')
-        self.channel = data.event.get('channel')  # TODO: use the Channel object?
-        self.user = data.event.get('user')  # TODO: use the User object?
-        self.text = data.event.get('text')
-        self.ts = data.event.get('ts')
+    One Event is built per incoming request (see `Bot.start`) and shared by every listener;
+    each listener receives a `for_listener()` copy that carries its own match state.
+    `data` and `context` are only assembled if a script asks for them.
+    """
 
-        self.bot = self.context.bot
+    __slots__ = (
+        'bot', 'type', 'channel', 'user', 'text', 'ts', 'thread_ts', 'is_direct', 'regex_groups', 'regex_group_dict',
+        '_request', '_response', '_next', '_actions', '_context', '_data',
+    )
+
+    def __init__(self, *, bot: Any, request: AsyncBoltRequest, response: Optional[BoltResponse] = None,
+                 next: Optional[Callable[[], Awaitable[None]]] = None):
+        self._request = request
+        self._response = response
+        self._next = next
+        self._actions: Optional[EventActions] = None
+        self._context: Optional[EventContext] = None
+        self._data: Optional[EventData] = None
+
+        event = request.body.get('event') or {}
+        self.type = event.get('type')
+        self.channel = event.get('channel')  # TODO: use the Channel object?
+        self.user = event.get('user')  # TODO: use the User object?
+        self.text = event.get('text')
+        self.ts = event.get('ts')
+        self.thread_ts = event.get('thread_ts')
+
+        self.bot = bot
 
         self.is_direct = False
         self._set_direct()
@@ -72,6 +134,62 @@ class Event(object):
         self.regex_groups = None
         self.regex_group_dict = {}
 
+    @property
+    def actions(self) -> EventActions:
+        if self._actions is None:
+            context = self._request.context
+            say = self.bot.say_coalescer.wrap(context.say) if self.bot.say_coalescer and context.say else context.say
+            self._actions = EventActions(ack=context.ack, say=say, respond=context.respond, next=self._next)
+        return self._actions
+
+    @property
+    def context(self) -> EventContext:
+        if self._context is None:
+            self._context = EventContext(client=self._request.context.client, request=self._request,
+                                         response=self._response, context=self._request.context, bot=self.bot)
+        return self._context
+
+    @property
+    def data(self) -> EventData:
+        if self._data is None:
+            body = self._request.body
+            options, shortcut, action, view = to_options(body), to_shortcut(body), to_action(body), to_view(body)
+            command, event, message = to_command(body), to_event(body), to_message(body)
+            self._data = EventData(
+                body=body, options=options, shortcut=shortcut, action=action, view=view, command=command,
+                event=event, message=message,
+                # same precedence as bolt's `payload` argument
+                payload=options or shortcut or action or view or command or event or message or body)
+        return self._data
+
+    def for_listener(self, next: Optional[Callable[[], Awaitable[None]]] = None) -> 'Event':
+        """Copy of this event with fresh match state, sharing everything already computed."""
+        event = self._copy()
+        event._next = next
+        event._actions = None
+        event.regex_groups = None
+        event.regex_group_dict = {}
+        return event
+
+    def with_actions(self, actions: EventActions) -> 'Event':
+        """Copy of this event (match state included) whose scripts talk back through `actions`."""
+        event = self._copy()
+        event._actions = actions
+        event._next = actions.next
+        return event
+
+    def _copy(self) -> 'Event':
+        event = Event.__new__(Event)
+        for name in Event.__slots__:
+            setattr(event, name, getattr(self, name))
+        return event
+
+    def snapshot(self) -> EventSnapshot:
+        return EventSnapshot(
+            type=self.type, channel=self.channel, user=self.user, text=self.text, ts=self.ts,
+            thread_ts=self.thread_ts, is_direct=self.is_direct, regex_groups=self.regex_groups,
+            regex_group_dict=self.regex_group_dict, body=self._request.body)
+
     def _set_direct(self):
         """Check if this message is a direct mention or private message to bot.
         """
@@ -87,19 +205,17 @@ class Event(object):
             self.is_direct = True
 
         # all app mentions
-        if self.data.event.get('type') == 'app_mention':
+        if self.type == 'app_mention':
             self.is_direct = True
 
         # app mentions
-        regex_name = f'[\\s@<]*(?:{self.bot._user}|{self.bot._user_id})[>:,\\s]*'
-
-        contains_mention = re.search(regex_name, self.text, RE_FLAGS)
-        if contains_mention:
-            self.text = re.sub(regex_name, '', self.text, flags=RE_FLAGS)
+        self.text, mentions = self.bot._mention_regex.subn('', self.text)
+        if mentions:
             self.is_direct = True
 
-    def match_regex(self, regex: re.Pattern) -> bool:
-        match = regex.search(self.text)
+    def match_regex(self, regex: re.Pattern, anchored=False) -> bool:
+        """Search the text for `regex` (or match it at the start, if `anchored`), keeping its groups."""
+        match = (regex.match if anchored else regex.search)(self.text)
         if match:
             self.regex_groups = match.groups()
             self.regex_group_dict = match.groupdict()
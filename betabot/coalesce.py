@@ -0,0 +1,166 @@
+"""
+Coalescing of bursty `say` calls
+
+With SAY_COALESCE_WINDOW set, `say` calls to the same channel/thread made within that many seconds of the
+first one go out as a single message: texts are joined by newlines, or, if any call carried blocks, texts
+become section blocks next to them. A message stops growing at Slack's size limits. Calls with anything
+else (attachments, a username, unfurl options...) are sent on their own, after whatever was buffered for
+their channel/thread before them, so messages keep their order.
+
+A coalesced `say` returns once the call is buffered, like a recorded one in a process handler:
+`{'ok': True, 'deferred': True}` instead of Slack's response. Failures are logged.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# seconds `say` calls to one channel/thread are held to be sent together (0 sends each right away)
+SAY_COALESCE_WINDOW = float(os.getenv('SAY_COALESCE_WINDOW', 0))
+
+# Slack truncates longer texts (https://api.slack.com/methods/chat.postMessage#truncating)
+MAX_TEXT_LENGTH = 4000
+MAX_BLOCKS = 50
+MAX_SECTION_TEXT_LENGTH = 3000
+
+_Key = Tuple[Optional[str], Optional[str]]  # (channel, thread_ts)
+
+
+class _Part(NamedTuple):
+    text: str
+    blocks: Optional[list]
+
+    @classmethod
+    def of(cls, message: Dict[str, Any]) -> Optional['_Part']:
+        """The part of a merged message `message` would be, or None if it has to be sent on its own."""
+        text, blocks = message.get('text', ''), message.get('blocks')
+        if set(message) - {'text', 'blocks'} or not isinstance(text, str) or not (text or blocks):
+            return None
+        return cls(text, list(blocks) if blocks else None)
+
+
+def _section(text: str) -> Dict[str, Any]:
+    return {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}
+
+
+class _Batch(object):
+    __slots__ = ('say', 'parts', 'timer')
+
+    def __init__(self, say: Callable[..., Awaitable], timer: asyncio.TimerHandle):
+        self.say = say
+        self.parts: List[_Part] = []
+        self.timer = timer
+
+
+class SayCoalescer(object):
+    """Merges `say` calls to the same channel/thread made within `window` seconds of each other."""
+
+    def __init__(self, window=SAY_COALESCE_WINDOW, max_text_length=MAX_TEXT_LENGTH, max_blocks=MAX_BLOCKS):
+        self.window = window
+        self.max_text_length = max_text_length
+        self.max_blocks = max_blocks
+
+        self._batches: Dict[_Key, _Batch] = {}
+        self._tails: Dict[_Key, asyncio.Task] = {}  # last send per channel/thread; the next one waits for it
+        self._sends: Set[asyncio.Task] = set()
+
+        self.counters = {'calls': 0, 'messages': 0, 'failed': 0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'buffered': sum(len(batch.parts) for batch in self._batches.values()),
+            'sending': len(self._sends),
+        }
+
+    def wrap(self, say: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        """`say`, coalesced; or `say` itself when coalescing is off."""
+        if self.window <= 0:
+            return say
+
+        async def coalesced_say(text='', blocks=None, channel=None, thread_ts=None, **kwargs):
+            return self._say(say, text, blocks, channel, thread_ts, kwargs)
+
+        return coalesced_say
+
+    def _say(self, say, text, blocks, channel, thread_ts, kwargs) -> Dict[str, Any]:
+        self.counters['calls'] += 1
+        message = dict(text) if isinstance(text, dict) else {'text': text, 'blocks': blocks, **kwargs}
+        message = {name: value for name, value in message.items() if value is not None}
+        channel = message.pop('channel', None) or channel or getattr(say, 'channel', None)
+        thread_ts = message.pop('thread_ts', None) or thread_ts or getattr(say, 'thread_ts', None)
+        key = (channel, thread_ts)
+
+        part = _Part.of(message)
+        batch = self._batches.get(key)
+        if batch and (part is None or not self._fits(batch.parts + [part])):
+            self._flush(key)
+            batch = None
+
+        if part is None or not self._fits([part]):
+            self._send(key, say, message, calls=1)
+        else:
+            if batch is None:
+                timer = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+                batch = self._batches[key] = _Batch(say, timer)
+            batch.parts.append(part)
+        return {'ok': True, 'deferred': True}
+
+    def _fits(self, parts: List[_Part]) -> bool:
+        """Whether `parts` make a message within Slack's limits."""
+        if len('\n'.join(part.text for part in parts if part.text)) > self.max_text_length:
+            return False
+        if not any(part.blocks for part in parts):
+            return True
+        return (sum(len(part.blocks) if part.blocks else 1 for part in parts) <= self.max_blocks
+                and all(len(part.text) <= MAX_SECTION_TEXT_LENGTH for part in parts if not part.blocks))
+
+    @staticmethod
+    def _merge(parts: List[_Part]) -> Dict[str, Any]:
+        message: Dict[str, Any] = {'text': '\n'.join(part.text for part in parts if part.text)}
+        if any(part.blocks for part in parts):
+            message['blocks'] = [block for part in parts for block in (part.blocks or [_section(part.text)])]
+        return message
+
+    def _flush(self, key: _Key):
+        batch = self._batches.pop(key)
+        batch.timer.cancel()
+        self._send(key, batch.say, self._merge(batch.parts), calls=len(batch.parts))
+
+    def _send(self, key: _Key, say: Callable[..., Awaitable], message: Dict[str, Any], calls: int):
+        channel, thread_ts = key
+        if channel:
+            message['channel'] = channel
+        if thread_ts:
+            message['thread_ts'] = thread_ts
+        text = message.pop('text', '')
+        self.counters['messages'] += 1
+
+        task = asyncio.ensure_future(self._post(self._tails.get(key), say, text, message, calls))
+        self._tails[key] = task
+        self._sends.add(task)
+
+        def done(task):
+            self._sends.discard(task)
+            if self._tails.get(key) is task:
+                del self._tails[key]
+
+        task.add_done_callback(done)
+
+    async def _post(self, previous: Optional[asyncio.Task], say, text, kwargs, calls: int):
+        if previous:
+            await asyncio.wait([previous])
+        try:
+            await say(text, **kwargs)
+        except Exception:
+            self.counters['failed'] += 1
+            LOG.exception(f'failed to send a message coalesced from {calls} say call(s) to {kwargs.get("channel")}')
+
+    async def flush(self):
+        """Send everything buffered, and wait for it (and anything already sending) to go out."""
+        for key in list(self._batches):
+            self._flush(key)
+        if self._sends:
+            await asyncio.wait(list(self._sends))
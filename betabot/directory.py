@@ -0,0 +1,291 @@
+"""
+In-memory indexes of a workspace's users and channels, for lookups without scanning them all
+
+Both can be saved to a snapshot file, so a restart can serve lookups before re-listing the
+workspace, and are kept current between listings by applying Slack's change events.
+"""
+import bisect
+import dataclasses
+import logging
+import os
+from pathlib import Path
+import pickle
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Set, Tuple, Union
+
+from betabot.classes import Channel
+from betabot.user import User
+
+log = logging.getLogger(__name__)
+
+
+class UserDirectory(object):
+    """Users indexed by id, name and email.
+
+    Names and emails match case-insensitively, and a name matches a user's `name` or, failing
+    that, a user with that display name. Display names aren't unique, so each indexes every user
+    who has it, and the lookup picks the one with the lowest id. `add` replaces a user with the
+    same id, re-indexing any changed name or email.
+    """
+
+    def __init__(self, users: Iterable[User] = ()):
+        self._by_id: Dict[str, User] = {}
+        self._by_name: Dict[str, User] = {}
+        self._by_display_name: Dict[str, Set[str]] = {}  # display name -> ids
+        self._by_email: Dict[str, User] = {}
+        for user in users:
+            self.add(user)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[User]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, id):
+        return id in self._by_id
+
+    def _indexes(self, user: User):
+        yield self._by_name, user.name.lower()
+        yield self._by_email, user.email.lower()
+
+    def add(self, user: User):
+        self.remove(user.id)
+        self._by_id[user.id] = user
+        if user.name:
+            self._by_name[user.name.lower()] = user
+        if user.display_name:
+            self._by_display_name.setdefault(user.display_name.lower(), set()).add(user.id)
+        if user.email:
+            self._by_email[user.email.lower()] = user
+
+    def update(self, payloads: Iterable[dict]) -> int:
+        """Add (or replace) users from Slack user objects. Returns how many."""
+        count = 0
+        for payload in payloads:
+            self.add(User.from_payload(payload))
+            count += 1
+        return count
+
+    def remove(self, id) -> Optional[User]:
+        user = self._by_id.pop(id, None)
+        if user:
+            for index, key in self._indexes(user):
+                if index.get(key) is user:
+                    del index[key]
+            ids = self._by_display_name.get(user.display_name.lower())
+            if ids and id in ids:
+                ids.discard(id)
+                if not ids:
+                    del self._by_display_name[user.display_name.lower()]
+        return user
+
+    def get(self, id=None, name=None, email=None) -> Optional[User]:
+        """The user with this id, name (`@` optional) or email, or None."""
+        if id:
+            return self._by_id.get(id)
+        if name:
+            name = name.lstrip('@').lower()
+            if name in self._by_name:
+                return self._by_name[name]
+            ids = self._by_display_name.get(name)
+            return self._by_id[min(ids)] if ids else None
+        if email:
+            return self._by_email.get(email.lower())
+        return None
+
+
+_REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+
+
+def _alternates(pattern: str) -> bool:
+    """Whether `pattern` has a `|` outside of any group or character class."""
+    depth, in_class, escaped = 0, False, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char in '()':
+            depth += 1 if char == '(' else -1
+        elif char == '|' and not depth:
+            return True
+    return False
+
+
+def literal_prefix(pattern: str) -> str:
+    """The literal text every match of an `^`-anchored regex starts with ('' if unanchored)."""
+    if not pattern.startswith('^') or _alternates(pattern):
+        return ''
+    prefix = []
+    for char in pattern[1:]:
+        if char in _REGEX_SPECIAL:
+            if char in '*?{' and prefix:
+                prefix.pop()  # the last char is optional / repeated
+            break
+        prefix.append(char)
+    return ''.join(prefix)
+
+
+class ChannelDirectory(object):
+    """Channels indexed by id and name, with names kept sorted for prefix search.
+
+    Names match case-insensitively, with or without a leading `#`. Names aren't unique (an archived
+    channel and its replacement, or several workspaces), so a name can index several channels; `get`
+    prefers an unarchived one, then the newest. Channels are frozen dataclasses, so changes replace
+    them: `add` a new version, or `rename` / `archive` one.
+    """
+
+    def __init__(self, channels: Iterable[Channel] = ()):
+        self._by_id: Dict[str, Channel] = {}
+        self._by_name: Dict[str, Set[str]] = {}  # name -> ids
+        self._names: List[str] = []  # sorted keys of _by_name
+        for channel in channels:
+            self.add(channel)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Channel]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, id):
+        return id in self._by_id
+
+    def add(self, channel: Channel):
+        self.remove(channel.id)
+        self._by_id[channel.id] = channel
+        name = (channel.name or '').lower()
+        if name:
+            if name not in self._by_name:
+                bisect.insort(self._names, name)
+                self._by_name[name] = set()
+            self._by_name[name].add(channel.id)
+
+    def remove(self, id) -> Optional[Channel]:
+        channel = self._by_id.pop(id, None)
+        name = (channel.name or '').lower() if channel else ''
+        ids = self._by_name.get(name)
+        if ids and id in ids:
+            ids.discard(id)
+            if not ids:
+                del self._by_name[name]
+                del self._names[bisect.bisect_left(self._names, name)]
+        return channel
+
+    def named(self, name) -> List[Channel]:
+        """Every channel called `name` (`#` optional), unarchived first, then newest first."""
+        channels = (self._by_id[id] for id in self._by_name.get(name.lstrip('#').lower(), ()))
+        return sorted(channels, key=lambda channel: (bool(channel.is_archived), -(channel.created or 0), channel.id))
+
+    def rename(self, id, name) -> Optional[Channel]:
+        if id in self._by_id:
+            self.add(dataclasses.replace(self._by_id[id], name=name))
+        return self._by_id.get(id)
+
+    def archive(self, id, archived=True) -> Optional[Channel]:
+        if id in self._by_id:
+            self.add(dataclasses.replace(self._by_id[id], is_archived=archived))
+        return self._by_id.get(id)
+
+    def get(self, id=None, name=None) -> Optional[Channel]:
+        if id:
+            return self._by_id.get(id)
+        if name:
+            named = self.named(name)
+            return named[0] if named else None
+        return None
+
+    def find(self, pattern: Union[str, Pattern, None] = None, prefix='', include_archived=False) -> List[Channel]:
+        """Channels whose name starts with `prefix` and matches the regex `pattern`, sorted by name.
+
+        Only the names sharing the prefix (given, or the literal start of an `^` pattern) are tested.
+        """
+        regex = re.compile(pattern, re.IGNORECASE) if isinstance(pattern, str) else pattern
+        if regex is not None and not prefix and not regex.flags & re.VERBOSE:
+            prefix = literal_prefix(regex.pattern)
+        prefix = prefix.lstrip('#').lower()
+
+        matches = []
+        for i in range(bisect.bisect_left(self._names, prefix), len(self._names)):
+            name = self._names[i]
+            if not name.startswith(prefix):
+                break
+            for channel in self.named(name):
+                if (include_archived or not channel.is_archived) and (regex is None or regex.search(channel.name)):
+                    matches.append(channel)
+        return matches
+
+
+# events that change the directory; they need the `users:read` and `channels:read` event subscriptions
+DIRECTORY_EVENTS = {
+    'team_join', 'user_change',
+    'channel_created', 'channel_rename', 'channel_archive', 'channel_unarchive', 'channel_deleted',
+}
+
+
+def apply_event(users: UserDirectory, channels: ChannelDirectory, event: Dict[str, Any]) -> bool:
+    """Update the directories from a change event. Returns whether it was one."""
+    event_type = event.get('type')
+    if event_type in ('team_join', 'user_change'):
+        users.add(User.from_payload(event['user']))
+    elif event_type == 'channel_created':
+        info = event['channel']
+        channels.add(Channel(id=info['id'], name=info.get('name', ''), is_channel=True,
+                             created=info.get('created', -1)))
+    elif event_type == 'channel_rename':
+        channels.rename(event['channel']['id'], event['channel']['name'])
+    elif event_type in ('channel_archive', 'channel_unarchive'):
+        channels.archive(event['channel'], archived=event_type == 'channel_archive')
+    elif event_type == 'channel_deleted':
+        channels.remove(event['channel'])
+    else:
+        return False
+    return True
+
+
+SNAPSHOT_VERSION = 1
+
+
+def _layout():
+    # a snapshot is only loaded if the records it holds still have the same fields
+    return SNAPSHOT_VERSION, User.__slots__, tuple(f.name for f in dataclasses.fields(Channel))
+
+
+def save_snapshot(path: str, users: UserDirectory, channels: ChannelDirectory):
+    """Write both directories to `path`, atomically. Blocking."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = {
+        'layout': _layout(),
+        'saved': time.time(),
+        'users': [tuple(getattr(user, f) for f in User.__slots__) for user in users],
+        'channels': [dataclasses.astuple(channel) for channel in channels],
+    }
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Optional[Tuple[UserDirectory, ChannelDirectory, float]]:
+    """The directories saved at `path` and when they were saved, or None if there's no usable snapshot."""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot.get('layout') != _layout():
+            log.info(f'ignoring directory snapshot {path} from another version')
+            return None
+        return (UserDirectory(User(*fields) for fields in snapshot['users']),
+                ChannelDirectory(Channel(*fields) for fields in snapshot['channels']),
+                snapshot['saved'])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f'could not load directory snapshot {path}: {e}')
+        return None
@@ -0,0 +1,170 @@
+"""
+Command dispatch index
+
+Every `bot.add_command` regex is registered here instead of as its own bolt listener.
+Each pattern contributes its longest required literal to a single trie-shaped scanner,
+so one pass over the message text yields the handful of candidate commands whose
+regex is then actually run.
+"""
+from dataclasses import dataclass
+import logging
+import re
+from typing import Callable, Dict, List, Optional, Set
+
+try:
+    import re._parser as sre_parse  # python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+LOG = logging.getLogger(__name__)
+
+_REPEATS = tuple(
+    getattr(sre_parse, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+    if hasattr(sre_parse, name)
+)
+
+# non-ascii characters that `re.IGNORECASE` treats as equal to an ascii letter,
+# but that `str.casefold` does not fold down to that letter
+_ASCII_FOLDS = str.maketrans({'İ': 'i', 'ı': 'i'})
+
+
+@dataclass(frozen=True)
+class Command(object):
+    regex: re.Pattern
+    func: Callable
+    direct: bool = False
+    literal: str = ''
+    max_concurrency: int = 0
+    executor: Optional[str] = None  # run in the loop, or a 'thread' / 'process' pool
+
+
+def fold(text: str) -> str:
+    """Normalize text for the literal prefilter."""
+    return text.translate(_ASCII_FOLDS).casefold()
+
+
+def required_literal(regex: re.Pattern) -> str:
+    """Find the longest ascii literal that must appear in any match of `regex`.
+
+    Returns an empty string when no such literal can be proven (e.g. `(.*)`, `a|b`),
+    in which case the command is always a candidate.
+    """
+    if not isinstance(regex.pattern, str):
+        return ''
+
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception as e:
+        LOG.debug(f'could not parse {regex.pattern!r} for literals: {e}')
+        return ''
+
+    literals = _required_literals(parsed)
+    return fold(max(literals, key=len)) if literals else ''
+
+
+def _required_literals(parsed) -> List[str]:
+    literals = []
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+
+        if run:
+            literals.append(''.join(run))
+            run = []
+
+        if op is sre_parse.SUBPATTERN:
+            literals.extend(_required_literals(av[-1]))
+        elif op in _REPEATS and av[0] >= 1:
+            literals.extend(_required_literals(av[2]))
+
+    if run:
+        literals.append(''.join(run))
+
+    return literals
+
+
+def _trie_pattern(words: Set[str]) -> str:
+    """Build a regex alternation shaped like a trie, preferring the longest word."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def walk(node: dict) -> str:
+        alternatives = [re.escape(ch) + walk(child) for ch, child in sorted(node.items()) if ch]
+        if not alternatives:
+            return ''
+        if '' in node:
+            return f'(?:{"|".join(alternatives)})?'
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return f'(?:{"|".join(alternatives)})'
+
+    return walk(trie)
+
+
+class CommandIndex(object):
+    """Registry of regex commands, searchable in a single pass over message text."""
+
+    def __init__(self):
+        self._commands: List[Command] = []
+        self._by_literal: Dict[str, List[int]] = {}
+        self._always: List[int] = []
+        self._implied: Dict[str, List[str]] = {}
+        self._scanner: Optional[re.Pattern] = None
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._commands)
+
+    def add(self, regex: re.Pattern, func: Callable, direct=False, max_concurrency=0,
+            executor: Optional[str] = None) -> Command:
+        command = Command(regex=regex, func=func, direct=direct, literal=required_literal(regex),
+                          max_concurrency=max_concurrency, executor=executor)
+        self._commands.append(command)
+        self._dirty = True
+        return command
+
+    def build(self):
+        """Compile the literal scanner. Commands added afterwards trigger a rebuild on next use."""
+        self._by_literal = {}
+        self._always = []
+        for i, command in enumerate(self._commands):
+            if command.literal:
+                self._by_literal.setdefault(command.literal, []).append(i)
+            else:
+                self._always.append(i)
+
+        # a scanner hit on `helpme` also proves `help` and `he` are present at that position
+        literals = set(self._by_literal)
+        self._implied = {
+            literal: [other for other in literals if literal.startswith(other)]
+            for literal in literals
+        }
+        self._scanner = re.compile(f'(?=({_trie_pattern(literals)}))') if literals else None
+        self._dirty = False
+
+        LOG.debug(f'built command index: {len(literals)} literals, {len(self._always)} unfiltered commands')
+
+    def candidates(self, text: str) -> List[Command]:
+        """Commands that could match `text`, in registration order."""
+        if self._dirty:
+            self.build()
+
+        indices = list(self._always)
+        if self._scanner:
+            present = set()
+            for m in self._scanner.finditer(fold(text)):
+                present.update(self._implied[m.group(1)])
+            for literal in present:
+                indices.extend(self._by_literal[literal])
+
+        return [self._commands[i] for i in sorted(indices)]
+
+    def matches(self, text: str) -> List[Command]:
+        """Commands whose regex is found in `text`, in registration order."""
+        return [command for command in self.candidates(text) if command.regex.search(text)]
@@ -0,0 +1,328 @@
+"""
+Bounded, fair execution of script handlers
+
+Handlers are queued per channel and started round-robin across channels, so a burst in one
+busy channel can't starve the rest of the workspace. At most `concurrency` handlers run at
+once (and at most `max_concurrency` of any one command); once `queue_size` handlers are
+waiting in one channel, the overflow policy decides what happens to that channel's next one.
+Other channels keep their own room.
+
+`ExecutionPools` runs blocking or CPU-bound handlers off the event loop, in a thread or process pool.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+import functools
+import importlib
+import importlib.util
+import inspect
+import logging
+import multiprocessing
+import sys
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from betabot.classes.event import Event, EventActions, EventSnapshot
+
+LOG = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'reject', 'wait')
+EXECUTION_MODES = (None, 'thread', 'process')
+
+
+@dataclass(eq=False)
+class Job(object):
+    run: Callable[[], Awaitable[Any]]
+    key: Any  # fairness key, e.g. the channel id
+    command: Optional[Callable] = None
+    limit: int = 0  # max concurrent runs of `command`; 0 is unlimited
+    on_reject: Optional[Callable[[], Awaitable[Any]]] = None
+
+
+class HandlerExecutor(object):
+
+    def __init__(self, concurrency=16, queue_size=100, overflow='wait'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow policy must be one of {OVERFLOW_POLICIES}, not `{overflow}`')
+
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.overflow = overflow
+
+        self._queues: Dict[Any, Deque[Job]] = {}
+        self._ready: Deque[Any] = deque()  # keys with queued jobs, in round-robin order
+        self._queued = 0
+        self._in_flight = 0
+        self._in_flight_by_command: Dict[Callable, int] = {}
+        self._space_waiters: Dict[Any, Deque[asyncio.Future]] = {}  # per key, submits waiting for room
+        self._idle_waiters: List[asyncio.Future] = []
+        self._tasks: Set[asyncio.Task] = set()  # the loop only keeps weak references to tasks
+
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0, 'rejected': 0, 'max_queued': 0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            'queued': self._queued,
+            'in_flight': self._in_flight,
+            'queued_by_key': {key: len(queue) for key, queue in self._queues.items()},
+            'in_flight_by_command': {getattr(command, '__name__', str(command)): n
+                                     for command, n in self._in_flight_by_command.items()},
+        }
+
+    async def submit(self, run: Callable[[], Awaitable[Any]], key: Any = None, command: Optional[Callable] = None,
+                     limit: int = 0, on_reject: Optional[Callable[[], Awaitable[Any]]] = None) -> bool:
+        """Queue `run()` to be started when there is room. Returns False if it was dropped or rejected."""
+        job = Job(run=run, key=key, command=command, limit=limit, on_reject=on_reject)
+
+        # bounded per key, so one flooded channel only overflows itself
+        while len(self._queues.get(key, ())) >= self.queue_size:
+            if self.overflow == 'wait':
+                waiters = self._space_waiters.setdefault(key, deque())
+                waiter = asyncio.get_running_loop().create_future()
+                waiters.append(waiter)
+                try:
+                    await waiter
+                finally:
+                    if waiter in waiters:
+                        waiters.remove(waiter)
+                    if not waiters and self._space_waiters.get(key) is waiters:
+                        del self._space_waiters[key]
+                continue
+
+            name = getattr(command, '__name__', 'handler')
+            if self.overflow == 'reject' and on_reject:
+                LOG.warning(f'handler queue for {key} is full ({self.queue_size}); rejecting {name}')
+                self.counters['rejected'] += 1
+                asyncio.ensure_future(on_reject())
+            else:
+                LOG.warning(f'handler queue for {key} is full ({self.queue_size}); dropping {name}')
+                self.counters['dropped'] += 1
+            return False
+
+        self.counters['submitted'] += 1
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._ready.append(key)
+        self._queues[key].append(job)
+        self._queued += 1
+        self.counters['max_queued'] = max(self.counters['max_queued'], self._queued)
+
+        self._pump()
+        return True
+
+    async def join(self):
+        """Wait until nothing is queued or running."""
+        if self._queued or self._in_flight:
+            waiter = asyncio.get_running_loop().create_future()
+            self._idle_waiters.append(waiter)
+            await waiter
+
+    def _has_room(self, job: Job) -> bool:
+        return not job.limit or self._in_flight_by_command.get(job.command, 0) < job.limit
+
+    def _pump(self):
+        """Start queued jobs, round-robin across keys, while there is capacity."""
+        while self._in_flight < self.concurrency and self._ready:
+            for _ in range(len(self._ready)):
+                key = self._ready.popleft()
+                queue = self._queues[key]
+                if not self._has_room(queue[0]):
+                    # this key's oldest job waits on its command's limit; keep the key's order
+                    self._ready.append(key)
+                    continue
+
+                job = queue.popleft()
+                if queue:
+                    self._ready.append(key)
+                else:
+                    del self._queues[key]
+                self._start(job)
+                break
+            else:
+                return  # everything queued is waiting on a per-command limit
+
+    def _start(self, job: Job):
+        self._queued -= 1
+        self._in_flight += 1
+        if job.command is not None:
+            self._in_flight_by_command[job.command] = self._in_flight_by_command.get(job.command, 0) + 1
+
+        for waiter in self._space_waiters.get(job.key, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+        task = asyncio.ensure_future(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Job):
+        try:
+            await job.run()
+            self.counters['completed'] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counters['failed'] += 1
+            LOG.critical(f'Script had an error: {e}', exc_info=1)
+        finally:
+            self._in_flight -= 1
+            if job.command is not None:
+                self._in_flight_by_command[job.command] -= 1
+                if not self._in_flight_by_command[job.command]:
+                    del self._in_flight_by_command[job.command]
+
+            self._pump()
+
+            if not self._queued and not self._in_flight:
+                for waiter in self._idle_waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                self._idle_waiters.clear()
+
+
+def _call(func: Callable, *args):
+    """Call a sync or async handler to completion in a worker thread or process."""
+    result = func(*args)
+    if inspect.isawaitable(result):
+        async def wait():
+            return await result
+        result = asyncio.run(wait())
+    return result
+
+
+HandlerRef = Tuple[str, Optional[str], str]  # (module name, module file, qualified name)
+
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def in_worker() -> bool:
+    """Whether this is a handler worker process: importing a script here must not register its handlers."""
+    return _in_worker
+
+
+def _handler_ref(func: Callable) -> HandlerRef:
+    """Where a worker process can find `func`: scripts are imported by path, so send the file along."""
+    module = sys.modules.get(func.__module__)
+    return func.__module__, getattr(module, '__file__', None), func.__qualname__
+
+
+def _load_handler(ref: HandlerRef) -> Callable:
+    """Import the handler's module in this worker (by name, or from its file if that finds something else)."""
+    module_name, path, qualname = ref
+    module = sys.modules.get(module_name)
+    if module is None:
+        try:
+            spec = importlib.util.find_spec(module_name)
+        except (ImportError, ValueError):
+            spec = None
+        if spec is not None and (not path or spec.origin == path):
+            module = importlib.import_module(module_name)
+        else:
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+
+    func = module
+    for name in qualname.split('.'):
+        func = getattr(func, name)
+    return func
+
+
+def _call_in_process(ref: HandlerRef, snapshot: Optional[EventSnapshot]):
+    _call(_load_handler(ref), *([snapshot] if snapshot else []))
+    return snapshot.actions.calls if snapshot else []
+
+
+def _bridge(async_func: Optional[Callable], loop: asyncio.AbstractEventLoop) -> Optional[Callable]:
+    """Make an async bolt utility (say, respond, ...) callable from a worker thread.
+
+    Sync handlers get the result directly; async handlers (on the thread's own loop) get an awaitable.
+    """
+    if async_func is None:
+        return None
+
+    @functools.wraps(async_func)
+    def call(*args, **kwargs):
+        future = asyncio.run_coroutine_threadsafe(async_func(*args, **kwargs), loop)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return future.result()
+        return asyncio.wrap_future(future)
+
+    return call
+
+
+class ExecutionPools(object):
+    """Run handlers inline on the loop, in a thread pool, or in a process pool.
+
+    Sync handlers without an explicit mode go to the thread pool so they never block the loop.
+    Handlers run in a process get an `EventSnapshot`; their `say`/`respond` calls are replayed
+    here once they return.
+
+    Worker processes are started fresh (forkserver, or spawn), never forked from the bot: it already
+    runs threads (the default executor, sqlite's worker, classifier training), and a fork copies
+    any lock one of them holds into a child that can never release it. Each worker imports a
+    handler's module the first time it runs one, so scripts' top-level code runs there too (the
+    bot's decorators register nothing there, see `in_worker`), and handlers can't rely on the
+    bot's in-process state.
+    """
+
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def _thread_pool(self) -> Executor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix='betabot')
+        return self._threads
+
+    def _process_pool(self) -> Executor:
+        if self._processes is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers,
+                                                  mp_context=multiprocessing.get_context(method),
+                                                  initializer=_init_worker)
+        return self._processes
+
+    async def run(self, func: Callable, event: Optional[Event] = None, mode: Optional[str] = None):
+        args = [event] if event is not None else []
+        if mode is None:
+            if inspect.iscoroutinefunction(func):
+                return await func(*args)
+            mode = 'thread'
+
+        loop = asyncio.get_running_loop()
+        if mode == 'thread':
+            if event is not None:
+                actions = event.actions
+                args = [event.with_actions(EventActions(
+                    ack=_bridge(actions.ack, loop), say=_bridge(actions.say, loop),
+                    respond=_bridge(actions.respond, loop), next=_bridge(actions.next, loop)))]
+            return await loop.run_in_executor(self._thread_pool(), functools.partial(_call, func, *args))
+
+        if mode == 'process':
+            snapshot = event.snapshot() if event is not None else None
+            calls = await loop.run_in_executor(self._process_pool(),
+                                               functools.partial(_call_in_process, _handler_ref(func), snapshot))
+            for name, call_args, call_kwargs in calls:
+                await getattr(event.actions, name)(*call_args, **call_kwargs)
+            return
+
+        raise ValueError(f'execution mode must be one of {EXECUTION_MODES}, not `{mode}`')
+
+    def shutdown(self):
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False)
+        self._threads = self._processes = None
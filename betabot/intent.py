@@ -0,0 +1,197 @@
+"""
+Intent classification for `bot.learn`
+
+Messages that match no command are classified against the sentences scripts taught the bot.
+Training happens off the event loop, and trained models are cached on disk under a hash of
+the learn corpus, so a restart with unchanged scripts skips training entirely.
+
+Two engines are available (INTENT_ENGINE / --intent): TextBlob's `naive_bayes`, the default,
+and `vector`, which scores an utterance against every learned sentence with one hashed n-gram
+TF-IDF matrix product. naive_bayes's confidence spreads too thin to clear its threshold once
+scripts teach more than a few dozen intents; pick vector for those.
+"""
+import abc
+import hashlib
+import logging
+import os
+from pathlib import Path
+import pickle
+import re
+import time
+from typing import List, Optional, Tuple
+import zlib
+
+import numpy as np
+from textblob.classifiers import NaiveBayesClassifier
+
+LOG = logging.getLogger(__name__)
+
+LEARN_CACHE_DIR = os.getenv('LEARN_CACHE_DIR', str(Path.home() / '.cache' / 'betabot'))
+# minimum confidence to invoke a learned function; unset uses the engine's own default
+LEARN_THRESHOLD = float(os.getenv('LEARN_THRESHOLD')) if os.getenv('LEARN_THRESHOLD') else None
+INTENT_ENGINE = os.getenv('INTENT_ENGINE', 'naive_bayes')
+
+Sample = Tuple[str, str]  # (sentence, label)
+
+_WORD = re.compile(r"[\w']+")
+
+
+def tokenize(text: str) -> List[str]:
+    # our own tokenizer, so textblob never needs the nltk punkt corpora
+    return _WORD.findall(text.lower())
+
+
+class IntentEngine(abc.ABC):
+    """Interface for intent classifiers. Engines are pickled whole into the model cache."""
+
+    name = ''
+    version = 1  # bump when a change to the engine makes models cached by older code stale
+    threshold = 0.7  # default minimum confidence, see LEARN_THRESHOLD
+
+    @abc.abstractmethod
+    def train(self, samples: List[Sample]):
+        pass
+
+    @abc.abstractmethod
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        """Most likely label for `text` and its confidence (0-1). (None, 0.0) if nothing is known."""
+
+    def classify_batch(self, texts: List[str]) -> List[Tuple[Optional[str], float]]:
+        return [self.classify(text) for text in texts]
+
+
+class NaiveBayesIntent(IntentEngine):
+    name = 'naive_bayes'
+
+    def __init__(self):
+        self._classifier: Optional[NaiveBayesClassifier] = None
+        self._vocabulary = set()
+
+    def train(self, samples: List[Sample]):
+        train_set = [(tokenize(sentence), label) for sentence, label in samples]
+        self._vocabulary = {word for words, _ in train_set for word in words}
+        self._classifier = NaiveBayesClassifier(train_set)
+        self._classifier.train()
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        words = tokenize(text)
+        if not self._classifier or not self._vocabulary.intersection(words):
+            return None, 0.0
+
+        dist = self._classifier.prob_classify(words)
+        label = dist.max()
+        return label, dist.prob(label)
+
+
+class VectorIntent(IntentEngine):
+    """Nearest learned sentence by cosine similarity of hashed n-gram TF-IDF vectors.
+
+    Word unigrams, word bigrams and character trigrams are hashed into `n_features` columns,
+    so there is no vocabulary to store. An utterance's confidence is its similarity to the
+    closest sentence of the winning intent.
+    """
+
+    name = 'vector'
+    threshold = 0.5
+
+    def __init__(self, n_features=2 ** 14):
+        self.n_features = n_features
+        self.labels: List[str] = []
+        self._idf: Optional[np.ndarray] = None
+        self._matrix: Optional[np.ndarray] = None  # (sentences, n_features), rows grouped by label
+        self._starts: Optional[np.ndarray] = None  # first row of each label in _matrix
+
+    def _features(self, text: str) -> List[int]:
+        words = tokenize(text)
+        grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f' {word} '
+            grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        # crc32 rather than hash(), which is salted per process and would break the model cache
+        return [zlib.crc32(gram.encode('utf-8')) % self.n_features for gram in grams]
+
+    def _vectorize(self, texts: List[str]) -> np.ndarray:
+        counts = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if features:
+                counts[row] = np.bincount(features, minlength=self.n_features)
+        return np.log1p(counts, out=counts)
+
+    def _weigh(self, tf: np.ndarray) -> np.ndarray:
+        tfidf = tf * self._idf
+        norms = np.linalg.norm(tfidf, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return tfidf / norms
+
+    def train(self, samples: List[Sample]):
+        samples = sorted(samples, key=lambda sample: sample[1])
+        self.labels = sorted({label for _, label in samples})
+        sentence_labels = [label for _, label in samples]
+        self._starts = np.array([sentence_labels.index(label) for label in self.labels])
+
+        tf = self._vectorize([sentence for sentence, _ in samples])
+        df = np.count_nonzero(tf, axis=0)
+        self._idf = (np.log((1 + len(samples)) / (1 + df)) + 1).astype(np.float32)
+        self._matrix = self._weigh(tf)
+
+    def classify(self, text: str) -> Tuple[Optional[str], float]:
+        return self.classify_batch([text])[0]
+
+    def classify_batch(self, texts: List[str]) -> List[Tuple[Optional[str], float]]:
+        if self._matrix is None or not len(self.labels) or not texts:
+            return [(None, 0.0)] * len(texts)
+
+        similarity = self._weigh(self._vectorize(texts)) @ self._matrix.T  # (texts, sentences)
+        by_label = np.maximum.reduceat(similarity, self._starts, axis=1)  # (texts, labels)
+        best = by_label.argmax(axis=1)
+        scores = by_label[np.arange(len(texts)), best]
+
+        return [(self.labels[i], float(score)) if score > 0 else (None, 0.0) for i, score in zip(best, scores)]
+
+
+ENGINES = {
+    NaiveBayesIntent.name: NaiveBayesIntent,
+    VectorIntent.name: VectorIntent,
+}
+
+
+def corpus_hash(engine_name: str, samples: List[Sample]) -> str:
+    # the engine's version is part of the key, so models cached before a change to it are retrained
+    digest = hashlib.sha256(f'{engine_name}\0{ENGINES[engine_name].version}\0'.encode('utf-8'))
+    for sentence, label in sorted(samples):
+        digest.update(f'{label}\0{sentence}\0'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def load_or_train(engine_name: str, samples: List[Sample], cache_dir: Optional[str] = LEARN_CACHE_DIR) -> IntentEngine:
+    """Load the cached model for this exact corpus, or train one and cache it. Blocking."""
+    engine_class = ENGINES[engine_name]
+    path = Path(cache_dir) / f'{engine_name}-{corpus_hash(engine_name, samples)}.pickle' if cache_dir else None
+
+    if path and path.exists():
+        try:
+            with open(path, 'rb') as f:
+                engine = pickle.load(f)
+            LOG.info(f'loaded {engine_name} intent model from {path}')
+            return engine
+        except Exception as e:
+            LOG.warning(f'could not load cached intent model {path}, retraining: {e}')
+
+    started = time.perf_counter()
+    engine = engine_class()
+    engine.train(samples)
+    LOG.info(f'trained {engine_name} intent model on {len(samples)} sentences '
+             f'in {time.perf_counter() - started:.2f}s')
+
+    if path:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(engine, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            LOG.warning(f'could not cache intent model to {path}: {e}')
+
+    return engine
@@ -0,0 +1,239 @@
+"""
+Durable storage for MemoryDict: an append-only log of mutations, compacted into snapshots
+
+A directory holds one `snapshot` and the `log.<generation>` files written since it. Every
+record, in either file, is framed as (length, crc32) + a ValueCodec-encoded list, so a torn
+write at the end of a log is detected and dropped on load. Snapshots are written to a temp
+file and renamed into place, and memory-mapped when loaded.
+
+Expiry times are stored as wall-clock (time.time()) deadlines.
+"""
+from concurrent.futures import Future
+import logging
+import mmap
+import os
+from pathlib import Path
+import queue
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import zlib
+
+from betabot.serialization import CodecError, ValueCodec
+
+log = logging.getLogger(__name__)
+
+FRAME = struct.Struct('<II')  # payload length, crc32 of payload
+HEADER = struct.Struct('<8sQ')  # magic, generation of the first log not in the snapshot
+MAGIC = b'BBDICT\x01\n'
+
+Entry = Tuple[str, Any, Optional[float]]  # key, value, wall-clock deadline
+
+
+def _frame(payload: bytes) -> bytes:
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _frames(data, start=0) -> Iterator[Tuple[int, bytes]]:
+    """(end offset, payload) of each intact record in `data`, stopping at the first torn one."""
+    offset = start
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        end = offset + FRAME.size + length
+        if end > len(data):
+            return
+        payload = data[offset + FRAME.size:end]
+        if zlib.crc32(payload) != crc:
+            return
+        yield end, payload
+        offset = end
+
+
+class Journal(object):
+    """The log and snapshots of one MemoryDict, in directory `path`.
+
+    Records are encoded by the caller, then written to the OS by a writer thread: a write's future
+    resolves once it would survive the process crashing, and with `fsync` once it is flushed to disk,
+    to survive the machine crashing. Writes queued together share one write (and fsync).
+    """
+
+    def __init__(self, path: str, codec: ValueCodec, fsync=False):
+        self.path = Path(path)
+        self.codec = codec
+        self.fsync = fsync
+        self.generation = 0
+        self.log_bytes = 0  # written to the current log
+        self._log = None
+        self._queue: queue.Queue = queue.Queue()  # (op, argument, future) for the writer thread
+        self._thread: Optional[threading.Thread] = None
+        self._rotated: Optional[Future] = None  # the latest rotation, which a snapshot waits for
+
+    def _log_path(self, generation: int) -> Path:
+        return self.path / f'log.{generation}'
+
+    def _logs(self) -> List[int]:
+        return sorted(int(p.suffix[1:]) for p in self.path.glob('log.*') if p.suffix[1:].isdigit())
+
+    def load(self) -> Dict[str, Tuple[Any, Optional[float]]]:
+        """Read the snapshot and replay the logs after it, then open a new log. Blocking."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        entries: Dict[str, Tuple[Any, Optional[float]]] = {}
+
+        snapshot = self.path / 'snapshot'
+        if snapshot.exists():
+            with open(snapshot, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, self.generation = HEADER.unpack_from(data)
+                if magic != MAGIC:
+                    raise CodecError(f'{snapshot} is not a betabot snapshot')
+                for _, payload in _frames(data, HEADER.size):
+                    key, value, expires = self.codec.decode(payload)
+                    entries[key] = (value, expires)
+
+        replayed = 0
+        for generation in self._logs():
+            if generation < self.generation:
+                continue  # already in the snapshot; left behind by a crash
+            log_path = self._log_path(generation)
+            data = log_path.read_bytes()
+            end = 0
+            for end, payload in _frames(data):
+                self._replay(entries, self.codec.decode(payload))
+                replayed += 1
+            if end < len(data):
+                log.warning(f'dropping {len(data) - end} bytes of torn writes at the end of {log_path}')
+                with open(log_path, 'r+b') as f:
+                    f.truncate(end)
+            self.generation = generation
+
+        now = time.time()
+        entries = {key: entry for key, entry in entries.items() if entry[1] is None or entry[1] > now}
+        log.info(f'loaded {len(entries)} keys from {self.path} ({replayed} log records) '
+                 f'in {time.perf_counter() - started:.2f}s')
+
+        self.generation += 1
+        self._open_log(self.generation)
+        self._thread = threading.Thread(target=self._work, name='betabot-journal', daemon=True)
+        self._thread.start()
+        return entries
+
+    @staticmethod
+    def _replay(entries: Dict[str, Tuple[Any, Optional[float]]], record: list):
+        op, key = record[0], record[1]
+        if op == 's':
+            entries[key] = (record[2], record[3])
+        elif op == 'd':
+            entries.pop(key, None)
+        elif op == 'a':
+            value, expires = entries.get(key, ([], None))
+            entries[key] = (value + record[2], expires)
+        elif op == 'e':
+            if key in entries:
+                entries[key] = (entries[key][0], record[2])
+        else:
+            raise CodecError(f'unknown log record `{op}`')
+
+    def _open_log(self, generation: int):
+        self._log = open(self._log_path(generation), 'ab')
+        self.log_bytes = 0
+
+    def write(self, records: List[list]) -> Future:
+        """Append mutation records: ['s', key, value, expires], ['d', key], ['a', key, values] or ['e', key, expires].
+
+        They are encoded right away, so a value that can't be encoded raises here; the returned future
+        resolves once they are written.
+        """
+        data = b''.join(_frame(self.codec.encode(record)) for record in records)
+        future = Future()
+        self._queue.put(('write', data, future))
+        return future
+
+    def rotate(self) -> int:
+        """Start a new log after the writes queued so far; returns the generation a snapshot of the
+        current state should carry."""
+        self.generation += 1
+        self._rotated = Future()
+        self._queue.put(('rotate', self.generation, self._rotated))
+        return self.generation
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            writes: List[Tuple[bytes, Future]] = []
+            for op, argument, future in batch:
+                if op == 'write':
+                    writes.append((argument, future))
+                    continue
+                self._write(writes)
+                writes = []
+                try:
+                    self._close_log()
+                    if op == 'rotate':
+                        self._open_log(argument)
+                    future.set_result(None)
+                except Exception as e:
+                    future.set_exception(e)
+                if op == 'close':
+                    return
+            self._write(writes)
+
+    def _write(self, writes: List[Tuple[bytes, Future]]):
+        if not writes:
+            return
+        data = b''.join(data for data, _ in writes)
+        try:
+            self._log.write(data)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self.log_bytes += len(data)
+        except Exception as e:
+            log.error(f'could not write {len(writes)} records to {self.path}: {e}')
+            for _, future in writes:
+                future.set_exception(e)
+            return
+        for _, future in writes:
+            future.set_result(None)
+
+    def snapshot(self, generation: int, entries: List[Entry]):
+        """Write `entries` as the snapshot and delete the logs it covers. Blocking."""
+        if self._rotated is not None:
+            self._rotated.result()  # the log it covers is closed
+        started = time.perf_counter()
+        tmp_path = self.path / 'snapshot.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, generation))
+            for entry in entries:
+                f.write(_frame(self.codec.encode(list(entry))))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path / 'snapshot')
+
+        for old in self._logs():
+            if old < generation:
+                self._log_path(old).unlink()
+        log.debug(f'snapshot of {len(entries)} keys in {time.perf_counter() - started:.2f}s')
+
+    def _close_log(self):
+        if self._log:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log.close()
+            self._log = None
+
+    def close(self):
+        """Write everything queued, then close the log. Blocking."""
+        if self._thread is not None:
+            closed = Future()
+            self._queue.put(('close', None, closed))
+            self._thread.join()
+            self._thread = None
+            closed.result()
+        self._close_log()
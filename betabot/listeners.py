@@ -0,0 +1,82 @@
+"""
+Registry of conversations waiting for a reply
+
+Each waiter is an `asyncio.Future` filed under the (channel, user, thread_ts) it is waiting on,
+so an incoming message is routed to its waiter with a single dict lookup.
+"""
+import asyncio
+from dataclasses import dataclass
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+ListenerKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+@dataclass(eq=False)
+class Listener(object):
+    key: ListenerKey
+    regex: Optional[re.Pattern]
+    future: asyncio.Future
+
+
+class ListenerRegistry(object):
+
+    def __init__(self):
+        self._listeners: Dict[ListenerKey, List[Listener]] = {}
+
+    def __len__(self):
+        return sum(len(waiters) for waiters in self._listeners.values())
+
+    def add(self, channel: str, user: str, thread_ts: Optional[str] = None,
+            regex: Optional[re.Pattern] = None) -> Listener:
+        listener = Listener(key=(channel, user, thread_ts), regex=regex,
+                            future=asyncio.get_running_loop().create_future())
+        self._listeners.setdefault(listener.key, []).append(listener)
+        LOG.debug(f'listening for {regex.pattern if regex else "anything"} from {listener.key}')
+        return listener
+
+    def remove(self, listener: Listener):
+        waiters = self._listeners.get(listener.key)
+        if waiters and listener in waiters:
+            waiters.remove(listener)
+            if not waiters:
+                del self._listeners[listener.key]
+
+    async def wait(self, channel: str, user: str, thread_ts: Optional[str] = None,
+                   regex: Optional[re.Pattern] = None, timeout: Optional[float] = None):
+        """Wait for the next matching message. Raises `asyncio.TimeoutError` after `timeout` seconds."""
+        listener = self.add(channel, user, thread_ts, regex)
+        try:
+            return await asyncio.wait_for(listener.future, timeout)
+        finally:
+            # timed out or cancelled: stop routing messages to this waiter
+            self.remove(listener)
+
+    def resolve(self, event) -> bool:
+        """Hand `event` to the oldest waiter it matches. Returns True if the event was consumed."""
+        waiters = self._listeners.get((event.channel, event.user, event.thread_ts))
+        if not waiters:
+            return False
+
+        for listener in waiters:
+            if listener.future.done():
+                continue
+
+            heard = event.for_listener()
+            # anchored, as conversations always matched replies with `re.match`
+            if listener.regex is None or heard.match_regex(listener.regex, anchored=True):
+                listener.future.set_result(heard)
+                self.remove(listener)
+                return True
+
+        return False
+
+    def cancel_all(self):
+        """Cancel every waiter, e.g. on shutdown."""
+        for waiters in list(self._listeners.values()):
+            for listener in waiters:
+                listener.future.cancel()
+        self._listeners.clear()
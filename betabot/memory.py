@@ -1,11 +1,68 @@
+import asyncio
+from collections import OrderedDict
 import json
 import logging
 import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import uuid
 
-import redis
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError, WatchError
+
+from betabot.journal import Journal
+from betabot.serialization import ValueCodec, is_tagged
 
 log = logging.getLogger(__name__)
 
+# how MemoryRedis / MemorySqlite / durable MemoryDict store values: json, msgpack or pickle (trusted
+# data only), and zlib or lz4 compression for encoded values of at least MEMORY_COMPRESS_THRESHOLD bytes
+MEMORY_CODEC = os.getenv('MEMORY_CODEC', 'json')
+MEMORY_COMPRESSION = os.getenv('MEMORY_COMPRESSION', '')
+MEMORY_COMPRESS_THRESHOLD = int(os.getenv('MEMORY_COMPRESS_THRESHOLD', 1024))
+# read pickled values even though MEMORY_CODEC isn't pickle, e.g. while migrating off it. Unpickling
+# runs code, so anyone who can write to the store could then run it in the bot
+MEMORY_ALLOW_PICKLE = os.getenv('MEMORY_ALLOW_PICKLE', '') not in ('', '0')
+
+# connections shared by every MemoryRedis command; callers wait up to REDIS_POOL_TIMEOUT for a free one
+REDIS_POOL_SIZE = int(os.getenv('REDIS_POOL_SIZE', 10))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 5))
+REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', 5))
+# attempts to reconnect and retry a command after a connection error or timeout
+REDIS_RETRIES = int(os.getenv('REDIS_RETRIES', 3))
+
+# MemoryDict (`--memory dict`) is durable when DICT_PATH names a directory for its log and snapshots;
+# the log is compacted into a snapshot every DICT_SNAPSHOT_INTERVAL seconds, and DICT_FSYNC=always
+# flushes every write to disk (otherwise writes survive the process crashing, but not the machine)
+DICT_PATH = os.getenv('DICT_PATH', '')
+DICT_SNAPSHOT_INTERVAL = float(os.getenv('DICT_SNAPSHOT_INTERVAL', 300))
+DICT_FSYNC = os.getenv('DICT_FSYNC', '') == 'always'
+
+# keys fetched per round trip by Memory.scan
+SCAN_PAGE_SIZE = int(os.getenv('SCAN_PAGE_SIZE', 500))
+
+# MemorySqlite (`--memory sqlite`): database file, and most queued queries run (and committed) together
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'betabot.db')
+SQLITE_BATCH_SIZE = int(os.getenv('SQLITE_BATCH_SIZE', 500))
+
+# MemoryCached (`--memory cached+<type>`): keys kept in-process, and for how long (0 keeps them until evicted)
+CACHE_MAX_KEYS = int(os.getenv('CACHE_MAX_KEYS', 10000))
+CACHE_TTL = float(os.getenv('CACHE_TTL', 30))
+# set to `pubsub` (redis only) to drop keys from every replica's cache when one of them writes
+CACHE_INVALIDATION = os.getenv('CACHE_INVALIDATION', '')
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'betabot:memory:invalidate')
+
+# MemoryBuffered (`--memory buffered+<type>`): seconds between flushes, and pending keys that force one sooner
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', 1))
+WRITE_BEHIND_MAX_KEYS = int(os.getenv('WRITE_BEHIND_MAX_KEYS', 1000))
+
 
 class Memory(object):
     """Memory interface to betabot."""
@@ -18,48 +75,1200 @@ class Memory(object):
         value = await self._get(key, default)
         return value
 
+    async def delete(self, key) -> bool:
+        """Returns whether `key` existed."""
+        return await self.delete_many([key]) > 0
+
+    async def get_many(self, keys: Iterable[str], default=None) -> Dict[str, Any]:
+        """Values for every key (`default` where missing), in one round trip where the backend allows."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        return await self._get_many(keys, default)
+
+    async def save_many(self, values: Dict[str, Any]):
+        if values:
+            await self._save_many(values)
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """Returns how many of `keys` existed."""
+        keys = list(keys)
+        if not keys:
+            return 0
+        return await self._delete_many(keys)
+
+    # atomic operations: safe against concurrent handlers (and, on redis, other replicas).
+    # save / compare_and_set / getset clear a key's TTL; incr / append_to_list keep it.
+
+    async def incr(self, key, amount=1) -> int:
+        """Add `amount` to the int at `key` (0 if missing). Returns the new value."""
+        return await self._incr(key, amount)
+
+    async def compare_and_set(self, key, expected, value) -> bool:
+        """Save `value` only if `key` currently holds `expected` (None: missing). Returns whether it did."""
+        return await self._compare_and_set(key, expected, value)
+
+    async def getset(self, key, value):
+        """Save `value` and return what `key` held before (None if missing), in one step."""
+        return await self._getset(key, value)
+
+    async def append_to_list(self, key, *values) -> int:
+        """Append to the list at `key` (created if missing). Returns its new length."""
+        return await self._append_to_list(key, list(values))
+
+    async def set_if_absent(self, key, value, ttl: Optional[float] = None) -> bool:
+        """Save `value` (expiring after `ttl` seconds, if given) only if `key` is missing. Returns whether it did."""
+        return await self._set_if_absent(key, value, ttl)
+
+    async def expire(self, key, ttl: Optional[float]) -> bool:
+        """Delete `key` after `ttl` seconds; None keeps it forever. Returns whether `key` exists."""
+        return await self._expire(key, ttl)
+
+    def namespace(self, name: str) -> 'MemoryNamespace':
+        """A view of the keys under `name:`; the prefix is added to and stripped from keys for you."""
+        return MemoryNamespace(self, name)
+
+    async def scan(self, prefix='', page_size=SCAN_PAGE_SIZE) -> AsyncIterator[Tuple[str, Any]]:
+        """`async for key, value in memory.scan(prefix)`: every key starting with `prefix`, fetched a page at a time.
+
+        Keys changed during the scan may or may not be seen; on redis a key can be seen twice.
+        """
+        async for page in self._scan(prefix, page_size):
+            for key, value in page:
+                yield key, value
+
     async def setup(self):
         await self._setup()
 
+    async def close(self):
+        await self._close()
+
     async def _setup(self):
         log.debug('Memory engine %s does not require any setup.' % (
             self.__class__.__name__))
 
+    async def _close(self):
+        pass
+
+    # backends without batch commands get one call per key
+
+    async def _get_many(self, keys: List[str], default) -> Dict[str, Any]:
+        return {key: await self._get(key, default) for key in keys}
+
+    async def _save_many(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            await self._save(key, value)
+
+    async def _delete_many(self, keys: List[str]) -> int:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support delete')
+
+    async def _scan(self, prefix: str, page_size: int) -> AsyncIterator[List[Tuple[str, Any]]]:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support scan')
+        yield
+
+    async def _incr(self, key, amount) -> int:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support incr')
+
+    async def _compare_and_set(self, key, expected, value) -> bool:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support compare_and_set')
+
+    async def _getset(self, key, value):
+        raise NotImplementedError(f'{self.__class__.__name__} does not support getset')
+
+    async def _append_to_list(self, key, values: List[Any]) -> int:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support append_to_list')
+
+    async def _set_if_absent(self, key, value, ttl: Optional[float]) -> bool:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support set_if_absent')
+
+    async def _expire(self, key, ttl: Optional[float]) -> bool:
+        raise NotImplementedError(f'{self.__class__.__name__} does not support expire')
+
+
+_MISSING = object()
+
+
+class _Unlogged(object):
+    """What MemoryDict._journal returns without a journal: nothing to wait for."""
+
+    def __await__(self):
+        return None
+        yield
+
+
+_UNLOGGED = _Unlogged()
+
+
+def default_codec() -> ValueCodec:
+    return ValueCodec(MEMORY_CODEC, MEMORY_COMPRESSION, MEMORY_COMPRESS_THRESHOLD, MEMORY_ALLOW_PICKLE)
+
 
 class MemoryDict(Memory):
-    """Ephemeral in-memory storage."""
+    """In-memory storage; ephemeral unless given a `path`.
+
+    Every operation completes without awaiting anything, so each is atomic on the event loop.
 
-    def __init__(self):
+    With a `path`, every mutation is also appended to a log there (encoded with `codec`), which is
+    compacted into a snapshot every `snapshot_interval` seconds and on close. Both are loaded on
+    setup, so reads stay dict lookups and the data survives restarts. Log writes, fsyncs and
+    snapshots happen on other threads; a mutation is applied at once and returns once it is logged.
+
+    Only mutations are logged: a value changed in place after `get` and not saved again is lost on
+    restart. Values come back as `codec` decodes them, so with json, tuples become lists and dict
+    keys become strings.
+    """
+
+    def __init__(self, path=DICT_PATH, snapshot_interval=DICT_SNAPSHOT_INTERVAL, codec: Optional[ValueCodec] = None):
         self.values = {}
+        self.expires = {}  # key -> time.monotonic() deadline
+
+        self.journal = Journal(path, codec or default_codec(), fsync=DICT_FSYNC) if path else None
+        self.snapshot_interval = snapshot_interval
+        self._snapshotter: Optional[asyncio.Task] = None
+        self._snapshotting: Optional[asyncio.Future] = None  # snapshot being written by a thread
+
+    async def _setup(self):
+        if not self.journal:
+            return
+        entries = await asyncio.get_event_loop().run_in_executor(None, self.journal.load)
+        now, monotonic = time.time(), time.monotonic()
+        for key, (value, expires) in entries.items():
+            self.values[key] = value
+            if expires is not None:
+                self.expires[key] = monotonic + expires - now
+        self._snapshotter = asyncio.ensure_future(self._snapshot_periodically())
+
+    async def _close(self):
+        if not self.journal:
+            return
+        if self._snapshotter:
+            self._snapshotter.cancel()
+            await asyncio.gather(self._snapshotter, return_exceptions=True)
+            self._snapshotter = None
+        await self.snapshot()
+        await asyncio.get_event_loop().run_in_executor(None, self.journal.close)
+
+    async def snapshot(self):
+        """Compact the log into a new snapshot, written off the event loop. Durable mode only."""
+        while self._snapshotting:
+            await asyncio.wait([self._snapshotting])
+
+        generation = self.journal.rotate()
+        entries = [(key, self.values[key], self._deadline(key)) for key in list(self.values) if self._live(key)]
+        # until it's written, _append_to_list copies lists rather than extend ones being encoded
+        future = self._snapshotting = asyncio.get_event_loop().run_in_executor(
+            None, self.journal.snapshot, generation, entries)
+        future.add_done_callback(self._snapshot_done)
+        await asyncio.shield(future)
+
+    def _snapshot_done(self, future: asyncio.Future):
+        self._snapshotting = None
+
+    async def _snapshot_periodically(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self.journal.log_bytes:
+                try:
+                    await self.snapshot()
+                except Exception as e:
+                    log.error(f'could not snapshot memory to {self.journal.path}: {e}')
+
+    def _deadline(self, key) -> Optional[float]:
+        """`key`'s expiry as a wall-clock time, for the journal."""
+        if key not in self.expires:
+            return None
+        return time.time() + self.expires[key] - time.monotonic()
+
+    def _journal(self, *records: list) -> Awaitable:
+        """Log `records`; await the result, after applying the change, for them to be written."""
+        # encoded before the change is applied, so a value that can't be encoded changes nothing
+        if self.journal:
+            return asyncio.wrap_future(self.journal.write(list(records)))
+        return _UNLOGGED
+
+    def _live(self, key) -> bool:
+        """Whether `key` holds a value, dropping it first if it has expired."""
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            del self.expires[key]
+            self.values.pop(key, None)
+        return key in self.values
 
     async def _save(self, key, value):
+        written = self._journal(['s', key, value, None])
         self.values[key] = value
+        self.expires.pop(key, None)
+        await written
 
     async def _get(self, key, default):
-        return self.values.get(key, default)
+        return self.values[key] if self._live(key) else default
+
+    async def _get_many(self, keys, default):
+        return {key: self.values[key] if self._live(key) else default for key in keys}
+
+    async def _save_many(self, values):
+        written = self._journal(*(['s', key, value, None] for key, value in values.items()))
+        self.values.update(values)
+        for key in values:
+            self.expires.pop(key, None)
+        await written
+
+    async def _delete_many(self, keys):
+        deleted = [key for key in dict.fromkeys(keys) if self._live(key)]
+        written = self._journal(*(['d', key] for key in deleted))
+        for key in deleted:
+            del self.values[key]
+            self.expires.pop(key, None)
+        await written
+        return len(deleted)
+
+    async def _scan(self, prefix, page_size):
+        keys = [key for key in self.values if key.startswith(prefix)]
+        for start in range(0, len(keys), page_size):
+            page = [(key, self.values[key]) for key in keys[start:start + page_size] if self._live(key)]
+            if page:
+                yield page
+
+    async def _incr(self, key, amount):
+        value = self.values[key] if self._live(key) else 0
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise TypeError(f'`{key}` does not hold an int')
+        written = self._journal(['s', key, value + amount, self._deadline(key)])
+        self.values[key] = value + amount
+        await written
+        return value + amount
+
+    async def _compare_and_set(self, key, expected, value):
+        if (self.values[key] if self._live(key) else None) != expected:
+            return False
+        await self._save(key, value)
+        return True
+
+    async def _getset(self, key, value):
+        previous = self.values[key] if self._live(key) else None
+        await self._save(key, value)
+        return previous
+
+    async def _append_to_list(self, key, values):
+        if not self._live(key):
+            await self._save(key, list(values))
+        elif not isinstance(self.values[key], list):
+            raise TypeError(f'`{key}` does not hold a list')
+        else:
+            written = self._journal(['a', key, values])
+            if self._snapshotting:
+                self.values[key] = self.values[key] + values
+            else:
+                self.values[key].extend(values)
+            length = len(self.values[key])
+            await written
+            return length
+        return len(values)
+
+    async def _set_if_absent(self, key, value, ttl):
+        if self._live(key):
+            return False
+        written = self._journal(['s', key, value, time.time() + ttl if ttl else None])
+        self.values[key] = value
+        self.expires.pop(key, None)
+        if ttl:
+            self.expires[key] = time.monotonic() + ttl
+        await written
+        return True
+
+    async def _expire(self, key, ttl):
+        if not self._live(key):
+            return False
+        written = self._journal(['e', key, None if ttl is None else time.time() + ttl])
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl
+        await written
+        return True
 
 
 class MemoryRedis(Memory):
-    """Redis storage."""
+    """Redis storage, over a shared pool of asyncio connections.
+
+    Configured with REDIS_URL, or REDIS_HOST / REDIS_PORT / REDIS_DB; pass `client` to use an
+    existing `redis.asyncio.Redis` (or a stand-in, like fakeredis) instead. Values are encoded
+    with `codec` (see MEMORY_CODEC).
+    """
+
+    def __init__(self, client: Optional[redis.Redis] = None, codec: Optional[ValueCodec] = None):
+        self.codec = codec or default_codec()
+
+        if client is None:
+            options = dict(
+                max_connections=REDIS_POOL_SIZE,
+                timeout=REDIS_POOL_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_TIMEOUT,
+                # reconnects (with backoff) and retries the command when the connection drops
+                retry=Retry(ExponentialBackoff(cap=2, base=0.1), REDIS_RETRIES),
+                retry_on_error=[ConnectionError, TimeoutError],
+                health_check_interval=30,
+            )
+            url = os.getenv('REDIS_URL')
+            if url:
+                pool = redis.BlockingConnectionPool.from_url(url, **options)
+            else:
+                pool = redis.BlockingConnectionPool(
+                    host=os.getenv('REDIS_HOST', 'localhost'),
+                    port=int(os.getenv('REDIS_PORT', 6379)),
+                    db=int(os.getenv('REDIS_DB', 0)),
+                    **options)
+            client = redis.Redis(connection_pool=pool)
+        self.r = client
 
-    def __init__(self):
-        host = os.getenv('REDIS_HOST', 'localhost')
-        port = os.getenv('REDIS_PORT', 6379)
-        db = os.getenv('REDIS_DB', 0)
-        self.r = redis.StrictRedis(host, port, db)
+        self._cas_script = self.r.register_script(_CAS_SCRIPT)
+        self._append_script = self.r.register_script(_APPEND_SCRIPT)
+
+    async def _setup(self):
         # Test connection. Raises redis.exceptions.ConnectionError.
-        self.r.ping()
+        await self.r.ping()
+
+    async def _close(self):
+        await self.r.aclose()
 
     async def _save(self, key, value):
-        json_data = json.dumps(value)
-        self.r.set(key, json_data)
+        await self.r.set(key, self.codec.encode(value))
 
     async def _get(self, key, default=None):
-        raw_data = self.r.get(key) or default
+        return self.codec.decode(await self.r.get(key), default)
+
+    async def _get_many(self, keys, default):
+        return {key: self.codec.decode(raw_data, default) for key, raw_data in zip(keys, await self.r.mget(keys))}
+
+    async def _save_many(self, values):
+        await self.r.mset({key: self.codec.encode(value) for key, value in values.items()})
+
+    async def _delete_many(self, keys):
+        return await self.r.delete(*keys)
+
+    async def _scan(self, prefix, page_size):
+        match = re.sub(r'([*?\[\]\\])', r'\\\1', prefix) + '*'
+        cursor = None
+        while cursor != 0:
+            cursor, keys = await self.r.scan(cursor or 0, match=match, count=page_size)
+            if keys:
+                # str already if the client was made with decode_responses=True
+                page = [(key.decode('utf-8') if isinstance(key, bytes) else key, self.codec.decode(raw_data))
+                        for key, raw_data in zip(keys, await self.r.mget(keys)) if raw_data is not None]
+                if page:
+                    yield page
+
+    async def _incr(self, key, amount):
+        # ints are stored as their JSON text, which redis can increment in place
+        return await self.r.incrby(key, amount)
+
+    async def _compare_and_set(self, key, expected, value):
+        try:
+            swapped = await self._cas_script(keys=[key], args=[json.dumps(expected), self.codec.encode(value)])
+        except TypeError:
+            swapped = -1  # `expected` isn't json
+        if swapped != -1:
+            return bool(swapped)
+
+        # the stored value isn't plain json, so lua can't compare it
+        def update(current):
+            if (None if current is _MISSING else current) != expected:
+                return _MISSING, False
+            return value, True
+
+        return await self._transact(key, update)
+
+    async def _getset(self, key, value):
+        return self.codec.decode(await self.r.set(key, self.codec.encode(value), get=True))
+
+    async def _append_to_list(self, key, values):
+        if self.codec.plain_json:
+            length = await self._append_script(keys=[key], args=[', '.join(json.dumps(value) for value in values)])
+            if length != -1:
+                return length
+
+        def update(items):
+            items = [] if items is _MISSING else items
+            if not isinstance(items, list):
+                raise TypeError(f'`{key}` does not hold a list')
+            return items + values, len(items) + len(values)
+
+        return await self._transact(key, update, keep_ttl=True)
+
+    async def _transact(self, key, update: Callable[[Any], tuple], keep_ttl=False):
+        """Optimistic read-modify-write: `update(current)` returns (new value or _MISSING, result)."""
+        async with self.r.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    value, result = update(self.codec.decode(await pipe.get(key), _MISSING))
+                    if value is _MISSING:
+                        await pipe.unwatch()
+                        return result
+                    pipe.multi()
+                    pipe.set(key, self.codec.encode(value), keepttl=keep_ttl)
+                    await pipe.execute()
+                    return result
+                except WatchError:
+                    continue  # changed under us; try again with the new value
+
+    async def _set_if_absent(self, key, value, ttl):
+        return bool(await self.r.set(key, self.codec.encode(value), nx=True, px=int(ttl * 1000) if ttl else None))
+
+    async def _expire(self, key, ttl):
+        if ttl is None:
+            return bool(await self.r.persist(key)) or bool(await self.r.exists(key))
+        return bool(await self.r.pexpire(key, int(ttl * 1000)))
+
+
+# compares decoded JSON, so formatting and key order don't matter; a missing key equals null.
+# -1: the stored value is tagged (see betabot.serialization), so the caller must compare it
+_CAS_SCRIPT = """
+local function equal(a, b)
+    if type(a) ~= type(b) then return false end
+    if type(a) ~= 'table' then return a == b end
+    for k, v in pairs(a) do if not equal(v, b[k]) then return false end end
+    for k in pairs(b) do if a[k] == nil then return false end end
+    return true
+end
+
+local current = redis.call('GET', KEYS[1])
+if current and string.byte(current, 1) == 187 then return -1 end
+if current then current = cjson.decode(current) else current = cjson.null end
+if not equal(current, cjson.decode(ARGV[1])) then return 0 end
+redis.call('SET', KEYS[1], ARGV[2])
+return 1
+"""
+
+# splices the new items' JSON into the stored array's text, so existing items are never re-encoded.
+# -1: the stored value is tagged, see _CAS_SCRIPT
+_APPEND_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local updated
+if current and string.byte(current, 1) == 187 then return -1 end
+if not current then
+    updated = '[' .. ARGV[1] .. ']'
+else
+    local items = cjson.decode(current)
+    if type(items) ~= 'table' or string.sub(current, 1, 1) ~= '[' then
+        return redis.error_reply('WRONGTYPE value is not a list')
+    end
+    if next(items) == nil then
+        updated = '[' .. ARGV[1] .. ']'
+    else
+        updated = string.sub(current, 1, -2) .. ', ' .. ARGV[1] .. ']'
+    end
+end
+redis.call('SET', KEYS[1], updated, 'KEEPTTL')
+return #cjson.decode(updated)
+"""
+
+
+class MemorySqlite(Memory):
+    """Local SQLite storage, values encoded like MemoryRedis.
+
+    One connection (in WAL mode) lives on a dedicated worker thread, so the loop never blocks on
+    disk. Queries queue up for the worker; everything queued together runs in one transaction,
+    so concurrent saves share a commit. A save returns once it is committed. Atomic operations
+    read and write in a single query on that thread, so nothing can interleave.
+    """
+
+    _CREATE = ('CREATE TABLE IF NOT EXISTS memory (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL) '
+               'WITHOUT ROWID')
+    _LIVE = '(expires IS NULL OR expires > ?)'
+    _GET = f'SELECT value FROM memory WHERE key = ? AND {_LIVE}'
+    _SAVE = 'INSERT OR REPLACE INTO memory (key, value, expires) VALUES (?, ?, NULL)'
+    _UPDATE = 'INSERT INTO memory (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value'
+    _INSERT = 'INSERT OR IGNORE INTO memory (key, value, expires) VALUES (?, ?, ?)'
+    _EXPIRE = 'UPDATE memory SET expires = ? WHERE key = ?'
+    _DELETE = f'DELETE FROM memory WHERE key = ? AND {_LIVE}'
+    _PURGE = 'DELETE FROM memory WHERE key = ? AND expires <= ?'
+    _PURGE_ALL = 'DELETE FROM memory WHERE expires <= ?'
+    _MAX_VARIABLES = 500  # per `IN (...)`; sqlite's limit can be as low as 999
+
+    def __init__(self, path=SQLITE_PATH, batch_size=SQLITE_BATCH_SIZE, codec: Optional[ValueCodec] = None):
+        self.codec = codec or default_codec()
+        self.path = path
+        self.batch_size = batch_size
+        self._queries: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        self.counters = {'queries': 0, 'commits': 0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, 'queued': self._queries.qsize()}
+
+    async def _setup(self):
+        opened = asyncio.get_running_loop().create_future()
+        self._thread = threading.Thread(target=self._work, args=(opened,), name='betabot-sqlite', daemon=True)
+        self._thread.start()
+        try:
+            await opened
+        except Exception:
+            self._thread = None
+            raise
+
+    async def _close(self):
+        if self._thread:
+            await self._run(None)
+            self._thread.join()
+            self._thread = None
+
+    async def _run(self, query: Optional[Callable[[sqlite3.Connection], Any]], write=False):
+        """Run `query(connection)` on the worker thread. `None` closes the connection."""
+        future = asyncio.get_running_loop().create_future()
+        self._queries.put((query, write, future))
+        return await future
+
+    def _work(self, opened: asyncio.Future):
+        loop = opened.get_loop()
         try:
-            json_data = json.loads(raw_data)
+            connection = sqlite3.connect(self.path, cached_statements=256)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')  # WAL keeps this safe from corruption
+            connection.execute(self._CREATE)
+            if 'expires' not in [column[1] for column in connection.execute('PRAGMA table_info(memory)')]:
+                connection.execute('ALTER TABLE memory ADD COLUMN expires REAL')
+            connection.execute(self._PURGE_ALL, (time.time(),))
+            connection.commit()
         except Exception as e:
-            log.critical('Could not load json data! %s' % e)
-            return raw_data
+            loop.call_soon_threadsafe(_resolve, opened, None, e)
+            return
+        loop.call_soon_threadsafe(_resolve, opened, None, None)
+
+        closing = False
+        while not closing:
+            batch = [self._queries.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queries.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            wrote = False
+            for query, write, future in batch:
+                if query is None:
+                    closing = True
+                    results.append((future, None, None))
+                    continue
+                try:
+                    results.append((future, query(connection), None))
+                    wrote = wrote or write
+                except Exception as e:
+                    results.append((future, None, e))
+
+            if wrote:
+                try:
+                    connection.commit()
+                    self.counters['commits'] += 1
+                except Exception as e:
+                    connection.rollback()
+                    results = [(future, None, error or e) for future, _, error in results]
+
+            self.counters['queries'] += len(batch)
+            for future, result, error in results:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+
+        connection.close()
+
+    def _encode(self, value) -> Union[str, bytes]:
+        # untagged json stays TEXT, readable with the sqlite3 shell
+        data = self.codec.encode(value)
+        return data if is_tagged(data) else data.decode('utf-8')
+
+    def _read(self, connection: sqlite3.Connection, key):
+        """The decoded live value at `key` (_MISSING if none), purging it if it expired."""
+        now = time.time()
+        connection.execute(self._PURGE, (key, now))
+        rows = connection.execute(self._GET, (key, now)).fetchall()
+        return self.codec.decode(rows[0][0], _MISSING) if rows else _MISSING
+
+    async def _get(self, key, default):
+        rows = await self._run(lambda c: c.execute(self._GET, (key, time.time())).fetchall())
+        return self.codec.decode(rows[0][0] if rows else None, default)
+
+    async def _get_many(self, keys, default):
+        def query(connection):
+            rows = []
+            for start in range(0, len(keys), self._MAX_VARIABLES):
+                chunk = keys[start:start + self._MAX_VARIABLES]
+                rows.extend(connection.execute(
+                    f'SELECT key, value FROM memory WHERE key IN ({",".join("?" * len(chunk))}) AND {self._LIVE}',
+                    chunk + [time.time()]))
+            return dict(rows)
+
+        found = await self._run(query)
+        return {key: self.codec.decode(found.get(key), default) for key in keys}
+
+    async def _save(self, key, value):
+        await self._save_many({key: value})
+
+    async def _save_many(self, values):
+        rows = [(key, self._encode(value)) for key, value in values.items()]
+        await self._run(lambda c: c.executemany(self._SAVE, rows), write=True)
+
+    async def _delete_many(self, keys):
+        def query(connection):
+            now = time.time()
+            deleted = connection.executemany(self._DELETE, [(key, now) for key in keys]).rowcount
+            connection.executemany(self._PURGE, [(key, now) for key in keys])
+            return deleted
+
+        return await self._run(query, write=True)
+
+    async def _scan(self, prefix, page_size):
+        # keyset pagination over the primary key: every page is an index range scan
+        last, first = prefix, True
+        upper = prefix + '\U0010ffff' if prefix else None
+        while True:
+            # the first page may start with the prefix itself; later ones start after the last key seen
+            query = f'SELECT key, value FROM memory WHERE key {">=" if first else ">"} ?'
+            params = [last]
+            if upper:
+                query += ' AND key < ?'
+                params.append(upper)
+            query += f' AND {self._LIVE} ORDER BY key LIMIT ?'
+            params += [time.time(), page_size]
+
+            rows = await self._run(lambda c: c.execute(query, params).fetchall())
+            if not rows:
+                return
+            yield [(key, self.codec.decode(value)) for key, value in rows]
+            if len(rows) < page_size:
+                return
+            last, first = rows[-1][0], False
+
+    async def _incr(self, key, amount):
+        def query(connection):
+            value = self._read(connection, key)
+            value = 0 if value is _MISSING else value
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TypeError(f'`{key}` does not hold an int')
+            connection.execute(self._UPDATE, (key, self._encode(value + amount)))
+            return value + amount
+
+        return await self._run(query, write=True)
+
+    async def _compare_and_set(self, key, expected, value):
+        def query(connection):
+            current = self._read(connection, key)
+            if (None if current is _MISSING else current) != expected:
+                return False
+            connection.execute(self._SAVE, (key, self._encode(value)))
+            return True
+
+        return await self._run(query, write=True)
+
+    async def _getset(self, key, value):
+        def query(connection):
+            previous = self._read(connection, key)
+            connection.execute(self._SAVE, (key, self._encode(value)))
+            return None if previous is _MISSING else previous
+
+        return await self._run(query, write=True)
+
+    async def _append_to_list(self, key, values):
+        def query(connection):
+            items = self._read(connection, key)
+            items = [] if items is _MISSING else items
+            if not isinstance(items, list):
+                raise TypeError(f'`{key}` does not hold a list')
+            items.extend(values)
+            connection.execute(self._UPDATE, (key, self._encode(items)))
+            return len(items)
+
+        return await self._run(query, write=True)
+
+    async def _set_if_absent(self, key, value, ttl):
+        def query(connection):
+            now = time.time()
+            connection.execute(self._PURGE, (key, now))
+            return connection.execute(
+                self._INSERT, (key, self._encode(value), now + ttl if ttl else None)).rowcount == 1
+
+        return await self._run(query, write=True)
+
+    async def _expire(self, key, ttl):
+        def query(connection):
+            now = time.time()
+            connection.execute(self._PURGE, (key, now))
+            return connection.execute(self._EXPIRE, (now + ttl if ttl is not None else None, key)).rowcount == 1
+
+        return await self._run(query, write=True)
+
+
+def _resolve(future: asyncio.Future, result, error: Optional[BaseException]):
+    if future.done():
+        return  # cancelled while queued
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class MemoryCached(Memory):
+    """Read-through LRU + TTL cache in front of another memory backend.
+
+    Writes go through to the backend before updating the cache. Missing keys are cached too, but a
+    read doesn't cache what it fetched if the key was written or invalidated while it was on its way.
+    Cached values are shared, as with MemoryDict: don't mutate what `get` returns without saving it.
+    Atomic operations run on the backend; keys they touch are refreshed or dropped locally. TTLs set
+    through this cache are honoured locally; one set elsewhere can be outlived by up to `ttl`.
+    With `invalidation='pubsub'` (MemoryRedis backends only), every write is announced on a
+    Redis channel and the other replicas drop those keys.
+    """
+
+    def __init__(self, backend: Memory, max_keys=CACHE_MAX_KEYS, ttl=CACHE_TTL, invalidation=CACHE_INVALIDATION):
+        if invalidation and not isinstance(backend, MemoryRedis):
+            raise ValueError(f'cache invalidation `{invalidation}` needs a redis backend')
+
+        self.backend = backend
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.invalidation = invalidation
+
+        self._cache: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (expires, value), least recent first
+        self._deadlines: Dict[str, float] = {}  # backend TTLs set through us, as time.monotonic() deadlines
+        # keys being read from the backend: reads in flight, and writes since the first of them began
+        self._fetching: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+        self._id = uuid.uuid4().hex  # to ignore our own invalidations
+        self._subscriber: Optional[asyncio.Task] = None
+
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            **self.counters,
+            'keys': len(self._cache),
+            'hit_rate': self.counters['hits'] / lookups if lookups else 0.0,
+        }
+
+    def _lookup(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            self.counters['misses'] += 1
+            return _MISSING
+
+        expires, value = entry
+        if expires and expires < time.monotonic():
+            del self._cache[key]
+            self.counters['expirations'] += 1
+            self.counters['misses'] += 1
+            return _MISSING
+
+        self._cache.move_to_end(key)
+        self.counters['hits'] += 1
+        return value
+
+    def _begin_fetch(self, keys: List[str]) -> Dict[str, int]:
+        for key in keys:
+            self._fetching[key] = self._fetching.get(key, 0) + 1
+        return {key: self._generations.get(key, 0) for key in keys}
+
+    def _end_fetch(self, generations: Dict[str, int], values: Optional[Dict[str, Any]]):
+        """Cache what a read fetched (None: it failed), unless the key was written while it was on its way."""
+        for key, generation in generations.items():
+            if values is not None and self._generations.get(key, 0) == generation:
+                self._store(key, values[key])
+            self._fetching[key] -= 1
+            if not self._fetching[key]:
+                del self._fetching[key]
+                self._generations.pop(key, None)
+
+    def _changed(self, keys: Iterable[str]):
+        """`keys` were written or invalidated: reads of them already on their way must not cache what they get."""
+        for key in keys:
+            if key in self._fetching:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        expires = now + self.ttl if self.ttl else 0
+        deadline = self._deadlines.get(key)
+        if deadline is not None:
+            if deadline <= now:
+                del self._deadlines[key]
+            else:
+                expires = min(expires, deadline) if expires else deadline
+
+        self._cache[key] = (expires, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_keys:
+            evicted, _ = self._cache.popitem(last=False)
+            self._deadlines.pop(evicted, None)
+            self.counters['evictions'] += 1
+
+    async def _setup(self):
+        await self.backend.setup()
+        if self.invalidation == 'pubsub':
+            self._subscriber = asyncio.ensure_future(self._subscribe())
+
+    async def _close(self):
+        if self._subscriber:
+            self._subscriber.cancel()
+            await asyncio.gather(self._subscriber, return_exceptions=True)
+            self._subscriber = None
+        await self.backend.close()
+
+    async def _get(self, key, default):
+        value = self._lookup(key)
+        if value is _MISSING:
+            generations, fetched = self._begin_fetch([key]), None
+            try:
+                value = await self.backend._get(key, _MISSING)
+                fetched = {key: value}
+            finally:
+                self._end_fetch(generations, fetched)
+        return default if value is _MISSING else value
+
+    async def _get_many(self, keys, default):
+        values = {key: self._lookup(key) for key in keys}
+        misses = [key for key, value in values.items() if value is _MISSING]
+        if misses:
+            generations, fetched = self._begin_fetch(misses), None
+            try:
+                fetched = await self.backend._get_many(misses, _MISSING)
+            finally:
+                self._end_fetch(generations, fetched)
+            values.update(fetched)
+        return {key: default if value is _MISSING else value for key, value in values.items()}
+
+    async def _save(self, key, value):
+        await self.backend._save(key, value)
+        self._deadlines.pop(key, None)
+        self._store(key, value)
+        await self._invalidate([key])
+
+    async def _save_many(self, values):
+        await self.backend._save_many(values)
+        for key, value in values.items():
+            self._deadlines.pop(key, None)
+            self._store(key, value)
+        await self._invalidate(list(values))
+
+    async def _delete_many(self, keys):
+        deleted = await self.backend._delete_many(keys)
+        for key in keys:
+            self._deadlines.pop(key, None)
+            self._store(key, _MISSING)
+        await self._invalidate(keys)
+        return deleted
+
+    async def _scan(self, prefix, page_size):
+        # straight from the backend: a scan would only churn the LRU
+        async for page in self.backend._scan(prefix, page_size):
+            yield page
+
+    async def _incr(self, key, amount):
+        value = await self.backend._incr(key, amount)
+        self._store(key, value)
+        await self._invalidate([key])
+        return value
+
+    async def _compare_and_set(self, key, expected, value):
+        swapped = await self.backend._compare_and_set(key, expected, value)
+        if swapped:
+            self._deadlines.pop(key, None)
+            self._store(key, value)
+            await self._invalidate([key])
+        else:
+            self._changed([key])
+            self._cache.pop(key, None)  # ours was probably stale
+        return swapped
+
+    async def _getset(self, key, value):
+        previous = await self.backend._getset(key, value)
+        self._deadlines.pop(key, None)
+        self._store(key, value)
+        await self._invalidate([key])
+        return previous
+
+    async def _append_to_list(self, key, values):
+        length = await self.backend._append_to_list(key, values)
+        self._cache.pop(key, None)
+        await self._invalidate([key])
+        return length
+
+    async def _set_if_absent(self, key, value, ttl):
+        saved = await self.backend._set_if_absent(key, value, ttl)
+        if saved:
+            self._set_deadline(key, ttl)
+            self._store(key, value)
+            await self._invalidate([key])
+        else:
+            self._changed([key])
+            self._cache.pop(key, None)
+        return saved
+
+    async def _expire(self, key, ttl):
+        exists = await self.backend._expire(key, ttl)
+        self._set_deadline(key, ttl)
+        self._changed([key])
+        self._cache.pop(key, None)
+        return exists
+
+    def _set_deadline(self, key, ttl: Optional[float]):
+        if ttl:
+            self._deadlines[key] = time.monotonic() + ttl
+        else:
+            self._deadlines.pop(key, None)
+
+    async def _invalidate(self, keys: List[str]):
+        self._changed(keys)
+        if self.invalidation == 'pubsub':
+            await self.backend.r.publish(CACHE_INVALIDATION_CHANNEL, json.dumps({'from': self._id, 'keys': keys}))
+
+    async def _subscribe(self):
+        while True:
+            pubsub = self.backend.r.pubsub()
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                # anything written while we weren't listening may be stale
+                self._changed(list(self._fetching))
+                self._cache.clear()
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    data = json.loads(message['data'])
+                    if data['from'] == self._id:
+                        continue
+                    self._changed(data['keys'])
+                    for key in data['keys']:
+                        if self._cache.pop(key, None) is not None:
+                            self.counters['invalidations'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f'cache invalidation subscriber failed, retrying: {e}')
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+class MemoryBuffered(Memory):
+    """Write-behind buffer in front of another memory backend.
+
+    Saves land in an in-process dict, so repeated saves of a key between flushes cost one write.
+    The buffer is flushed to the backend with `save_many` every `interval` seconds, as soon as
+    `max_keys` keys are pending, and on `close()`. Reads see pending writes. Deletes are not
+    buffered. Writes still pending when the process dies are lost.
+    """
+
+    def __init__(self, backend: Memory, interval=WRITE_BEHIND_INTERVAL, max_keys=WRITE_BEHIND_MAX_KEYS):
+        self.backend = backend
+        self.interval = interval
+        self.max_keys = max_keys
+
+        self._pending: Dict[str, Any] = {}
+        self._flushing: Dict[str, Any] = {}  # the batch being written; still visible to reads
+        self._lock = asyncio.Lock()  # one flush (or delete) at a time, so batches land in order
+        self._full = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+        self.counters = {'saves': 0, 'coalesced': 0, 'flushes': 0, 'flushed_keys': 0, 'failures': 0}
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, 'pending': len(self._pending) + len(self._flushing)}
+
+    async def _setup(self):
+        await self.backend.setup()
+        self._flusher = asyncio.ensure_future(self._flush_periodically())
+
+    async def _close(self):
+        if self._flusher:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        if self._pending:
+            log.error(f'closing memory with {len(self._pending)} unwritten keys')
+        await self.backend.close()
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything pending to the backend."""
+        async with self._lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self.backend._save_many(self._flushing)
+                self.counters['flushes'] += 1
+                self.counters['flushed_keys'] += len(self._flushing)
+            except Exception as e:
+                # keep the batch for the next flush, under anything saved since
+                log.error(f'could not flush {len(self._flushing)} keys, will retry: {e}')
+                self.counters['failures'] += 1
+                self._pending = {**self._flushing, **self._pending}
+            finally:
+                self._flushing = {}
+
+    def _buffered(self, key):
+        if key in self._pending:
+            return self._pending[key]
+        return self._flushing.get(key, _MISSING)
+
+    async def _get(self, key, default):
+        value = self._buffered(key)
+        return await self.backend._get(key, default) if value is _MISSING else value
+
+    async def _get_many(self, keys, default):
+        values = {key: self._buffered(key) for key in keys}
+        misses = [key for key, value in values.items() if value is _MISSING]
+        if misses:
+            values.update(await self.backend._get_many(misses, default))
+        return values
+
+    async def _save(self, key, value):
+        await self._save_many({key: value})
+
+    async def _save_many(self, values):
+        for key, value in values.items():
+            self.counters['saves'] += 1
+            if key in self._pending:
+                self.counters['coalesced'] += 1
+            self._pending[key] = value
+        if len(self._pending) >= self.max_keys:
+            self._full.set()
+
+    async def _flush_key(self, key):
+        """Write `key`'s pending value, after any flush in progress. Atomic operations on it go next."""
+        async with self._lock:
+            if key in self._pending:
+                value = self._pending.pop(key)
+                try:
+                    await self.backend._save(key, value)
+                except Exception:
+                    self._pending.setdefault(key, value)
+                    raise
+
+    async def _incr(self, key, amount):
+        await self._flush_key(key)
+        return await self.backend._incr(key, amount)
+
+    async def _compare_and_set(self, key, expected, value):
+        await self._flush_key(key)
+        return await self.backend._compare_and_set(key, expected, value)
+
+    async def _getset(self, key, value):
+        await self._flush_key(key)
+        return await self.backend._getset(key, value)
+
+    async def _append_to_list(self, key, values):
+        await self._flush_key(key)
+        return await self.backend._append_to_list(key, values)
+
+    async def _set_if_absent(self, key, value, ttl):
+        await self._flush_key(key)
+        return await self.backend._set_if_absent(key, value, ttl)
+
+    async def _expire(self, key, ttl):
+        await self._flush_key(key)
+        return await self.backend._expire(key, ttl)
+
+    async def _delete_many(self, keys):
+        async with self._lock:  # or a flush in progress could write a key back after we delete it
+            buffered = [key for key in keys if self._pending.pop(key, _MISSING) is not _MISSING]
+            deleted = await self.backend._delete_many([key for key in keys if key not in buffered])
+            if buffered:
+                await self.backend._delete_many(buffered)
+            return deleted + len(buffered)
+
+    async def _scan(self, prefix, page_size):
+        await self.flush()
+        async for page in self.backend._scan(prefix, page_size):
+            yield page
+
+
+class MemoryNamespace(Memory):
+    """A view of the keys under `name:` in another memory, from `memory.namespace(name)`.
+
+    Keys are prefixed on the way in and stripped on the way out, so scripts sharing a backend can't
+    clobber each other's keys. Views are cheap; the underlying memory owns setup and close.
+    """
+
+    SEPARATOR = ':'
+
+    def __init__(self, memory: Memory, name: str):
+        self.memory = memory
+        self.name = name
+        self.prefix = f'{name}{self.SEPARATOR}'
+
+    def _key(self, key):
+        return f'{self.prefix}{key}'
+
+    async def _get(self, key, default):
+        return await self.memory._get(self._key(key), default)
+
+    async def _save(self, key, value):
+        await self.memory._save(self._key(key), value)
+
+    async def _get_many(self, keys, default):
+        values = await self.memory._get_many([self._key(key) for key in keys], default)
+        return {key: values[self._key(key)] for key in keys}
+
+    async def _save_many(self, values):
+        await self.memory._save_many({self._key(key): value for key, value in values.items()})
+
+    async def _delete_many(self, keys):
+        return await self.memory._delete_many([self._key(key) for key in keys])
+
+    async def _scan(self, prefix, page_size):
+        async for page in self.memory._scan(self._key(prefix), page_size):
+            yield [(key[len(self.prefix):], value) for key, value in page]
+
+    async def _incr(self, key, amount):
+        return await self.memory._incr(self._key(key), amount)
+
+    async def _compare_and_set(self, key, expected, value):
+        return await self.memory._compare_and_set(self._key(key), expected, value)
+
+    async def _getset(self, key, value):
+        return await self.memory._getset(self._key(key), value)
+
+    async def _append_to_list(self, key, values):
+        return await self.memory._append_to_list(self._key(key), values)
+
+    async def _set_if_absent(self, key, value, ttl):
+        return await self.memory._set_if_absent(self._key(key), value, ttl)
+
+    async def _expire(self, key, ttl):
+        return await self.memory._expire(self._key(key), ttl)
+
+
+MEMORY_TYPES = {
+    'dict': MemoryDict,
+    'redis': MemoryRedis,
+    'sqlite': MemorySqlite,
+}
+
+WRAPPERS = {
+    'cached': MemoryCached,
+    'buffered': MemoryBuffered,
+}
+
+
+def get_memory(memory_type: str) -> Memory:
+    """Build the memory for a `--memory` type, e.g. `redis`, `cached+redis` or `cached+buffered+redis`.
+
+    Raises ValueError for unknown types.
+    """
+    *wrappers, backend = memory_type.split('+')
+    if backend not in MEMORY_TYPES or any(wrapper not in WRAPPERS for wrapper in wrappers):
+        raise ValueError(f'memory type "{memory_type}" is not available.')
 
-        return json_data
+    memory = MEMORY_TYPES[backend]()
+    for wrapper in reversed(wrappers):
+        memory = WRAPPERS[wrapper](memory)
+    return memory
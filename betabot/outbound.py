@@ -0,0 +1,238 @@
+"""
+Outbound Slack Web API scheduling
+
+Every call waits for a token from its method's bucket, sized from Slack's rate limit tier
+(https://api.slack.com/docs/rate-limits), and message posts also from their channel's bucket
+(about one message per second, with short bursts). Waiting calls are queued per channel (or per
+method, for calls not aimed at a channel) and released round-robin across queues, so one busy
+channel can't starve the rest. A 429 pauses that queue for its Retry-After, and the call is retried.
+"""
+import asyncio
+from collections import OrderedDict, deque
+import itertools
+import logging
+import os
+import time
+from typing import Any, Deque, Dict, NamedTuple, Optional
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+LOG = logging.getLogger(__name__)
+
+# messages per second to one channel, and how many may go out back to back
+OUTBOUND_CHANNEL_RATE = float(os.getenv('OUTBOUND_CHANNEL_RATE', 1))
+OUTBOUND_CHANNEL_BURST = int(os.getenv('OUTBOUND_CHANNEL_BURST', 3))
+# times a call is retried after a 429
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+
+# requests per minute, per method
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+DEFAULT_TIER = 3
+METHOD_TIERS = {
+    'auth.test': 4,
+    'chat.delete': 3,
+    'chat.update': 3,
+    'conversations.history': 3,
+    'conversations.info': 3,
+    'conversations.list': 2,
+    'conversations.members': 4,
+    'conversations.open': 3,
+    'conversations.replies': 3,
+    'files.upload': 2,
+    'reactions.add': 3,
+    'reactions.get': 3,
+    'reactions.remove': 2,
+    'team.info': 3,
+    'users.info': 4,
+    'users.list': 2,
+    'users.lookupByEmail': 3,
+    'views.open': 4,
+    'views.publish': 4,
+    'views.update': 4,
+}
+# limited per channel instead of by tier
+CHANNEL_METHODS = {'chat.postMessage', 'chat.postEphemeral', 'chat.meMessage'}
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Waiting(NamedTuple):
+    method: str
+    channel: Optional[str]
+    future: asyncio.Future
+    queued: float
+
+
+class OutboundScheduler(object):
+    """Releases Web API calls as fast as their rate limits allow, fairly across channels."""
+
+    def __init__(self, channel_rate=OUTBOUND_CHANNEL_RATE, channel_burst=OUTBOUND_CHANNEL_BURST,
+                 tier_rates: Optional[Dict[int, float]] = None):
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.tier_rates = tier_rates or TIER_RATES
+
+        self._queues: 'OrderedDict[str, Deque[_Waiting]]' = OrderedDict()  # in round-robin order
+        self._method_buckets: Dict[str, TokenBucket] = {}
+        self._channel_buckets: Dict[str, TokenBucket] = {}
+        self._paused: Dict[str, float] = {}  # queue -> monotonic time a Retry-After ends
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+        self.counters = {'sent': 0, 'rate_limited': 0}
+        self._waits: Deque[float] = deque(maxlen=1000)  # seconds recent calls spent queued
+
+    @staticmethod
+    def _queue_key(method: str, channel: Optional[str]) -> str:
+        return channel if channel and method in CHANNEL_METHODS else f'method:{method}'
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        percentile = lambda p: waits[min(len(waits) - 1, int(p * len(waits)))] if waits else 0.0  # noqa: E731
+        return {
+            **self.counters,
+            'queued': sum(len(queue) for queue in self._queues.values()),
+            'queues': len(self._queues),
+            'wait_p50': percentile(0.5),
+            'wait_p95': percentile(0.95),
+            'wait_max': waits[-1] if waits else 0.0,
+        }
+
+    async def acquire(self, method: str, channel: Optional[str] = None):
+        """Wait until a call to `method` (posting to `channel`) may be sent."""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        key = self._queue_key(method, channel)
+        self._queues.setdefault(key, deque()).append(_Waiting(method, channel, future, time.monotonic()))
+        self._wakeup.set()
+        await future
+
+    def throttle(self, method: str, channel: Optional[str], retry_after: float):
+        """Hold calls like this one for `retry_after` seconds, after Slack answered 429."""
+        key = self._queue_key(method, channel)
+        self._paused[key] = max(self._paused.get(key, 0), time.monotonic() + retry_after)
+        self.counters['rate_limited'] += 1
+        LOG.warning(f'rate limited on {method} ({key}), holding it for {retry_after}s')
+
+    def _method_bucket(self, method: str) -> Optional[TokenBucket]:
+        if method in CHANNEL_METHODS:
+            return None
+        if method not in self._method_buckets:
+            per_minute = self.tier_rates[METHOD_TIERS.get(method, DEFAULT_TIER)]
+            self._method_buckets[method] = TokenBucket(per_minute / 60, per_minute)
+        return self._method_buckets[method]
+
+    def _channel_bucket(self, key: str) -> TokenBucket:
+        if key not in self._channel_buckets:
+            self._channel_buckets[key] = TokenBucket(self.channel_rate, self.channel_burst)
+        return self._channel_buckets[key]
+
+    def _delay(self, key: str, waiting: _Waiting, now: float) -> float:
+        delay = self._paused.get(key, 0) - now
+        bucket = self._method_bucket(waiting.method)
+        if bucket:
+            delay = max(delay, bucket.delay(now))
+        else:
+            delay = max(delay, self._channel_bucket(key).delay(now))
+        return delay
+
+    def _release(self, key: str, waiting: _Waiting, now: float):
+        bucket = self._method_bucket(waiting.method) or self._channel_bucket(key)
+        bucket.take(now)
+        self._paused.pop(key, None)
+        waiting.future.set_result(None)
+        self.counters['sent'] += 1
+        self._waits.append(now - waiting.queued)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            released = False
+            next_delay = None
+            # one call per queue per pass: round-robin across channels
+            for key in list(self._queues):
+                queue = self._queues[key]
+                while queue and queue[0].future.done():  # the caller gave up
+                    queue.popleft()
+                if not queue:
+                    del self._queues[key]
+                    continue
+
+                delay = self._delay(key, queue[0], now)
+                if delay <= 0:
+                    self._release(key, queue.popleft(), now)
+                    self._queues.move_to_end(key)
+                    released = True
+                else:
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+
+            if released:
+                await asyncio.sleep(0)  # let released calls go out before the next pass
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), next_delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        for queue in self._queues.values():
+            for waiting in queue:
+                waiting.future.cancel()
+        self._queues.clear()
+
+
+def _channel_of(kwargs: Dict[str, Any]) -> Optional[str]:
+    for args in (kwargs.get('json'), kwargs.get('data'), kwargs.get('params')):
+        if isinstance(args, dict) and args.get('channel'):
+            return args['channel']
+    return None
+
+
+class ScheduledWebClient(AsyncWebClient):
+    """An AsyncWebClient whose calls wait their turn with `scheduler`, and are retried after a 429."""
+
+    def __init__(self, *args, scheduler: OutboundScheduler, max_retries=OUTBOUND_MAX_RETRIES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def api_call(self, api_method: str, **kwargs):
+        channel = _channel_of(kwargs)
+        for attempt in itertools.count():
+            await self.scheduler.acquire(api_method, channel)
+            try:
+                return await super().api_call(api_method, **kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= self.max_retries:
+                    raise
+                headers = {name.lower(): value for name, value in (e.response.headers or {}).items()}
+                self.scheduler.throttle(api_method, channel, float(headers.get('retry-after', 1)))
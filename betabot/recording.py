@@ -0,0 +1,272 @@
+"""
+Event recording and replay
+
+`EventRecorder` captures the raw payload of every incoming request as gzipped, rotating JSONL.
+`start_replay` (the `betabot-replay` command) pushes a recording back through a bot's
+bolt app, with `say`/`respond` stubbed out, and reports throughput and handler latency.
+With `--intents` it also batch-classifies the recording's messages against the learned sentences.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import statistics
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from slack_bolt.request.async_request import AsyncBoltRequest
+
+LOG = logging.getLogger(__name__)
+
+RECORD_MAX_BYTES = 64 * 1024 * 1024
+
+
+class EventRecorder(object):
+    """Append raw request bodies to `events-<time>.jsonl.gz` files in `directory`.
+
+    A file is rotated once `max_bytes` of (uncompressed) JSON has been written to it;
+    only the newest `max_files` are kept, if set. The first line of every file records
+    the bot's identity so replays can recognize mentions of it.
+
+    Compression and disk writes happen on a writer thread, so recording adds no I/O to dispatch;
+    `close` waits for everything queued to be written.
+    """
+
+    def __init__(self, directory: str, bot_identity: Dict[str, str], max_bytes=RECORD_MAX_BYTES, max_files=0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.bot_identity = bot_identity
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+        self._file = None
+        self._written = 0
+        self._rotations = 0
+        self._lines: queue.Queue = queue.Queue()  # None: stop
+        self._thread: Optional[threading.Thread] = None
+
+    def write(self, body: Dict[str, Any]):
+        """Queue `body` for the writer thread. It's serialized now, so later changes to it aren't recorded."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work, name='betabot-recorder', daemon=True)
+            self._thread.start()
+        self._lines.put(json.dumps({'t': time.time(), 'body': body}) + '\n')
+
+    def close(self):
+        """Write everything queued, then close the file. Blocking."""
+        if self._thread is not None:
+            self._lines.put(None)
+            self._thread.join()
+            self._thread = None
+        self._close_file()
+
+    def _work(self):
+        while True:
+            line = self._lines.get()
+            if line is None:
+                return
+            try:
+                if self._file is None or self._written >= self.max_bytes:
+                    self._rotate()
+                self._file.write(line)
+                self._written += len(line)
+            except Exception as e:
+                LOG.error(f'could not record an event: {e}')
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        self._close_file()
+
+        path = self.directory / f'events-{time.strftime("%Y%m%d-%H%M%S")}-{self._rotations:04d}.jsonl.gz'
+        LOG.info(f'recording events to {path}')
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._file.write(json.dumps({'bot': self.bot_identity}) + '\n')
+        self._written = 0
+        self._rotations += 1
+
+        if self.max_files:
+            for old in sorted(self.directory.glob('events-*.jsonl*'))[:-self.max_files]:
+                LOG.debug(f'removing old recording {old}')
+                old.unlink()
+
+
+def read_recording(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Yield recorded lines from files and/or directories of recordings, oldest first."""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob('events-*.jsonl*')) if path.is_dir() else [path])
+
+    for path in files:
+        opener = gzip.open if path.suffix == '.gz' else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))]
+
+
+class Replay(object):
+    """Dispatch recorded requests to `bot` and collect handler timings."""
+
+    def __init__(self, bot, realtime=False):
+        self.bot = bot
+        self.realtime = realtime
+        self.latencies: List[float] = []
+        self.dispatched = 0
+        self.replies = 0
+
+        bot._handler_observers.append(self._observe)
+
+    def _observe(self, func: Callable, seconds: float):
+        self.latencies.append(seconds)
+
+    async def _stub_reply(self, *args, **kwargs):
+        self.replies += 1
+        return {'ok': True}
+
+    async def run(self, lines: Iterator[Dict[str, Any]], drain_timeout: float = 10) -> Dict[str, Any]:
+        started = time.perf_counter()
+        first_t: Optional[float] = None
+        background = asyncio.all_tasks()  # e.g. memory flushers, which never finish
+
+        for line in lines:
+            if 'bot' in line:
+                # identity header: make mentions of the recorded bot count as direct
+                self.bot._user = line['bot'].get('user') or self.bot._user
+                self.bot._user_id = line['bot'].get('user_id') or self.bot._user_id
+                self.bot._compile_mention_regex()
+                continue
+
+            if self.realtime:
+                first_t = line['t'] if first_t is None else first_t
+                delay = (line['t'] - first_t) - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            body = line['body']
+            if 'event_time' in body:
+                body['event_time'] = int(time.time())  # or else it is dropped as too old
+
+            request = AsyncBoltRequest(
+                mode='socket_mode',
+                body=body,
+                context={'say': self._stub_reply, 'respond': self._stub_reply},
+            )
+            await self.bot._bolt_app.async_dispatch(request)
+            self.dispatched += 1
+
+        # handlers run as their own tasks (and may start more); let them finish before taking the time
+        deadline = time.perf_counter() + drain_timeout
+        pending = asyncio.all_tasks() - background
+        while pending and time.perf_counter() < deadline:
+            await asyncio.wait(pending, timeout=deadline - time.perf_counter())
+            pending = asyncio.all_tasks() - background
+
+        elapsed = time.perf_counter() - started
+        latencies = sorted(self.latencies)
+        return {
+            **{f'executor_{k}': v for k, v in self.bot.executor.counters.items()},
+            'events': self.dispatched,
+            'handlers': len(latencies),
+            'replies': self.replies,
+            'seconds': elapsed,
+            'events_per_second': self.dispatched / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        }
+
+
+async def classify_recording(bot, lines: Iterable[Dict[str, Any]], batch_size=1000) -> Dict[str, int]:
+    """Count the recorded messages by the learned function they would be classified as."""
+    if bot._training is None:
+        return {}
+    await bot._training
+    if bot._classifier is None:
+        return {}
+
+    texts = [bot._mention_regex.sub(' ', line['body']['event']['text']) for line in lines
+             if line.get('body', {}).get('event', {}).get('text')]
+
+    counts: Dict[str, int] = {}
+    loop = asyncio.get_running_loop()
+    for start in range(0, len(texts), batch_size):
+        results = await loop.run_in_executor(None, bot._classifier.classify_batch, texts[start:start + batch_size])
+        for label, _ in results:
+            counts[label or '(none)'] = counts.get(label or '(none)', 0) + 1
+    return counts
+
+
+parser = argparse.ArgumentParser(description='replay recorded events against betabot')
+parser.add_argument('recordings', metavar='path', nargs='+',
+                    help='Recording files or directories (see RECORD_DIR)')
+parser.add_argument('-S', '--scripts', dest='scripts', metavar='dir',
+                    action='store', default=[], nargs='+',
+                    help='Directory to fetch bot scripts. Can be specified multiple times')
+parser.add_argument('-m', '--memory', dest='memory', action='store',
+                    default='dict', help='What persistent storage to use (dict, redis, sqlite); '
+                         'prefix with cached+ for an in-process read cache and/or buffered+ for write-behind, '
+                         'e.g. cached+buffered+redis.')
+parser.add_argument('--intent', dest='intent', action='store', default=None,
+                    help='Which engine classifies messages for bot.learn (naive_bayes, vector).')
+parser.add_argument('--intents', dest='intents', action='store_true', default=False,
+                    help='Also report how the recorded messages classify against learned sentences (unthresholded).')
+parser.add_argument('--realtime', dest='realtime', action='store_true', default=False,
+                    help='Keep the original spacing between events instead of replaying as fast as possible.')
+parser.add_argument('--drain-timeout', dest='drain_timeout', type=float, default=10,
+                    help='Seconds to wait for handlers still running after the last event.')
+
+
+async def replay(args) -> Dict[str, Any]:
+    # imported here so `betabot.bots.bot` (and its scheduler) only load inside the loop
+    from betabot.bots.bot import Bot
+    from betabot.bots.botcli import BotCLI
+
+    os.environ.pop('RECORD_DIR', None)  # don't record the replay
+
+    Bot.instance = BotCLI(read_stdin=False)
+    bot = Bot.instance
+    await bot.setup(memory_type=args.memory, script_paths=[os.path.abspath(s) for s in args.scripts],
+                    intent_engine=args.intent)
+    await Bot.start(bot)
+    if bot._training is not None:
+        await bot._training  # so learned commands are dispatched as they would be in steady state
+
+    report = await Replay(bot, realtime=args.realtime).run(read_recording(args.recordings), args.drain_timeout)
+    if args.intents:
+        report['intents'] = await classify_recording(bot, read_recording(args.recordings))
+
+    await bot.shutdown()
+    return report
+
+
+def start_replay():
+    args = parser.parse_args()
+    report = asyncio.get_event_loop().run_until_complete(replay(args))
+
+    print(f"replayed {report['events']} events in {report['seconds']:.2f}s "
+          f"({report['events_per_second']:.1f} events/s); {report['handlers']} handlers ran, "
+          f"{report['replies']} replies stubbed")
+    print(f"handler latency: p50 {report['p50_ms']:.2f}ms, p95 {report['p95_ms']:.2f}ms, "
+          f"p99 {report['p99_ms']:.2f}ms (mean {report['mean_ms']:.2f}ms)")
+    for label, count in sorted(report.get('intents', {}).items(), key=lambda item: -item[1]):
+        print(f'{count:8d}  {label}')
+
+
+if __name__ == '__main__':
+    start_replay()
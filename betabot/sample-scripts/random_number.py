@@ -9,6 +9,7 @@ from betabot.classes import Event
 # invoked inside of a script-discovery code of the bot itself!
 bot = betabot.bots.bot.get_instance()
 log = logging.getLogger(__name__)
+memory = bot.memory.namespace('random_number')
 
 
 @bot.add_command('random number')
@@ -17,11 +18,11 @@ log = logging.getLogger(__name__)
      'roll the dice',
      'generatet a random number'])
 async def random_number(event: Event):
-    last_r = await bot.memory.get('random_number')
     r = random.randint(1, 10)
-    await bot.memory.save('random_number', r)
+    # one atomic swap, so concurrent rolls each see the one before them
+    last_r = await memory.getset('last', r)
 
-    await event.reply("Random number is %s" % r)
+    await event.actions.say("Random number is %s" % r)
     if last_r is not None:
         await asyncio.sleep(1)
-        await event.reply("But last time I said it was %s" % last_r)
+        await event.actions.say("But last time I said it was %s" % last_r)
@@ -0,0 +1,219 @@
+"""
+How memory backends turn values into bytes
+
+A stored value is either legacy JSON text (what MemoryRedis has always written), or a tagged
+value: a 4 byte header - 0xBB, format version, codec id, compression id - and the payload.
+0xBB can't start UTF-8 text, so both kinds can be read side by side while data migrates.
+
+Plain, uncompressed JSON is still written untagged, and ints always are (as decimal text),
+so redis INCRBY and the JSON Lua scripts keep working on them.
+"""
+import abc
+import json
+import pickle
+import zlib
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+TAG = 0xBB
+VERSION = 1
+
+
+class CodecError(ValueError):
+    """A stored value could not be encoded or decoded."""
+
+
+class Codec(abc.ABC):
+    name = ''
+    id = 0
+
+    @abc.abstractmethod
+    def dumps(self, value) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def loads(self, data: bytes):
+        pass
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    id = 1
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value).encode('utf-8')
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """Compact and fast; needs `pip install msgpack`. Tuples come back as lists, as with json."""
+
+    name = 'msgpack'
+    id = 2
+
+    def __init__(self):
+        if msgpack is None:
+            raise CodecError('the msgpack codec needs `pip install msgpack`')
+
+    def dumps(self, value) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+class PickleCodec(Codec):
+    """Any picklable value. Only for data you trust: unpickling can run arbitrary code."""
+
+    name = 'pickle'
+    id = 3
+
+    def dumps(self, value) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes):
+        return pickle.loads(data)
+
+
+class Compression(object):
+    name = ''
+    id = 0
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCompression(Compression):
+    name = 'zlib'
+    id = 1
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, 6)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class Lz4Compression(Compression):
+    """Faster than zlib, compresses less; needs `pip install lz4`."""
+
+    name = 'lz4'
+    id = 2
+
+    def __init__(self):
+        if lz4 is None:
+            raise CodecError('lz4 compression needs `pip install lz4`')
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4.frame.decompress(data)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, MsgpackCodec, PickleCodec)}
+COMPRESSIONS = {compression.name: compression for compression in (Compression, ZlibCompression, Lz4Compression)}
+
+
+class ValueCodec(object):
+    """Encodes values with `codec`, compressing payloads of at least `threshold` bytes.
+
+    Decodes anything any ValueCodec wrote, whatever its settings, except pickled values: unpickling
+    can run arbitrary code, so those are only read when `codec` is pickle or with `allow_pickle`.
+    """
+
+    def __init__(self, codec='json', compression='', threshold=1024, allow_pickle=False):
+        if codec not in CODECS:
+            raise CodecError(f'codec must be one of {list(CODECS)}, not `{codec}`')
+        if compression not in COMPRESSIONS:
+            raise CodecError(f'compression must be one of {list(COMPRESSIONS)}, not `{compression}`')
+
+        self.codec = CODECS[codec]()
+        self.compression = COMPRESSIONS[compression]()
+        self.threshold = threshold
+        self.allow_pickle = allow_pickle or isinstance(self.codec, PickleCodec)
+
+        # only instantiated when a stored value needs them, so e.g. reading json never needs msgpack
+        self._codecs: Dict[int, Codec] = {self.codec.id: self.codec}
+        self._compressions: Dict[int, Compression] = {self.compression.id: self.compression}
+
+    @property
+    def plain_json(self) -> bool:
+        """Whether every value is written as untagged JSON."""
+        return isinstance(self.codec, JsonCodec) and not self.compression.id
+
+    def encode(self, value) -> bytes:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode('ascii')
+
+        try:
+            payload = self.codec.dumps(value)
+        except Exception as e:
+            raise CodecError(f'could not encode {type(value).__name__} as {self.codec.name}: {e}') from e
+
+        compression = self.compression if self.compression.id and len(payload) >= self.threshold else None
+        if compression is None and isinstance(self.codec, JsonCodec):
+            return payload  # untagged, as it always was
+        if compression is not None:
+            payload = compression.compress(payload)
+
+        return bytes((TAG, VERSION, self.codec.id, compression.id if compression else 0)) + payload
+
+    def decode(self, data: Union[bytes, str, None], default=None) -> Any:
+        if data is None:
+            return default
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        if not data or data[0] != TAG:
+            try:
+                return json.loads(data)
+            except ValueError as e:
+                raise CodecError(f'stored value is neither tagged nor json: {data[:32]!r}') from e
+
+        if len(data) < 4 or data[1] != VERSION:
+            raise CodecError(f'unknown stored value format: {data[:4]!r}')
+        try:
+            payload = self._compression(data[3]).decompress(data[4:])
+            return self._codec(data[2]).loads(payload)
+        except CodecError:
+            raise
+        except Exception as e:
+            raise CodecError(f'could not decode stored value: {e}') from e
+
+    def _codec(self, codec_id: int) -> Codec:
+        if codec_id not in self._codecs:
+            codec = next((c for c in CODECS.values() if c.id == codec_id), None)
+            if codec is None:
+                raise CodecError(f'unknown codec id {codec_id}')
+            if codec is PickleCodec and not self.allow_pickle:
+                raise CodecError('refusing to unpickle a stored value: set MEMORY_CODEC=pickle, or '
+                                 'MEMORY_ALLOW_PICKLE=1 to read it anyway, only if you trust whoever wrote it')
+            self._codecs[codec_id] = codec()
+        return self._codecs[codec_id]
+
+    def _compression(self, compression_id: int) -> Compression:
+        if compression_id not in self._compressions:
+            compression = next((c for c in COMPRESSIONS.values() if c.id == compression_id), None)
+            if compression is None:
+                raise CodecError(f'unknown compression id {compression_id}')
+            self._compressions[compression_id] = compression()
+        return self._compressions[compression_id]
+
+
+def is_tagged(data: Optional[Union[bytes, str]]) -> bool:
+    return isinstance(data, bytes) and data[:1] == bytes((TAG,))
@@ -0,0 +1,77 @@
+"""
+Bot startup as a dependency graph
+
+Each step starts as soon as the steps it depends on have finished, so independent ones (e.g.
+connecting to memory and listing the Slack workspace) overlap. Every step is timed.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+LOG = logging.getLogger(__name__)
+
+
+class StepTiming(NamedTuple):
+    start: float  # seconds after the graph started running
+    duration: float
+
+
+class StartupGraph(object):
+
+    def __init__(self):
+        self._steps: Dict[str, Tuple[Callable[[], Awaitable], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, StepTiming] = {}
+
+    def add(self, name: str, step: Callable[[], Awaitable], after: Iterable[str] = ()):
+        """Run `step()` once every step in `after` has finished. Replaces any step with the same name."""
+        self._steps[name] = (step, tuple(after))
+
+    def _order(self) -> List[str]:
+        """Steps in an order where each comes after its dependencies; raises ValueError if there is none."""
+        order: List[str] = []
+        visiting = set()
+
+        def visit(name, path):
+            if name in order:
+                return
+            if name not in self._steps:
+                raise ValueError(f'startup step `{path[-1]}` depends on unknown step `{name}`')
+            if name in visiting:
+                raise ValueError(f'startup steps depend on each other: {" -> ".join(path + [name])}')
+            visiting.add(name)
+            for dependency in self._steps[name][1]:
+                visit(dependency, path + [name])
+            order.append(name)
+
+        for name in self._steps:
+            visit(name, [])
+        return order
+
+    async def run(self) -> Dict[str, StepTiming]:
+        """Run every step; the first failure cancels the steps still waiting or running, and is raised."""
+        order = self._order()
+        began = time.perf_counter()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_step(name):
+            step, after = self._steps[name]
+            if after:
+                await asyncio.gather(*(tasks[dependency] for dependency in after))
+            started = time.perf_counter()
+            await step()
+            self.timings[name] = StepTiming(started - began, time.perf_counter() - started)
+
+        for name in order:
+            tasks[name] = asyncio.ensure_future(run_step(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        LOG.info(f'startup took {time.perf_counter() - began:.2f}s: ' + ', '.join(
+            f'{name} {timing.duration:.2f}s' for name, timing in sorted(self.timings.items(), key=lambda t: t[1].start)))
+        return self.timings
@@ -0,0 +1,21 @@
+import tempfile
+from unittest import mock
+
+import aiounittest
+
+from betabot.bots.botcli import BotCLI
+
+
+class TestBotCLI(aiounittest.AsyncTestCase):
+
+    async def test_reads_stdin_redirected_from_a_file(self):
+        bot = BotCLI(read_stdin=False)
+        with tempfile.TemporaryFile() as stdin:
+            stdin.write(b'uptime\n\nhelp\n')
+            stdin.seek(0)
+            with mock.patch('sys.stdin', open(stdin.fileno(), closefd=False)):
+                await bot._connect_stdin()
+
+        self.assertEqual((await bot._get_next_event())['text'], 'uptime')
+        self.assertEqual((await bot._get_next_event())['text'], 'help')
+        self.assertIsNone(await bot._get_next_event())  # EOF: `start` returns instead of waiting forever
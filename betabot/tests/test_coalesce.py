@@ -0,0 +1,66 @@
+import asyncio
+
+import aiounittest
+
+from betabot.coalesce import SayCoalescer
+
+
+class FakeSay(object):
+
+    def __init__(self, channel='C1', thread_ts=None):
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.sent = []
+
+    async def __call__(self, text='', **kwargs):
+        self.sent.append({'text': text, **kwargs})
+        return {'ok': True}
+
+
+class TestSayCoalescer(aiounittest.AsyncTestCase):
+
+    async def test_burst_becomes_one_message(self):
+        coalescer = SayCoalescer(window=0.02)
+        say, other = FakeSay(), FakeSay(channel='C2')
+
+        self.assertEqual(await coalescer.wrap(say)('Here are my commands'), {'ok': True, 'deferred': True})
+        await coalescer.wrap(say)('uptime')
+        await coalescer.wrap(other)('hi')
+        await coalescer.wrap(say)('in a thread', thread_ts='1.1')
+        self.assertEqual(say.sent, [])
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(say.sent, [
+            {'text': 'Here are my commands\nuptime', 'channel': 'C1'},
+            {'text': 'in a thread', 'channel': 'C1', 'thread_ts': '1.1'},
+        ])
+        self.assertEqual(other.sent, [{'text': 'hi', 'channel': 'C2'}])
+        self.assertEqual(coalescer.stats(), {'calls': 4, 'messages': 3, 'failed': 0, 'buffered': 0, 'sending': 0})
+
+    async def test_blocks_limits_and_order(self):
+        coalescer = SayCoalescer(window=10, max_text_length=20, max_blocks=3)
+        fake = FakeSay()
+        say = coalescer.wrap(fake)
+        divider = {'type': 'divider'}
+
+        await say('one')
+        await say('two', blocks=[divider])  # texts become sections next to the blocks
+        await say('three')
+        await say('four')  # would be a fourth block: starts a new message
+        await say('a longer line here')  # would be over 20 characters: starts another
+        await say({'text': 'with an attachment', 'attachments': [{'text': 'x'}]})  # sent on its own, in order
+        await say('last')
+        await coalescer.flush()
+
+        section = lambda text: {'type': 'section', 'text': {'type': 'mrkdwn', 'text': text}}  # noqa: E731
+        self.assertEqual(fake.sent, [
+            {'text': 'one\ntwo\nthree', 'blocks': [section('one'), divider, section('three')], 'channel': 'C1'},
+            {'text': 'four', 'channel': 'C1'},
+            {'text': 'a longer line here', 'channel': 'C1'},
+            {'text': 'with an attachment', 'attachments': [{'text': 'x'}], 'channel': 'C1'},
+            {'text': 'last', 'channel': 'C1'},
+        ])
+
+    async def test_no_window_leaves_say_alone(self):
+        say = FakeSay()
+        self.assertIs(SayCoalescer(window=0).wrap(say), say)
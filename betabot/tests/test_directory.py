@@ -0,0 +1,208 @@
+import asyncio
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import aiounittest
+
+from betabot import directory
+from betabot.bots.bot import Bot
+from betabot.bots.botslack import BotSlack
+from betabot.classes import Channel
+from betabot.directory import ChannelDirectory, UserDirectory, literal_prefix
+from betabot.user import User
+
+
+def member(id, name, display_name='', email='', **extra):
+    return {'id': id, 'name': name, 'real_name': name.title(), 'tz': 'America/New_York',
+            'profile': {'display_name': display_name, 'email': email, 'image_512': 'https://...'}, **extra}
+
+
+class TestUserDirectory(unittest.TestCase):
+
+    def test_lookups(self):
+        users = UserDirectory()
+        self.assertEqual(users.update([
+            member('U1', 'ann', 'Annie', 'Ann@example.com'),
+            member('U2', 'bob', 'Annie', is_bot=True),
+        ]), 2)
+
+        self.assertEqual(len(users), 2)
+        self.assertEqual(users.get(id='U1').email, 'Ann@example.com')
+        self.assertEqual(users.get(name='@ANN').id, 'U1')
+        self.assertEqual(users.get(name='annie').id, 'U1')  # first with that display name
+        self.assertEqual(users.get(email='ann@EXAMPLE.com').id, 'U1')
+        self.assertTrue(users.get(name='bob').is_bot)
+        self.assertIsNone(users.get(id='U3'))
+        self.assertIsNone(users.get(email=''))
+        self.assertFalse(hasattr(users.get(id='U1'), '__dict__'))  # only the fields we keep
+
+    def test_replace_and_remove(self):
+        users = UserDirectory([User('U1', name='ann', email='ann@example.com')])
+        users.update([member('U1', 'anne', email='anne@example.com', deleted=True)])
+
+        self.assertEqual(len(users), 1)
+        self.assertIsNone(users.get(name='ann'))
+        self.assertIsNone(users.get(email='ann@example.com'))
+        self.assertTrue(users.get(name='anne').deleted)
+
+        self.assertEqual(users.remove('U1'), User('U1', 'anne', 'Anne', '', 'anne@example.com',
+                                                  'America/New_York', False, True))
+        self.assertIsNone(users.get(name='anne'))
+        self.assertEqual(list(users), [])
+
+
+    def test_repeated_display_names(self):
+        users = UserDirectory([User('U1', name='ann', display_name='Sam'), User('U2', name='sam', display_name='Sam'),
+                               User('U3', name='samantha', display_name='sam')])
+        self.assertEqual(users.get(name='sam').id, 'U2')  # a name beats a display name
+
+        users.update([member('U1', 'ann', 'Annie')])  # changes theirs
+        users.remove('U2')
+        self.assertEqual(users.get(name='@Sam').id, 'U3')
+        users.remove('U3')
+        self.assertIsNone(users.get(name='sam'))
+        self.assertEqual(users.get(name='annie').id, 'U1')
+
+
+class TestChannelDirectory(unittest.TestCase):
+
+    def make_channels(self):
+        return ChannelDirectory([
+            Channel(id='C1', name='general', is_general=True),
+            Channel(id='C2', name='deploy-web'),
+            Channel(id='C3', name='deploy-api'),
+            Channel(id='C4', name='Deploys-old', is_archived=True),
+            Channel(id='C5', name='random'),
+            Channel(id='D1', is_im=True),
+        ])
+
+    def test_lookups(self):
+        channels = self.make_channels()
+        self.assertEqual(len(channels), 6)
+        self.assertEqual(channels.get(id='C2').name, 'deploy-web')
+        self.assertEqual(channels.get(name='#GENERAL').id, 'C1')
+        self.assertIsNone(channels.get(name='missing'))
+
+        bot = Bot()
+        bot.channels = channels
+        self.assertEqual(bot.get_channel(name='general', is_general=True).id, 'C1')
+        self.assertIsNone(bot.get_channel(name='general', is_archived=True))
+        self.assertEqual(bot.get_channel(is_im=True).id, 'D1')
+
+    def test_find(self):
+        channels = self.make_channels()
+        names = lambda found: [channel.name for channel in found]  # noqa: E731
+
+        self.assertEqual(names(channels.find(prefix='#deploy')), ['deploy-api', 'deploy-web'])
+        self.assertEqual(names(channels.find(prefix='deploy', include_archived=True)),
+                         ['deploy-api', 'deploy-web', 'Deploys-old'])
+        self.assertEqual(names(channels.find('^deploys?-')), ['deploy-api', 'deploy-web'])
+        self.assertEqual(names(channels.find('a')), ['deploy-api', 'general', 'random'])
+        self.assertEqual(names(channels.find(re.compile('^D'), include_archived=True)), ['Deploys-old'])
+        self.assertEqual(names(channels.find('^general|^random')), ['general', 'random'])
+
+        self.assertEqual(literal_prefix('^deploy-(web|api)$'), 'deploy-')
+        self.assertEqual(literal_prefix('^deploys?'), 'deploy')
+        self.assertEqual(literal_prefix('deploy'), '')
+
+    def test_incremental_updates(self):
+        channels = self.make_channels()
+        channels.rename('C2', 'deploy-www')
+        channels.archive('C3')
+        channels.add(Channel(id='C6', name='deploy-new'))
+        channels.remove('C5')
+
+        self.assertIsNone(channels.get(name='deploy-web'))
+        self.assertIsNone(channels.get(name='random'))
+        self.assertTrue(channels.get(id='C3').is_archived)
+        self.assertEqual([c.id for c in channels.find(prefix='deploy')], ['C6', 'C2'])
+
+    def test_repeated_names(self):
+        channels = ChannelDirectory([
+            Channel(id='C1', name='deploys', created=100, is_archived=True),
+            Channel(id='C2', name='deploys', created=200),
+            Channel(id='T2C1', name='Deploys', created=150),  # another workspace
+        ])
+        self.assertEqual(channels.get(name='deploys').id, 'C2')
+        bot = Bot()
+        bot.channels = channels
+        self.assertEqual(bot.get_channel(name='#deploys', is_archived=True).id, 'C1')
+        self.assertEqual([c.id for c in channels.find(prefix='deploys', include_archived=True)], ['C2', 'T2C1', 'C1'])
+
+        channels.remove('C2')
+        self.assertEqual(channels.get(name='deploys').id, 'T2C1')
+        channels.rename('T2C1', 'deploys-eu')
+        self.assertEqual(channels.get(name='deploys').id, 'C1')  # only the archived one is left
+        self.assertEqual([c.id for c in channels.find(prefix='deploys')], ['T2C1'])
+        channels.remove('C1')
+        self.assertIsNone(channels.get(name='deploys'))
+        self.assertEqual(channels._names, ['deploys-eu'])
+
+
+class TestDirectorySnapshot(aiounittest.AsyncTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'directory.pickle')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_events_and_snapshot(self):
+        users = UserDirectory([User('U1', name='ann')])
+        channels = ChannelDirectory([Channel(id='C1', name='general'), Channel(id='C2', name='old')])
+
+        for event in [
+            {'type': 'team_join', 'user': member('U2', 'bob', email='bob@example.com')},
+            {'type': 'user_change', 'user': member('U1', 'anne')},
+            {'type': 'channel_created', 'channel': {'id': 'C3', 'name': 'new', 'created': 1360782804}},
+            {'type': 'channel_rename', 'channel': {'id': 'C1', 'name': 'lobby', 'created': 1360782804}},
+            {'type': 'channel_archive', 'channel': 'C2', 'user': 'U1'},
+        ]:
+            self.assertTrue(directory.apply_event(users, channels, event))
+        self.assertFalse(directory.apply_event(users, channels, {'type': 'message', 'text': 'hi'}))
+
+        self.assertIsNone(directory.load_snapshot(self.path))
+        directory.save_snapshot(self.path, users, channels)
+        loaded_users, loaded_channels, saved = directory.load_snapshot(self.path)
+
+        self.assertEqual(sorted(u.name for u in loaded_users), ['anne', 'bob'])
+        self.assertEqual(loaded_users.get(email='bob@example.com').id, 'U2')
+        self.assertEqual(loaded_channels.get(name='lobby').id, 'C1')
+        self.assertEqual(loaded_channels.get(id='C3'), Channel(id='C3', name='new', is_channel=True, created=1360782804))
+        self.assertEqual([c.id for c in loaded_channels.find()], ['C1', 'C3'])  # C2 archived
+
+        with mock.patch.object(directory, 'SNAPSHOT_VERSION', 0):
+            self.assertIsNone(directory.load_snapshot(self.path))
+
+    async def test_background_refresh_keeps_events(self):
+        bot = BotSlack()
+        bot.users = UserDirectory([User('U1', name='ann')])
+        bot._directory_path = self.path
+        listed = asyncio.Event()
+
+        async def users_list(**kwargs):
+            await listed.wait()  # a user_change arrives while the workspace is being listed
+            return mock.Mock(data={'members': [member('U1', 'ann'), member('U2', 'bob')]})
+
+        client = mock.Mock()
+        client.conversations_list = mock.AsyncMock(
+            return_value=mock.Mock(data={'channels': [{'id': 'C1', 'name': 'general', 'is_channel': True}]}))
+        client.users_list = users_list
+        bot._bolt_app = mock.Mock(client=client)
+
+        refresh = asyncio.ensure_future(bot._refresh_directory())
+        await asyncio.sleep(0)
+        event = {'type': 'user_change', 'user': member('U1', 'anne')}
+        directory.apply_event(bot.users, bot.channels, event)
+        bot._directory_events.append(event)
+        listed.set()
+        await refresh
+
+        self.assertEqual(bot.users.get(id='U1').name, 'anne')
+        self.assertEqual(bot.users.get(name='bob').id, 'U2')
+        self.assertEqual(bot.get_channel(name='general').id, 'C1')
+        self.assertEqual(len(directory.load_snapshot(self.path)[0]), 2)
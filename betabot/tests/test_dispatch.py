@@ -0,0 +1,44 @@
+import re
+import unittest
+
+from betabot import dispatch
+
+
+class TestRequiredLiteral(unittest.TestCase):
+
+    def test_longest_literal(self):
+        self.assertEqual(dispatch.required_literal(re.compile(r'help (.*)')), 'help ')
+        self.assertEqual(dispatch.required_literal(re.compile(r'^(say) hello\s+world$')), ' hello')
+        self.assertEqual(dispatch.required_literal(re.compile(r'(?P<n>\d+) Random Number')), ' random number')
+
+    def test_no_literal(self):
+        self.assertEqual(dispatch.required_literal(re.compile(r'(.*)')), '')
+        self.assertEqual(dispatch.required_literal(re.compile(r'hi|bye')), '')
+        self.assertEqual(dispatch.required_literal(re.compile(r'(?:uptime)?')), '')
+
+
+class TestCommandIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = dispatch.CommandIndex()
+        self.help = self.index.add(re.compile('help$'), 'help', direct=True)
+        self.help_query = self.index.add(re.compile('help (.*)'), 'help_query')
+        self.he = self.index.add(re.compile('he'), 'he')
+        self.anything = self.index.add(re.compile('(.*)!'), 'anything')
+        self.everything = self.index.add(re.compile('.*'), 'everything')
+        self.upper = self.index.add(re.compile('UPTIME', re.IGNORECASE), 'uptime')
+
+    def test_candidates_keep_registration_order(self):
+        self.assertEqual(self.index.candidates('help me'), [self.help, self.help_query, self.he, self.everything])
+        self.assertEqual(self.index.candidates('nothing'), [self.everything])
+
+    def test_matches(self):
+        self.assertEqual(self.index.matches('help'), [self.help, self.he, self.everything])
+        self.assertEqual(self.index.matches('help uptime!'),
+                         [self.help_query, self.he, self.anything, self.everything, self.upper])
+        self.assertEqual(self.index.matches('Uptime'), [self.everything, self.upper])
+
+    def test_rebuilds_after_add(self):
+        self.index.build()
+        late = self.index.add(re.compile('late'), 'late')
+        self.assertEqual(self.index.matches('too late'), [self.everything, late])
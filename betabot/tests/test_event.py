@@ -0,0 +1,50 @@
+import re
+import unittest
+
+from slack_bolt.request.async_request import AsyncBoltRequest
+
+from betabot.classes.event import Event, RE_FLAGS
+
+
+class FakeBot(object):
+    _mention_regex = re.compile(r'[\s@<]*(?:betabot|U123)[>:,\s]*', RE_FLAGS)
+    say_coalescer = None
+
+
+def make_request(text, channel='C1'):
+    return AsyncBoltRequest(
+        mode='socket_mode',
+        body={
+            'type': 'event_callback',
+            'event': {'type': 'message', 'channel': channel, 'user': 'U1', 'text': text, 'ts': '1.1'},
+        },
+    )
+
+
+class TestEvent(unittest.TestCase):
+
+    def test_mention_is_stripped_once(self):
+        event = Event(bot=FakeBot(), request=make_request('<@U123> uptime'))
+        self.assertTrue(event.is_direct)
+        self.assertEqual(event.text, 'uptime')
+
+        event = Event(bot=FakeBot(), request=make_request('uptime'))
+        self.assertFalse(event.is_direct)
+
+    def test_data_is_lazy(self):
+        event = Event(bot=FakeBot(), request=make_request('hi'))
+        self.assertIsNone(event._data)
+        self.assertEqual(event.data.event['text'], 'hi')
+        self.assertIs(event.data.payload, event.data.event)
+        self.assertIs(event.context.bot, event.bot)
+
+    def test_for_listener_has_own_match_state(self):
+        shared = Event(bot=FakeBot(), request=make_request('help uptime'))
+        first = shared.for_listener()
+        second = shared.for_listener()
+
+        self.assertTrue(first.match_regex(re.compile('help (.*)')))
+        self.assertEqual(first.regex_groups, ('uptime',))
+        self.assertIsNone(second.regex_groups)
+        self.assertIsNone(shared.regex_groups)
+        self.assertEqual(second.text, shared.text)
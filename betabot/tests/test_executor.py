@@ -0,0 +1,216 @@
+import asyncio
+import os
+import pkgutil
+import re
+import tempfile
+import threading
+from unittest import mock
+
+import aiounittest
+
+from betabot.bots.bot import Bot
+from betabot.bots.botcli import BotCLI
+from betabot.classes.event import Event
+from betabot.executor import ExecutionPools, HandlerExecutor
+from betabot.tests.test_event import FakeBot, make_request
+
+
+class TestHandlerExecutor(aiounittest.AsyncTestCase):
+
+    async def test_concurrency_limits(self):
+        executor = HandlerExecutor(concurrency=3, queue_size=100)
+        release = asyncio.Event()
+        peak = {'all': 0, 'slow': 0}
+        running = {'all': 0, 'slow': 0}
+
+        def job(name):
+            async def run():
+                running['all'] += 1
+                running[name] = running.get(name, 0) + 1
+                peak['all'] = max(peak['all'], running['all'])
+                peak['slow'] = max(peak['slow'], running['slow'])
+                await release.wait()
+                running['all'] -= 1
+                running[name] -= 1
+            return run
+
+        for _ in range(5):
+            await executor.submit(job('slow'), key='C1', command='slow', limit=1)
+            await executor.submit(job('fast'), key='C2', command='fast')
+        await asyncio.sleep(0)
+
+        self.assertEqual(executor.stats()['in_flight'], 3)
+        self.assertEqual(executor.stats()['in_flight_by_command'], {'slow': 1, 'fast': 2})
+
+        release.set()
+        await executor.join()
+        self.assertEqual(peak, {'all': 3, 'slow': 1})
+        self.assertEqual(executor.counters['completed'], 10)
+
+    async def test_round_robin_across_keys(self):
+        executor = HandlerExecutor(concurrency=1, queue_size=100)
+        order = []
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        def job(key, i):
+            async def run():
+                order.append((key, i))
+            return run
+
+        await executor.submit(blocker, key='busy')
+        for i in range(3):
+            await executor.submit(job('busy', i), key='busy')
+        await executor.submit(job('quiet', 0), key='quiet')
+
+        gate.set()
+        await executor.join()
+        self.assertEqual(order, [('busy', 0), ('quiet', 0), ('busy', 1), ('busy', 2)])
+
+    async def test_overflow_policies(self):
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        rejected = []
+
+        async def on_reject():
+            rejected.append(True)
+
+        dropping = HandlerExecutor(concurrency=1, queue_size=1, overflow='drop')
+        rejecting = HandlerExecutor(concurrency=1, queue_size=1, overflow='reject')
+        for executor in (dropping, rejecting):
+            self.assertTrue(await executor.submit(blocker))
+            self.assertTrue(await executor.submit(blocker))
+            self.assertFalse(await executor.submit(blocker, on_reject=on_reject))
+
+        waiting = HandlerExecutor(concurrency=1, queue_size=1, overflow='wait')
+        await waiting.submit(blocker)
+        await waiting.submit(blocker)
+        third = asyncio.ensure_future(waiting.submit(blocker))
+        await asyncio.sleep(0)
+        self.assertFalse(third.done())
+
+        gate.set()
+        self.assertTrue(await third)
+        await asyncio.sleep(0)
+        self.assertEqual(dropping.counters['dropped'], 1)
+        self.assertEqual(rejecting.counters['rejected'], 1)
+        self.assertEqual(rejected, [True])
+
+    async def test_flooded_key_does_not_starve_others(self):
+        gate = asyncio.Event()
+        ran = []
+        executors = []
+
+        async def blocker():
+            await gate.wait()
+
+        async def quiet():
+            ran.append('quiet')
+
+        for overflow in ('drop', 'wait'):
+            executor = HandlerExecutor(concurrency=2, queue_size=3, overflow=overflow)
+            executors.append(executor)
+            for _ in range(4):  # one runs, three wait
+                await executor.submit(blocker, key='busy', command=blocker, limit=1)
+            self.assertEqual(executor.stats()['queued_by_key'], {'busy': 3})
+
+            flood = asyncio.ensure_future(executor.submit(blocker, key='busy', command=blocker, limit=1))
+            await asyncio.sleep(0)
+            self.assertEqual(flood.done(), overflow == 'drop')  # the flooded key overflows...
+
+            # ...while a quiet key is still queued and run straight away
+            self.assertTrue(await asyncio.wait_for(executor.submit(quiet, key='quiet'), 1))
+            await asyncio.sleep(0)
+            self.assertEqual(ran.count('quiet'), 1 if overflow == 'drop' else 2)
+
+            flood.cancel()
+            await asyncio.gather(flood, return_exceptions=True)
+        gate.set()
+        await asyncio.gather(*(executor.join() for executor in executors))
+
+
+def _process_handler(event):
+    event.actions.say(f'{event.regex_groups[0]} from another process')
+
+
+class TestExecutionPools(aiounittest.AsyncTestCase):
+
+    def make_event(self, said):
+        async def say(text):
+            said.append(text)
+            return {'ok': True, 'text': text}
+
+        request = make_request('echo hi')
+        request.context['say'] = say
+        event = Event(bot=FakeBot(), request=request).for_listener()
+        event.match_regex(re.compile(r'echo (\w+)'))
+        return event
+
+    async def test_sync_handler_in_thread(self):
+        said = []
+        results = []
+
+        def handler(event):
+            results.append((threading.current_thread() is threading.main_thread(), event.actions.say('hello')))
+
+        pools = ExecutionPools()
+        await pools.run(handler, self.make_event(said))
+        pools.shutdown()
+
+        self.assertEqual(said, ['hello'])
+        self.assertEqual(results, [(False, {'ok': True, 'text': 'hello'})])
+
+    async def test_process_replays_say(self):
+        said = []
+        pools = ExecutionPools(process_workers=1)
+        await pools.run(_process_handler, self.make_event(said), mode='process')
+        pools.shutdown()
+
+        self.assertEqual(said, ['hi from another process'])
+
+    async def test_process_runs_script_imported_by_path(self):
+        said = []
+        with tempfile.TemporaryDirectory() as scripts:
+            with open(os.path.join(scripts, 'crunch_script.py'), 'w') as f:
+                f.write('def crunch(event):\n'
+                        '    event.actions.say(str(sum(range(int(event.regex_groups[0])))))\n')
+            # the way Bot._import_scripts loads them: not importable by name from a fresh process
+            for importer, name, _ in pkgutil.iter_modules([scripts]):
+                module = importer.find_module(name).load_module(name)
+
+            pools = ExecutionPools(process_workers=1)
+            event = self.make_event(said)
+            event.regex_groups = ('10',)
+            await pools.run(module.crunch, event, mode='process')
+            pools.shutdown()
+
+        self.assertEqual(said, ['45'])
+
+    async def test_process_runs_decorated_script(self):
+        said = []
+        bot = BotCLI()
+        await bot._setup()
+        with tempfile.TemporaryDirectory() as scripts, mock.patch.object(Bot, 'instance', bot):
+            with open(os.path.join(scripts, 'decorated_script.py'), 'w') as f:
+                f.write('import betabot.bots.bot\n'
+                        'bot = betabot.bots.bot.get_instance()\n\n\n'
+                        '@bot.add_command(r"crunch (\\d+)", executor="process")\n'
+                        'def crunch(event):\n'
+                        '    event.actions.say(str(sum(range(int(event.regex_groups[0])))))\n')
+            for importer, name, _ in pkgutil.iter_modules([scripts]):
+                module = importer.find_module(name).load_module(name)
+            self.assertEqual(len(bot._command_index), 1)  # registered here, in the bot's process
+
+            # the worker imports the script too, where get_instance() is a bot that was never set up
+            pools = ExecutionPools(process_workers=1)
+            event = self.make_event(said)
+            event.regex_groups = ('10',)
+            await pools.run(module.crunch, event, mode='process')
+            pools.shutdown()
+
+        self.assertEqual(said, ['45'])
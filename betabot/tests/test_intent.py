@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+from betabot import intent
+
+SAMPLES = [
+    ('List your commands', 'help'),
+    ('What can you do?', 'help'),
+    ("What's your uptime?", 'uptime'),
+    ('How long have you been running?', 'uptime'),
+]
+
+# 250 intents, taught and asked with different verbs
+VERBS = {'restart': 'reboot', 'deploy': 'ship', 'show': 'display', 'delete': 'remove', 'create': 'make',
+         'check': 'inspect', 'pause': 'suspend', 'scale': 'resize', 'backup': 'snapshot', 'rollback': 'revert'}
+OBJECTS = ['web server', 'database', 'build queue', 'cache', 'search index', 'payments', 'cron jobs', 'staging',
+           'load balancer', 'dns records', 'certificates', 'feature flags', 'user table', 'message queue',
+           'log pipeline', 'dashboard', 'billing report', 'api gateway', 'cdn config', 'worker pool',
+           'mobile build', 'release notes', 'on-call schedule', 'error budget', 'test suite']
+
+
+class TestIntent(unittest.TestCase):
+
+    def test_classify(self):
+        engine = intent.load_or_train(intent.NaiveBayesIntent.name, SAMPLES, cache_dir=None)
+
+        label, confidence = engine.classify('what can you do')
+        self.assertEqual(label, 'help')
+        self.assertGreater(confidence, engine.threshold)
+        self.assertEqual(engine.classify('completely unrelated'), (None, 0.0))
+
+    def test_vector_batch(self):
+        engine = intent.load_or_train(intent.VectorIntent.name, SAMPLES, cache_dir=None)
+
+        results = engine.classify_batch(['what can you do', 'how long have you been up', 'zzz', ''])
+        self.assertEqual([label for label, _ in results], ['help', 'uptime', None, None])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertGreater(results[1][1], engine.threshold)
+        self.assertEqual(engine.classify('list commands')[0], 'help')
+
+    def test_model_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            engine = intent.load_or_train(intent.NaiveBayesIntent.name, SAMPLES, cache_dir=cache_dir)
+            cached = list(Path(cache_dir).glob('naive_bayes-*.pickle'))
+            self.assertEqual(len(cached), 1)
+
+            loaded = intent.load_or_train(intent.NaiveBayesIntent.name, list(reversed(SAMPLES)), cache_dir=cache_dir)
+            self.assertIsNot(loaded, engine)
+            self.assertEqual(loaded.classify('how long have you been running')[0], 'uptime')
+
+            # a different corpus is a different model
+            intent.load_or_train(intent.NaiveBayesIntent.name, SAMPLES[:3], cache_dir=cache_dir)
+            self.assertEqual(len(list(Path(cache_dir).glob('naive_bayes-*.pickle'))), 2)
+
+            # and so is the same corpus after the engine changes
+            with mock.patch.object(intent.NaiveBayesIntent, 'version', intent.NaiveBayesIntent.version + 1):
+                self.assertIsNot(intent.load_or_train(intent.NaiveBayesIntent.name, SAMPLES, cache_dir=cache_dir), loaded)
+            self.assertEqual(len(list(Path(cache_dir).glob('naive_bayes-*.pickle'))), 3)
+
+    def test_vector_at_scale(self):
+        train = [(template.format(verb=verb, syn=syn, obj=obj), f'{verb} {obj}')
+                 for verb, syn in VERBS.items() for obj in OBJECTS
+                 for template in ('{verb} the {obj}', 'can you {syn} the {obj}', 'please {verb} {obj}')]
+        test = [(template.format(verb=verb, syn=syn, obj=obj), f'{verb} {obj}')
+                for verb, syn in VERBS.items() for obj in OBJECTS
+                for template in ('could you {syn} the {obj} for me', 'hey bot {verb} the {obj} asap')]
+        engine = intent.load_or_train(intent.VectorIntent.name, train, cache_dir=None)
+
+        results = engine.classify_batch([text for text, _ in test])
+        correct = sum(label == expected and confidence >= engine.threshold
+                      for (label, confidence), (_, expected) in zip(results, test))
+        self.assertGreaterEqual(correct / len(test), 0.75)
+        for text in ('what a lovely day', 'who wants lunch', 'see you tomorrow'):
+            self.assertLess(engine.classify(text)[1], engine.threshold)
@@ -0,0 +1,52 @@
+import asyncio
+import re
+
+import aiounittest
+
+from betabot.classes.event import Event
+from betabot.listeners import ListenerRegistry
+from betabot.tests.test_event import FakeBot, make_request
+
+
+class TestListenerRegistry(aiounittest.AsyncTestCase):
+
+    async def test_reply_resolves_waiter(self):
+        registry = ListenerRegistry()
+        waiter = asyncio.ensure_future(registry.wait('C1', 'U1', regex=re.compile('(yes|no)')))
+        await asyncio.sleep(0)
+
+        self.assertFalse(registry.resolve(Event(bot=FakeBot(), request=make_request('maybe'))))
+        self.assertFalse(registry.resolve(Event(bot=FakeBot(), request=make_request('yes', channel='C2'))))
+        self.assertFalse(registry.resolve(Event(bot=FakeBot(), request=make_request('I said no'))))  # anchored
+        self.assertTrue(registry.resolve(Event(bot=FakeBot(), request=make_request('no'))))
+
+        heard = await waiter
+        self.assertEqual(heard.regex_groups, ('no',))
+        self.assertEqual(len(registry), 0)
+
+    async def test_timeout_unregisters(self):
+        registry = ListenerRegistry()
+        with self.assertRaises(asyncio.TimeoutError):
+            await registry.wait('C1', 'U1', timeout=0.01)
+        self.assertEqual(len(registry), 0)
+
+    async def test_cancel_unregisters(self):
+        registry = ListenerRegistry()
+        waiter = asyncio.ensure_future(registry.wait('C1', 'U1'))
+        await asyncio.sleep(0)
+        self.assertEqual(len(registry), 1)
+
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(len(registry), 0)
+
+    async def test_cancel_all(self):
+        registry = ListenerRegistry()
+        waiters = [asyncio.ensure_future(registry.wait('C1', user)) for user in ('U1', 'U2')]
+        await asyncio.sleep(0)
+
+        registry.cancel_all()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results))
+        self.assertEqual(len(registry), 0)
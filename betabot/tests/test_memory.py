@@ -0,0 +1,424 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import aiounittest
+import fakeredis
+from redis.exceptions import ConnectionError
+
+from betabot import memory, serialization
+from betabot.serialization import CodecError, ValueCodec
+
+
+class TestMemoryDict(aiounittest.AsyncTestCase):
+
+    def make_memory(self):
+        return memory.MemoryDict()
+
+    async def test_save_get(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        self.assertIsNone(await mem.get('missing'))
+        self.assertEqual(await mem.get('missing', 'default'), 'default')
+
+        await mem.save('key', {'a': [1, 2]})
+        self.assertEqual(await mem.get('key'), {'a': [1, 2]})
+
+        await mem.close()
+
+    async def test_batch(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        await mem.save_many({'a': 1, 'b': [2], 'c': {'three': 3}})
+        self.assertEqual(await mem.get_many(['a', 'b', 'c', 'd'], default=0),
+                         {'a': 1, 'b': [2], 'c': {'three': 3}, 'd': 0})
+        self.assertEqual(await mem.get_many([]), {})
+
+        self.assertEqual(await mem.delete_many(['a', 'b', 'd']), 2)
+        self.assertTrue(await mem.delete('c'))
+        self.assertFalse(await mem.delete('c'))
+        self.assertEqual(await mem.get_many(['a', 'c']), {'a': None, 'c': None})
+
+        await mem.close()
+
+    async def test_atomic(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        self.assertEqual(await asyncio.gather(*(mem.incr('count') for _ in range(20))), list(range(1, 21)))
+        self.assertEqual(await mem.incr('count', -5), 15)
+        self.assertEqual(await mem.get('count'), 15)
+
+        self.assertTrue(await mem.compare_and_set('config', None, {'a': 1, 'b': [False]}))
+        self.assertFalse(await mem.compare_and_set('config', None, {}))
+        self.assertTrue(await mem.compare_and_set('config', {'b': [False], 'a': 1}, False))
+        self.assertTrue(await mem.compare_and_set('config', False, 'done'))
+        self.assertEqual(await mem.get('config'), 'done')
+
+        self.assertIsNone(await mem.getset('last', 1))
+        self.assertEqual(sorted(await asyncio.gather(*(mem.getset('last', n) for n in range(2, 6)))), [1, 2, 3, 4])
+        self.assertEqual(await mem.getset('last', {'n': 6}), 5)
+        self.assertEqual(await mem.namespace('roll').getset('last', 1), None)
+        self.assertEqual(await mem.get('last'), {'n': 6})
+
+        self.assertEqual(await mem.append_to_list('log', 'a'), 1)
+        self.assertEqual(await mem.append_to_list('log', {'b': 2}, 3.5), 3)
+        self.assertEqual(await mem.get('log'), ['a', {'b': 2}, 3.5])
+        await mem.save('empty', [])
+        self.assertEqual(await mem.append_to_list('empty', 1), 1)
+        with self.assertRaises(Exception):
+            await mem.append_to_list('config', 1)
+
+        await mem.close()
+
+    async def test_ttl(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        self.assertTrue(await mem.set_if_absent('lock', 'U1', ttl=0.05))
+        self.assertFalse(await mem.set_if_absent('lock', 'U2'))
+        await mem.save('kept', 1)
+        self.assertTrue(await mem.expire('kept', 0.05))
+        self.assertTrue(await mem.expire('kept', None))
+        self.assertFalse(await mem.expire('missing', 1))
+
+        await mem.save('counter', 1)
+        await mem.expire('counter', 0.05)
+        self.assertEqual(await mem.incr('counter'), 2)  # keeps the TTL
+        await mem.save('swapped', 1)
+        await mem.expire('swapped', 0.05)
+        self.assertEqual(await mem.getset('swapped', 2), 1)  # clears it
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(await mem.get_many(['lock', 'kept', 'counter', 'swapped']),
+                         {'lock': None, 'kept': 1, 'counter': None, 'swapped': 2})
+        self.assertTrue(await mem.set_if_absent('lock', 'U2'))
+        self.assertEqual(await mem.delete_many(['lock', 'counter']), 1)
+
+        await mem.close()
+
+    async def test_namespace_scan(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        uptime = mem.namespace('uptime')
+        await uptime.save('started', 100)
+        self.assertEqual(await mem.get('uptime:started'), 100)
+        self.assertEqual(await uptime.incr('restarts'), 1)
+        self.assertEqual(await uptime.get_many(['started', 'missing']), {'started': 100, 'missing': None})
+        self.assertIsNone(await mem.namespace('other').get('started'))
+
+        await mem.save_many({f'user:{i:03}': i for i in range(25)})
+        await mem.save_many({'user*': 'glob', 'users': 'other', 'user:expired': 0})
+        await mem.expire('user:expired', 0.01)
+        await asyncio.sleep(0.05)
+
+        scanned = [item async for item in mem.scan('user:', page_size=10)]
+        self.assertEqual(sorted(scanned), [(f'user:{i:03}', i) for i in range(25)])
+        self.assertEqual([item async for item in mem.scan('user*')], [('user*', 'glob')])
+        self.assertEqual(sorted([item async for item in uptime.scan()]), [('restarts', 1), ('started', 100)])
+        self.assertEqual([item async for item in mem.scan('nothing')], [])
+
+        await mem.close()
+
+    async def test_scan_pages_past_the_prefix_key(self):
+        mem = self.make_memory()
+        await mem.setup()
+
+        await mem.save_many({'a': 1, 'ab': 2, 'b': 3})
+        scanned = [item async for item in mem.scan('a', page_size=1)]
+        self.assertEqual(sorted(scanned), [('a', 1), ('ab', 2)])
+
+        await mem.close()
+
+
+class TestMemoryRedis(TestMemoryDict):
+
+    def make_memory(self):
+        return memory.MemoryRedis(client=fakeredis.FakeAsyncRedis())
+
+    async def test_pool_from_env(self):
+        with mock.patch.dict(os.environ, {'REDIS_URL': 'redis://localhost:1/2'}):
+            mem = memory.MemoryRedis()
+        pool = mem.r.connection_pool
+        self.assertEqual(pool.max_connections, memory.REDIS_POOL_SIZE)
+        self.assertEqual(pool.connection_kwargs['port'], 1)
+        self.assertEqual(pool.connection_kwargs['db'], 2)
+
+        with self.assertRaises(ConnectionError):
+            await mem.setup()
+        await mem.close()
+
+
+class TestMemoryRedisDecodedResponses(TestMemoryDict):
+    """A client that hands back str rather than bytes."""
+
+    def make_memory(self):
+        return memory.MemoryRedis(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+@unittest.skipUnless(serialization.msgpack, 'needs msgpack')
+class TestMemoryRedisMsgpack(TestMemoryDict):
+    """Tagged values: no lua, and compare_and_set / append_to_list fall back to WATCH transactions."""
+
+    def make_memory(self):
+        return memory.MemoryRedis(client=fakeredis.FakeAsyncRedis(),
+                                  codec=ValueCodec('msgpack', 'zlib', threshold=16))
+
+    async def test_migration(self):
+        client = fakeredis.FakeAsyncRedis()
+        await client.set('old', json.dumps({'legacy': True}))
+        await client.set('log', json.dumps(['a']))
+
+        mem = memory.MemoryRedis(client=client, codec=ValueCodec('msgpack'))
+        self.assertEqual(await mem.get('old'), {'legacy': True})
+        self.assertTrue(await mem.compare_and_set('old', {'legacy': True}, {'legacy': False}))
+        self.assertTrue(serialization.is_tagged(await client.get('old')))
+        self.assertEqual(await mem.append_to_list('log', 'b'), 2)
+        self.assertEqual(await memory.MemoryRedis(client=client).get_many(['old', 'log']),
+                         {'old': {'legacy': False}, 'log': ['a', 'b']})
+
+
+class TestMemorySqlite(TestMemoryDict):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'betabot.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_memory(self):
+        return memory.MemorySqlite(path=self.path)
+
+    async def test_durable_group_commit(self):
+        mem = self.make_memory()
+        await mem.setup()
+        await asyncio.gather(*(mem.save(f'key{n}', n) for n in range(200)))
+        self.assertLess(mem.stats()['commits'], 200)
+        await mem.close()
+
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+
+        reopened = self.make_memory()
+        await reopened.setup()
+        self.assertEqual(await reopened.get('key199'), 199)
+        self.assertEqual(len(await reopened.get_many(f'key{n}' for n in range(1000))), 1000)  # > one IN (...)
+        await reopened.close()
+
+
+@unittest.skipUnless(serialization.lz4, 'needs lz4')
+class TestMemorySqlitePickle(TestMemorySqlite):
+
+    def make_memory(self):
+        return memory.MemorySqlite(path=self.path, codec=ValueCodec('pickle', 'lz4', threshold=16))
+
+
+class TestMemoryDictDurable(TestMemoryDict):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_memory(self):
+        return memory.MemoryDict(path=self.path)
+
+    async def test_restart_from_log_and_snapshot(self):
+        mem = self.make_memory()
+        await mem.setup()
+        await mem.save_many({'a': 1, 'b': {'two': 2}, 'gone': 0})
+        await mem.append_to_list('list', 1)
+        await mem.snapshot()
+        await mem.append_to_list('list', 2, 3)
+        await mem.incr('a', 10)
+        await mem.delete('gone')
+        await mem.set_if_absent('lock', 'U1', ttl=60)
+        await mem.set_if_absent('short', 'U1', ttl=0.01)
+        # a crash: the log is never compacted, and its last write is torn
+        mem.journal.write([['s', 'torn', 1, None]]).result()
+        mem.journal._log.truncate(mem.journal._log.tell() - 3)
+        mem.journal.close()
+        await asyncio.sleep(0.05)
+
+        reopened = self.make_memory()
+        await reopened.setup()
+        self.assertEqual(dict(reopened.values), {'a': 11, 'b': {'two': 2}, 'list': [1, 2, 3], 'lock': 'U1'})
+        self.assertGreater(reopened.expires['lock'], time.monotonic() + 50)
+        await reopened.save('c', 3)
+        await reopened.close()
+
+        self.assertEqual(sorted(os.listdir(self.path)), ['log.4', 'snapshot'])  # compacted on close
+        final = self.make_memory()
+        await final.setup()
+        self.assertEqual(await final.get_many(['a', 'c', 'torn']), {'a': 11, 'c': 3, 'torn': None})
+        await final.close()
+
+    async def test_disk_io_off_the_loop(self):
+        mem = memory.MemoryDict(path=self.path)
+        mem.journal.fsync = True
+        await mem.setup()
+        threads = []
+        fsync = os.fsync
+
+        def recording_fsync(fd):
+            threads.append(threading.current_thread())
+            fsync(fd)
+
+        with mock.patch('os.fsync', recording_fsync):
+            await asyncio.gather(*(mem.incr('count') for _ in range(20)))
+            self.assertEqual(await mem.get('count'), 20)
+            await mem.snapshot()
+            with self.assertRaises(CodecError):
+                await mem.save('bad', object())
+            self.assertIsNone(await mem.get('bad'))  # not applied
+            await mem.close()
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
+
+
+class TestMemoryCached(TestMemoryDict):
+
+    def make_memory(self):
+        return memory.MemoryCached(memory.MemoryDict())
+
+    async def test_lru_ttl_stats(self):
+        backend = memory.MemoryDict()
+        mem = memory.MemoryCached(backend, max_keys=2, ttl=0)
+        await mem.save_many({'a': 1, 'b': 2})
+
+        backend.values['a'] = 'changed behind the cache'
+        self.assertEqual(await mem.get('a'), 1)
+        self.assertIsNone(await mem.get('missing'))  # evicts b, the least recently used
+        self.assertEqual(await mem.get_many(['a', 'b']), {'a': 1, 'b': 2})
+
+        stats = mem.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['keys']), (2, 2, 2, 2))
+
+        mem.ttl = 0.01
+        await mem.save('a', 1)
+        backend.values['a'] = 'changed behind the cache'
+        await asyncio.sleep(0.02)
+        self.assertEqual(await mem.get('a'), 'changed behind the cache')
+        self.assertEqual(mem.stats()['expirations'], 1)
+
+    async def test_read_racing_a_write(self):
+        backend = memory.MemoryDict()
+        mem = memory.MemoryCached(backend)
+        await mem.save('config', 'old')
+        mem._cache.clear()
+
+        fetched = asyncio.Event()
+        release = asyncio.Event()
+        get = backend._get
+
+        async def slow_get(key, default):
+            value = await get(key, default)  # reads 'old'...
+            fetched.set()
+            await release.wait()
+            return value
+
+        with mock.patch.object(backend, '_get', slow_get):
+            read = asyncio.ensure_future(mem.get('config'))
+            await fetched.wait()
+            await mem.save('config', 'new')  # ...and this lands before the read returns it
+            release.set()
+            self.assertEqual(await read, 'old')
+
+        self.assertEqual(await mem.get('config'), 'new')
+        self.assertEqual((mem._fetching, mem._generations), ({}, {}))
+
+    async def test_pubsub_invalidation(self):
+        server = fakeredis.FakeServer()
+        replicas = [memory.MemoryCached(memory.MemoryRedis(client=fakeredis.FakeAsyncRedis(server=server)),
+                                        invalidation='pubsub') for _ in range(2)]
+        for mem in replicas:
+            await mem.setup()
+        await asyncio.sleep(0.05)  # subscribed
+
+        await replicas[0].save('config', {'on': True})
+        await asyncio.sleep(0.05)  # or its invalidation can arrive mid-read, and the read won't be cached
+        self.assertEqual(await replicas[1].get('config'), {'on': True})
+
+        await replicas[0].save('config', {'on': False})
+        await asyncio.sleep(0.05)
+        self.assertEqual(await replicas[1].get('config'), {'on': False})
+        self.assertEqual(replicas[1].stats()['invalidations'], 1)
+
+        for mem in replicas:
+            await mem.close()
+
+
+class TestMemoryBuffered(TestMemoryDict):
+
+    def make_memory(self):
+        return memory.MemoryBuffered(memory.MemoryDict())
+
+    async def test_write_behind(self):
+        backend = memory.MemoryDict()
+        mem = memory.MemoryBuffered(backend, interval=60, max_keys=3)
+        await mem.setup()
+
+        for n in range(5):
+            await mem.save('count', n)
+        await mem.save('seen', 'U1')
+        self.assertEqual(backend.values, {})
+        self.assertEqual(await mem.get_many(['count', 'seen']), {'count': 4, 'seen': 'U1'})
+
+        await mem.save('third', 3)  # max_keys wakes the flusher
+        await asyncio.sleep(0.01)
+        self.assertEqual(backend.values, {'count': 4, 'seen': 'U1', 'third': 3})
+        self.assertEqual(mem.stats()['coalesced'], 4)
+        self.assertEqual(mem.stats()['flushes'], 1)
+
+        await mem.save('count', 5)
+        await mem.close()
+        self.assertEqual(backend.values['count'], 5)
+
+    async def test_failed_flush_is_retried(self):
+        backend = memory.MemoryDict()
+        mem = memory.MemoryBuffered(backend, interval=60)
+        await mem.save('a', 1)
+
+        saved = backend._save_many
+
+        async def fail(values):
+            backend._save_many = saved
+            await mem.save('a', 2)  # saved while the failing batch was in flight: newer, so it wins
+            raise ConnectionError('down')
+
+        backend._save_many = fail
+        await mem.flush()
+        self.assertEqual((mem.stats()['failures'], await mem.get('a')), (1, 2))
+
+        await mem.flush()
+        self.assertEqual(backend.values, {'a': 2})
+
+
+class TestGetMemory(unittest.TestCase):
+
+    def test_types(self):
+        self.assertIsInstance(memory.get_memory('dict'), memory.MemoryDict)
+        cached = memory.get_memory('cached+dict')
+        self.assertIsInstance(cached, memory.MemoryCached)
+        self.assertIsInstance(cached.backend, memory.MemoryDict)
+
+        stacked = memory.get_memory('cached+buffered+dict')
+        self.assertIsInstance(stacked.backend, memory.MemoryBuffered)
+        self.assertIsInstance(stacked.backend.backend, memory.MemoryDict)
+
+        for bad in ('nope', 'cached+nope', 'nope+dict'):
+            with self.assertRaises(ValueError):
+                memory.get_memory(bad)
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from unittest import mock
+
+import aiounittest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from betabot.outbound import OutboundScheduler, ScheduledWebClient, TokenBucket
+
+
+class TestOutboundScheduler(aiounittest.AsyncTestCase):
+
+    async def test_round_robin_across_channels(self):
+        scheduler = OutboundScheduler(channel_rate=50, channel_burst=1)
+        sent = []
+
+        async def post(channel, n):
+            await scheduler.acquire('chat.postMessage', channel)
+            sent.append(f'{channel}{n}')
+
+        await asyncio.gather(*(post('C1', n) for n in range(3)), post('C2', 0), post('C3', 0))
+        self.assertEqual(sent, ['C10', 'C20', 'C30', 'C11', 'C12'])
+
+        stats = scheduler.stats()
+        self.assertEqual((stats['sent'], stats['queued']), (5, 0))
+        self.assertGreater(stats['wait_max'], 0.03)  # C1's third message waited two refills
+        await scheduler.close()
+
+    async def test_method_tiers_and_retry_after(self):
+        scheduler = OutboundScheduler(tier_rates={2: 60, 3: 6000})  # tier 2: one a second, a burst of 60
+        bucket = TokenBucket(rate=1, capacity=2)
+        now = time.monotonic()
+        bucket.take(now)
+        bucket.take(now)
+        self.assertAlmostEqual(bucket.delay(now), 1, places=2)
+
+        scheduler.throttle('users.list', None, 0.1)
+        started = time.monotonic()
+        users_list = asyncio.ensure_future(scheduler.acquire('users.list'))
+        await scheduler.acquire('conversations.info', 'C1')  # another method isn't held
+        self.assertFalse(users_list.done())
+        await users_list
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(scheduler.stats()['rate_limited'], 1)
+        await scheduler.close()
+
+
+class TestScheduledWebClient(aiounittest.AsyncTestCase):
+
+    async def test_retries_after_429(self):
+        scheduler = OutboundScheduler()
+        client = ScheduledWebClient(token='xoxb-test', scheduler=scheduler)
+        limited = mock.Mock(status_code=429, headers={'Retry-After': '0.05'})
+        calls = []
+
+        async def api_call(self, api_method, **kwargs):
+            calls.append((api_method, kwargs['json']['channel']))
+            if len(calls) == 1:
+                raise SlackApiError('ratelimited', limited)
+            return {'ok': True}
+
+        with mock.patch.object(AsyncWebClient, 'api_call', api_call):
+            self.assertEqual(await client.chat_postMessage(channel='C1', text='hi'), {'ok': True})
+
+        self.assertEqual(calls, [('chat.postMessage', 'C1')] * 2)
+        self.assertEqual(scheduler.stats()['rate_limited'], 1)
+        await scheduler.close()
@@ -0,0 +1,51 @@
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from betabot.recording import EventRecorder, percentile, read_recording
+
+
+class TestRecording(unittest.TestCase):
+
+    def test_rotating_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = EventRecorder(directory, bot_identity={'user': 'betabot', 'user_id': 'U123'},
+                                     max_bytes=100, max_files=2)
+            for i in range(5):
+                recorder.write({'type': 'event_callback', 'event': {'type': 'message', 'text': f'hi {i}'}})
+            recorder.close()
+
+            lines = list(read_recording([directory]))
+
+        # 5 lines of ~100 bytes rotate into 5 files, of which the newest 2 are kept
+        self.assertEqual(lines[0], {'bot': {'user': 'betabot', 'user_id': 'U123'}})
+        self.assertEqual([line['body']['event']['text'] for line in lines if 'body' in line], ['hi 3', 'hi 4'])
+
+    def test_writes_off_the_calling_thread(self):
+        threads = []
+        rotate = EventRecorder._rotate
+
+        def recording_rotate(recorder):
+            threads.append(threading.current_thread())
+            rotate(recorder)
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(EventRecorder, '_rotate', recording_rotate):
+            recorder = EventRecorder(directory, bot_identity={})
+            body = {'type': 'event_callback', 'event': {'type': 'app_mention'}}
+            recorder.write(body)
+            body['event']['type'] = 'message'  # changed after it was recorded
+            recorder.close()
+            recorder.close()
+
+            lines = list(read_recording([directory]))
+
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertEqual(lines[1]['body']['event']['type'], 'app_mention')
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 51.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 99), 0.0)
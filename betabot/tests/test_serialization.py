@@ -0,0 +1,54 @@
+import json
+import unittest
+
+from betabot import serialization
+from betabot.serialization import CodecError, ValueCodec
+
+VALUE = {'channels': ['C1', 'C2'] * 100, 'count': 3, 'ok': True, 'none': None}
+
+
+class TestValueCodec(unittest.TestCase):
+
+    def test_json_stays_untagged(self):
+        codec = ValueCodec()
+        self.assertEqual(codec.encode(VALUE), json.dumps(VALUE).encode())
+        self.assertEqual(codec.decode(json.dumps(VALUE)), VALUE)  # legacy values, as str or bytes
+        self.assertEqual(codec.decode(None, 'default'), 'default')
+        self.assertEqual(codec.encode(42), b'42')
+        self.assertEqual(codec.encode(True), b'true')
+
+    @unittest.skipUnless(serialization.msgpack and serialization.lz4, 'needs msgpack and lz4')
+    def test_round_trips(self):
+        for name in serialization.CODECS:
+            for compression in serialization.COMPRESSIONS:
+                codec = ValueCodec(name, compression, threshold=64)
+                for value in (VALUE, 'short', [1.5, None], 7):
+                    self.assertEqual(codec.decode(codec.encode(value)), value, (name, compression, value))
+
+        compressed = ValueCodec('msgpack', 'zlib', threshold=64).encode(VALUE)
+        self.assertEqual(compressed[:4], bytes((serialization.TAG, serialization.VERSION, 2, 1)))
+        self.assertLess(len(compressed), len(json.dumps(VALUE)) / 10)
+        self.assertEqual(ValueCodec('msgpack', 'zlib', threshold=64).encode('short')[3], 0)
+
+    def test_reads_every_format(self):
+        reader = ValueCodec(allow_pickle=True)
+        self.assertEqual(reader.decode(ValueCodec('pickle', 'zlib', threshold=0).encode({1, 2})), {1, 2})
+        self.assertEqual(reader.decode(ValueCodec('json', 'zlib', threshold=0).encode(VALUE)), VALUE)
+
+    def test_refuses_pickle_unless_enabled(self):
+        pickled = ValueCodec('pickle').encode({1, 2})
+        for reader in (ValueCodec(), ValueCodec('msgpack') if serialization.msgpack else ValueCodec('json', 'zlib')):
+            with self.assertRaisesRegex(CodecError, 'refusing to unpickle'):
+                reader.decode(pickled)
+        self.assertEqual(ValueCodec('pickle').decode(pickled), {1, 2})
+
+    def test_errors(self):
+        codec = ValueCodec()
+        with self.assertRaises(CodecError):
+            codec.decode(b'not json')
+        with self.assertRaises(CodecError):
+            codec.decode(bytes((serialization.TAG, 99, 1, 0)) + b'{}')
+        with self.assertRaises(CodecError):
+            codec.encode(object())
+        with self.assertRaises(CodecError):
+            ValueCodec('xml')
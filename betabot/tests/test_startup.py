@@ -0,0 +1,68 @@
+import asyncio
+
+import aiounittest
+
+from betabot.startup import StartupGraph
+
+
+class TestStartupGraph(aiounittest.AsyncTestCase):
+
+    async def test_runs_independent_steps_concurrently(self):
+        order = []
+
+        def step(name, delay=0.0):
+            async def run():
+                order.append(f'{name} start')
+                await asyncio.sleep(delay)
+                order.append(f'{name} end')
+            return run
+
+        graph = StartupGraph()
+        graph.add('scripts', step('scripts'), after=['engine'])
+        graph.add('env', step('env'))
+        graph.add('engine', step('engine', 0.01), after=['env'])
+        graph.add('memory', step('memory', 0.05), after=['env'])
+        timings = await graph.run()
+
+        self.assertEqual(order[:2], ['env start', 'env end'])
+        self.assertLess(order.index('scripts end'), order.index('memory end'))  # didn't wait for memory
+        self.assertEqual(set(timings), {'env', 'engine', 'memory', 'scripts'})
+        self.assertGreaterEqual(timings['memory'].duration, 0.05)
+        self.assertGreaterEqual(timings['scripts'].start, timings['engine'].start + timings['engine'].duration)
+
+    async def test_failure_cancels_the_rest(self):
+        cancelled = asyncio.Event()
+
+        async def fail():
+            raise ValueError('bad memory type')
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        graph = StartupGraph()
+        graph.add('memory', fail)
+        graph.add('directory', slow)
+        graph.add('scripts', slow, after=['memory'])
+        with self.assertRaisesRegex(ValueError, 'bad memory type'):
+            await graph.run()
+        self.assertTrue(cancelled.is_set())
+        self.assertNotIn('scripts', graph.timings)
+
+    async def test_bad_dependencies(self):
+        async def noop():
+            pass
+
+        graph = StartupGraph()
+        graph.add('a', noop, after=['b'])
+        graph.add('b', noop, after=['a'])
+        with self.assertRaisesRegex(ValueError, 'a -> b -> a'):
+            await graph.run()
+
+        graph = StartupGraph()
+        graph.add('a', noop, after=['missing'])
+        with self.assertRaisesRegex(ValueError, 'unknown step `missing`'):
+            await graph.run()
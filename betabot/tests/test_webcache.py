@@ -0,0 +1,95 @@
+import asyncio
+from unittest import mock
+
+import aiounittest
+from slack_sdk.web.async_client import AsyncWebClient
+
+from betabot.webcache import CachedWebClient, WebCache
+
+
+class TestWebCache(aiounittest.AsyncTestCase):
+
+    async def test_ttl_lru_and_hit_rate(self):
+        cache = WebCache(size=2, ttls={'users.info': 10, 'team.info': 0.02})
+        calls = []
+
+        def fetch(method, **params):
+            async def call():
+                calls.append((method, params))
+                return {'ok': True, **params}
+            return lambda: cache.call(method, {'params': params}, call)
+
+        self.assertEqual(await fetch('users.info', user='U1')(), {'ok': True, 'user': 'U1'})
+        await fetch('users.info', user='U1')()
+        await fetch('team.info')()
+        await asyncio.sleep(0.03)
+        await fetch('team.info')()  # expired
+        await fetch('users.info', user='U2')()  # evicts U1, the least recently used
+        await fetch('users.info', user='U1')()
+        self.assertEqual(len(calls), 5)
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evicted'], stats['size']), (1, 5, 2, 2))
+        self.assertEqual(stats['methods']['users.info'], {'hits': 1, 'misses': 3, 'hit_rate': 0.25})
+        self.assertAlmostEqual(stats['hit_rate'], 1 / 6)
+
+    async def test_single_flight(self):
+        cache = WebCache()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            started.set()
+            await release.wait()
+            return {'ok': True}
+
+        first = asyncio.ensure_future(cache.call('conversations.info', {'params': {'channel': 'C1'}}, call))
+        await started.wait()
+        others = [asyncio.ensure_future(cache.call('conversations.info', {'params': {'channel': 'C1'}}, call))
+                  for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()  # the first caller giving up doesn't cancel the call for the others
+        release.set()
+
+        self.assertEqual(await asyncio.gather(*others), [{'ok': True}] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['coalesced'], 3)
+
+    async def test_writes_bypass_and_invalidate(self):
+        cache = WebCache()
+        info = {'ok': True, 'channel': {'name': 'fun'}}
+
+        async def read():
+            return info
+
+        async def write():
+            return {'ok': True}
+
+        await cache.call('conversations.info', {'params': {'channel': 'C1'}}, read)
+        await cache.call('conversations.rename', {'json': {'channel': 'C1', 'name': 'funner'}}, write)
+        info = {'ok': True, 'channel': {'name': 'funner'}}
+        self.assertEqual(await cache.call('conversations.info', {'params': {'channel': 'C1'}}, read), info)
+
+        stats = cache.stats()
+        self.assertEqual((stats['bypassed'], stats['invalidated'], stats['hits']), (1, 1, 0))
+
+
+class TestCachedWebClient(aiounittest.AsyncTestCase):
+
+    async def test_reads_are_cached(self):
+        client = CachedWebClient(token='xoxb-test', cache=WebCache())
+        calls = []
+
+        async def api_call(self, api_method, **kwargs):
+            calls.append(api_method)
+            return {'ok': True}
+
+        with mock.patch.object(AsyncWebClient, 'api_call', api_call):
+            await client.users_info(user='U1')
+            await client.users_info(user='U1')
+            await client.chat_postMessage(channel='C1', text='hi')
+            await client.chat_postMessage(channel='C1', text='hi')
+
+        self.assertEqual(calls, ['users.info', 'chat.postMessage', 'chat.postMessage'])
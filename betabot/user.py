@@ -1,12 +1,39 @@
 class User(object):
-    """Wrapper for a User with helpful functions."""
+    """A workspace member: just the fields betabot uses, in a compact record."""
 
-    id = ''
+    __slots__ = ('id', 'name', 'real_name', 'display_name', 'email', 'tz', 'is_bot', 'deleted')
 
-    def __init__(self, payload):
-        assert type(payload) == dict
-        self.__dict__ = payload
-        self.__dict__.update(payload['profile'])
+    def __init__(self, id, name='', real_name='', display_name='', email='', tz='', is_bot=False, deleted=False):
+        self.id = id
+        self.name = name
+        self.real_name = real_name
+        self.display_name = display_name
+        self.email = email
+        self.tz = tz
+        self.is_bot = is_bot
+        self.deleted = deleted
 
-    def __unicode__(self):
+    @classmethod
+    def from_payload(cls, payload: dict) -> 'User':
+        """From a Slack user object, as in `users.list`, `users.info` or a `user_change` event."""
+        profile = payload.get('profile') or {}
+        return cls(id=payload['id'],
+                   name=payload.get('name') or '',
+                   real_name=payload.get('real_name') or profile.get('real_name') or '',
+                   display_name=profile.get('display_name') or '',
+                   email=profile.get('email') or '',
+                   tz=payload.get('tz') or '',
+                   is_bot=bool(payload.get('is_bot')),
+                   deleted=bool(payload.get('deleted')))
+
+    def __eq__(self, other):
+        return isinstance(other, User) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'User(id={self.id!r}, name={self.name!r})'
+
+    def __str__(self):
         return self.id
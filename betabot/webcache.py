@@ -0,0 +1,174 @@
+"""
+Caching of Slack Web API reads
+
+Reads that scripts repeat with the same arguments (`conversations.info`, `users.info`, `team.info`...) are
+answered from memory while younger than their method's TTL; the least recently used answers are dropped past
+WEB_CACHE_SIZE. Identical reads made while one is already on its way to Slack wait for that one instead of
+making their own (single-flight). Every other method, writes included, goes straight through, and writes
+(or events) that change what a read would return drop that method's cached answers.
+"""
+import asyncio
+from collections import OrderedDict
+import functools
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+# cached answers kept at most (0 turns the cache off)
+WEB_CACHE_SIZE = int(os.getenv('WEB_CACHE_SIZE', 1000))
+
+# seconds an answer stays fresh, per method; methods not listed aren't cached
+READ_TTLS = {
+    'auth.test': 3600,
+    'bots.info': 3600,
+    'conversations.info': 60,
+    'conversations.members': 60,
+    'emoji.list': 3600,
+    'team.info': 3600,
+    'usergroups.list': 300,
+    'users.info': 300,
+    'users.lookupByEmail': 300,
+    'users.profile.get': 300,
+}
+_CONVERSATION_READS = ('conversations.info', 'conversations.members')
+_USER_READS = ('users.info', 'users.lookupByEmail', 'users.profile.get')
+# writes, and events, after which a method's cached answers may be wrong
+WRITE_INVALIDATES = {
+    'conversations.archive': _CONVERSATION_READS,
+    'conversations.invite': _CONVERSATION_READS,
+    'conversations.join': _CONVERSATION_READS,
+    'conversations.kick': _CONVERSATION_READS,
+    'conversations.leave': _CONVERSATION_READS,
+    'conversations.rename': _CONVERSATION_READS,
+    'conversations.setPurpose': _CONVERSATION_READS,
+    'conversations.setTopic': _CONVERSATION_READS,
+    'conversations.unarchive': _CONVERSATION_READS,
+    'usergroups.create': ('usergroups.list',),
+    'usergroups.update': ('usergroups.list',),
+    'users.profile.set': _USER_READS,
+}
+EVENT_INVALIDATES = {
+    'channel_archive': _CONVERSATION_READS,
+    'channel_deleted': _CONVERSATION_READS,
+    'channel_rename': _CONVERSATION_READS,
+    'channel_unarchive': _CONVERSATION_READS,
+    'emoji_changed': ('emoji.list',),
+    'member_joined_channel': _CONVERSATION_READS,
+    'member_left_channel': _CONVERSATION_READS,
+    'subteam_created': ('usergroups.list',),
+    'subteam_updated': ('usergroups.list',),
+    'team_join': _USER_READS,
+    'team_rename': ('team.info',),
+    'user_change': _USER_READS,
+}
+
+_Key = Tuple[str, str]  # (method, its arguments as json)
+
+
+class _Entry(NamedTuple):
+    expires: float  # monotonic
+    response: Any
+
+
+def _key(api_method: str, kwargs: Dict[str, Any]) -> _Key:
+    args = {name: kwargs.get(name) for name in ('params', 'json', 'data')}
+    return api_method, json.dumps(args, sort_keys=True, default=str)
+
+
+class WebCache(object):
+    """TTL'd, LRU-bounded answers to Web API reads, fetched once however many callers ask at the same time."""
+
+    def __init__(self, size=WEB_CACHE_SIZE, ttls: Optional[Dict[str, float]] = None):
+        self.size = size
+        self.ttls = READ_TTLS if ttls is None else ttls
+
+        self._entries: 'OrderedDict[_Key, _Entry]' = OrderedDict()  # least recently used first
+        self._in_flight: Dict[_Key, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}  # per method, bumped when its answers are invalidated
+
+        self.counters = {'hits': 0, 'coalesced': 0, 'misses': 0, 'bypassed': 0, 'evicted': 0, 'invalidated': 0}
+        self._methods: Dict[str, Dict[str, int]] = {}  # per cached method: hits (coalesced included) and misses
+
+    def stats(self) -> Dict[str, Any]:
+        hit_rate = lambda hits, misses: hits / (hits + misses) if hits + misses else 0.0  # noqa: E731
+        return {
+            **self.counters,
+            'size': len(self._entries),
+            'in_flight': len(self._in_flight),
+            'hit_rate': hit_rate(self.counters['hits'] + self.counters['coalesced'], self.counters['misses']),
+            'methods': {method: {**counts, 'hit_rate': hit_rate(counts['hits'], counts['misses'])}
+                        for method, counts in sorted(self._methods.items())},
+        }
+
+    async def call(self, api_method: str, kwargs: Dict[str, Any], fetch: Callable[[], Awaitable]):
+        """The answer to `api_method(**kwargs)`: cached, already on its way, or from `fetch()`."""
+        ttl = self.ttls.get(api_method)
+        if not ttl or self.size <= 0 or kwargs.get('files'):
+            self.counters['bypassed'] += 1
+            response = await fetch()
+            self.invalidate(*WRITE_INVALIDATES.get(api_method, ()))
+            return response
+
+        key = _key(api_method, kwargs)
+        counts = self._methods.setdefault(api_method, {'hits': 0, 'misses': 0})
+        entry = self._entries.get(key)
+        if entry and entry.expires > time.monotonic():
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            counts['hits'] += 1
+            return entry.response
+
+        future = self._in_flight.get(key)
+        if future:
+            self.counters['coalesced'] += 1
+            counts['hits'] += 1
+        else:
+            self.counters['misses'] += 1
+            counts['misses'] += 1
+            future = asyncio.ensure_future(self._fetch(key, ttl, fetch))
+            self._in_flight[key] = future
+        # shielded: a caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: _Key, ttl: float, fetch: Callable[[], Awaitable]):
+        method = key[0]
+        generation = self._generations.get(method, 0)
+        try:
+            response = await fetch()
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+        if self._generations.get(method, 0) == generation:  # not invalidated while on its way
+            self._entries.pop(key, None)
+            self._entries[key] = _Entry(time.monotonic() + ttl, response)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.counters['evicted'] += 1
+        return response
+
+    def invalidate(self, *methods: str):
+        """Drop the cached answers of `methods`; calls already on their way won't be cached either."""
+        if not methods:
+            return
+        for method in methods:
+            self._generations[method] = self._generations.get(method, 0) + 1
+        for key in [key for key in self._entries if key[0] in methods]:
+            del self._entries[key]
+            self.counters['invalidated'] += 1
+        for key in [key for key in self._in_flight if key[0] in methods]:
+            del self._in_flight[key]  # later callers make a fresh call
+
+
+class CachedWebClient(AsyncWebClient):
+    """An AsyncWebClient whose reads are answered through `cache`."""
+
+    def __init__(self, *args, cache: WebCache, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+
+    async def api_call(self, api_method: str, **kwargs):
+        return await self.cache.call(api_method, kwargs, functools.partial(super().api_call, api_method, **kwargs))
@@ -18,7 +18,8 @@ setup(
     install_requires=open('%s/requirements.txt' % DIR).readlines(),
     entry_points={
         'console_scripts': [
-            'betabot = betabot.app:start_ioloop'
+            'betabot = betabot.app:start_ioloop',
+            'betabot-replay = betabot.recording:start_replay',
         ],
     },
     classifiers=[